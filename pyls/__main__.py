@@ -2,6 +2,8 @@
 import argparse
 import logging
 import logging.config
+import os
+import socket
 import sys
 
 try:
@@ -9,8 +11,9 @@ try:
 except Exception:  # pylint: disable=broad-except
     import json
 
+from . import _daemon
 from .python_ls import (PythonLanguageServer, start_io_lang_server,
-                        start_tcp_lang_server)
+                        start_tcp_lang_server, start_unix_lang_server)
 
 LOG_FORMAT = "%(asctime)s UTC - %(levelname)s - %(name)s - %(message)s"
 
@@ -30,6 +33,23 @@ def add_arguments(parser):
         "--port", type=int, default=2087,
         help="Bind to this port"
     )
+    parser.add_argument(
+        "--socket", metavar="PATH",
+        help="Use a Unix domain socket server at PATH instead of stdio"
+    )
+    parser.add_argument(
+        "--daemon", action="store_true",
+        help="Connect stdio to the server on --socket, or on a socket of the current user by default, "
+        "starting the server in the background if it isn't running"
+    )
+    parser.add_argument(
+        "--multi-client", action="store_true",
+        help="With --tcp or --socket, serve clients concurrently, sharing loaded plugins and caches between them"
+    )
+    parser.add_argument(
+        "--idle-timeout", type=float, metavar="SECONDS",
+        help="With --multi-client, shut down after SECONDS without any clients"
+    )
     parser.add_argument(
         '--check-parent-process', action="store_true",
         help="Check whether parent process is still alive using os.kill(ppid, 0) "
@@ -60,15 +80,37 @@ def main():
     args = parser.parse_args()
     _configure_logger(args.verbose, args.log_config, args.log_file)
 
-    if args.tcp:
-        start_tcp_lang_server(args.host, args.port, args.check_parent_process,
-                              PythonLanguageServer)
+    if (args.socket or args.daemon) and not hasattr(socket, 'AF_UNIX'):
+        parser.error('Unix domain sockets are not supported on this platform')
+    if args.tcp and (args.socket or args.daemon):
+        parser.error('--tcp cannot be used with --socket or --daemon')
+
+    if args.daemon:
+        stdin, stdout = _binary_stdio()
+        _daemon.attach(args.socket or _daemon.default_socket_path(), stdin, stdout,
+                       server_args=_server_args(args))
+    elif args.tcp:
+        start_tcp_lang_server(args.host, args.port, args.check_parent_process, PythonLanguageServer,
+                              multi_client=args.multi_client, idle_timeout=args.idle_timeout)
+    elif args.socket:
+        start_unix_lang_server(args.socket, args.check_parent_process, PythonLanguageServer,
+                               multi_client=args.multi_client, idle_timeout=args.idle_timeout)
     else:
         stdin, stdout = _binary_stdio()
         start_io_lang_server(stdin, stdout, args.check_parent_process,
                              PythonLanguageServer)
 
 
+def _server_args(args):
+    """The logging arguments to pass on to a server started in the background."""
+    server_args = ['-v'] * args.verbose
+    if args.log_config:
+        server_args.extend(['--log-config', os.path.abspath(args.log_config)])
+    elif args.log_file:
+        server_args.extend(['--log-file', os.path.abspath(args.log_file)])
+    return server_args
+
+
 def _binary_stdio():
     """Construct binary stdio streams (not text mode).
 
@@ -86,7 +128,6 @@ def _binary_stdio():
         if sys.platform == "win32":
             # set sys.stdin to binary mode
             # pylint: disable=no-member,import-error
-            import os
             import msvcrt
             msvcrt.setmode(sys.stdin.fileno(), os.O_BINARY)
             msvcrt.setmode(sys.stdout.fileno(), os.O_BINARY)
@@ -0,0 +1,160 @@
+# Copyright 2017 Palantir Technologies, Inc.
+"""Attach an editor's stdio to a long-lived language server listening on a Unix domain socket.
+
+Starting a language server means importing jedi and every plugin, which takes seconds. In daemon
+mode the editor instead runs a shim that connects its stdin and stdout to a server that's already
+running, starting one in the background if there is none, so new sessions attach to a warm process.
+A server started that way exits once it has had no clients for a while.
+"""
+import contextlib
+import hashlib
+import io
+import logging
+import os
+import socket
+import stat
+import struct
+import sys
+import tempfile
+import threading
+import time
+from subprocess import Popen
+
+log = logging.getLogger(__name__)
+
+START_TIMEOUT_S = 30
+IDLE_TIMEOUT_S = 15 * 60  # how long a server started in the background outlives its last client
+POLL_INTERVAL_S = 0.1  # how often to try connecting to a server that's starting
+BUFFER_SIZE = 64 * 1024
+
+
+def default_socket_path():
+    """The socket of the current user's server for the running python, in a directory only they can use."""
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir()
+    socket_dir = _private_dir(os.path.join(runtime_dir, 'pyls-{}'.format(os.getuid())))
+    # A server can only see the packages of the python it runs on
+    interpreter = hashlib.sha1(sys.executable.encode('utf-8')).hexdigest()[:12]
+    return os.path.join(socket_dir, 'pyls-{}.sock'.format(interpreter))
+
+
+def _private_dir(path):
+    """Create the directory at path for the current user alone, or check that it already is theirs alone.
+
+    The temporary directory is shared with other users, who could otherwise plant a socket or
+    symlink where a server is expected and have the editor send it every document.
+    """
+    try:
+        os.mkdir(path, 0o700)
+    except OSError:
+        if not os.path.isdir(path):
+            raise
+    st = os.lstat(path)
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or st.st_mode & 0o077:
+        raise IOError('{} must be a directory that only its owner, the current user, can access'.format(path))
+    return path
+
+
+def connect(socket_path):
+    """Return a socket connected to the server at socket_path, or None if nothing is listening there.
+
+    Raises IOError if the server is run by another user, which the editor's documents mustn't be sent to.
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+        uid = _peer_uid(sock, socket_path)
+    except (IOError, OSError):
+        sock.close()
+        return None
+    if uid != os.getuid():
+        sock.close()
+        raise IOError('The language server on {} is run by another user ({})'.format(socket_path, uid))
+    return sock
+
+
+def _peer_uid(sock, socket_path):
+    """The user running the process at the other end of sock."""
+    if hasattr(socket, 'SO_PEERCRED'):
+        creds = struct.Struct('3i')
+        _pid, uid, _gid = creds.unpack(sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, creds.size))
+        return uid
+    # Where the credentials of the peer aren't available, its socket is created by the user running it
+    return os.stat(socket_path).st_uid
+
+
+@contextlib.contextmanager
+def socket_lock(socket_path):
+    """Hold a lock on socket_path, so that servers take turns to check for, bind and remove the socket."""
+    import fcntl
+
+    # The lock file is left behind, as removing it would let two servers hold different locks
+    # O_NOFOLLOW keeps it from being redirected to another file by a symlink planted in its place
+    fd = os.open(socket_path + '.lock', os.O_RDWR | os.O_CREAT | getattr(os, 'O_NOFOLLOW', 0), 0o600)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)
+
+
+def start_server(socket_path, args=()):
+    """Start a multi client server on socket_path in the background, outliving the current process.
+
+    Args:
+        socket_path (str): Where the server listens.
+        args (list): More command line arguments of the server, such as logging options.
+    """
+    cmd = [sys.executable, '-m', 'pyls', '--socket', socket_path, '--multi-client',
+           '--idle-timeout', str(IDLE_TIMEOUT_S)]
+    cmd.extend(args)
+    log.info('Starting %s', cmd)
+    # A session of its own keeps the server clear of signals sent to the editor's process group
+    if sys.version_info[0] >= 3:
+        session = {'start_new_session': True}
+    else:
+        session = {'preexec_fn': os.setsid}
+    with io.open(os.devnull, 'r+b') as devnull:
+        Popen(cmd, stdin=devnull, stdout=devnull, stderr=devnull, close_fds=True, **session)
+
+
+def attach(socket_path, rfile, wfile, server_args=(), timeout=START_TIMEOUT_S):
+    """Relay rfile to the server at socket_path and its responses to wfile, until the server hangs up.
+
+    The server is started with server_args if it isn't running. At the end of rfile, the server is told
+    that no more requests are coming and the responses it has left are still relayed.
+    """
+    sock = connect(socket_path)
+    if sock is None:
+        start_server(socket_path, server_args)
+        deadline = time.time() + timeout
+        while sock is None:
+            if time.time() > deadline:
+                raise IOError('Timed out waiting for a language server on {}'.format(socket_path))
+            time.sleep(POLL_INTERVAL_S)
+            sock = connect(socket_path)
+
+    sender = threading.Thread(target=_send, args=(rfile, sock))
+    sender.daemon = True
+    sender.start()
+    try:
+        while True:
+            data = sock.recv(BUFFER_SIZE)
+            if not data:
+                break
+            wfile.write(data)
+            wfile.flush()
+    finally:
+        sock.close()
+
+
+def _send(rfile, sock):
+    try:
+        while True:
+            # Unlike rfile.read, os.read returns whatever is available rather than waiting for a full buffer
+            data = os.read(rfile.fileno(), BUFFER_SIZE)
+            if not data:
+                break
+            sock.sendall(data)
+        sock.shutdown(socket.SHUT_WR)
+    except (IOError, OSError) as e:
+        log.debug('Stopped relaying requests: %s', e)
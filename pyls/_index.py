@@ -0,0 +1,574 @@
+# Copyright 2017 Palantir Technologies, Inc.
+"""An index of the module and class level definitions in a workspace, built in the background.
+
+Names are looked up case insensitively: queries shorter than a trigram by prefix, through a sorted
+list of the names, and longer ones by substring, through the trigrams of the names. The index also
+knows which files use a name, so that finding its references needn't search every file.
+
+Indexed files can be saved in a SQLite database, so that a restarted server only parses the
+files that changed since. The index of the files on disk is shared by every workspace of the process
+with the same root, while each workspace overlays the buffers its client has open.
+"""
+import bisect
+import collections
+import hashlib
+import io
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import parso
+
+from . import lsp, _utils
+
+log = logging.getLogger(__name__)
+
+PYTHON_FILE_EXTENSIONS = ('.py', '.pyi')
+# Directories that hold other people's code or nothing to index, besides hidden ones
+SKIPPED_DIRECTORIES = ('__pycache__', 'node_modules', 'site-packages')
+
+# Bump whenever the saved table or what is extracted from files changes
+SCHEMA_VERSION = 1
+STORE_FLUSH_SIZE = 256  # rows written per transaction
+
+# Statements whose children may define names in the same scope as the statement itself
+_BLOCK_TYPES = (
+    'simple_stmt', 'suite', 'decorated', 'async_stmt', 'async_funcdef',
+    'if_stmt', 'try_stmt', 'with_stmt', 'for_stmt', 'while_stmt',
+)
+
+# A definition's range is (start line, start character, end line, end character), counting from 0.
+# container is the dotted name of the enclosing class, or None at module level.
+Symbol = collections.namedtuple('Symbol', 'name kind container path range')
+
+# What the index knows about a file: its Symbols, the modules it imports and every name it uses
+IndexedFile = collections.namedtuple('IndexedFile', 'symbols imports names')
+
+
+def index_file(path, source):
+    """Return the IndexedFile of source, the content of path."""
+    module = parso.parse(source)
+    symbols = []
+    _collect_symbols(module, None, path, symbols)
+    return IndexedFile(symbols, sorted(_imported_modules(module)), sorted(module.get_used_names()))
+
+
+def store_path(root_path):
+    """Where the index of the workspace at root_path is saved."""
+    name = hashlib.sha1(root_path.encode('utf-8')).hexdigest()
+    return _utils.cache_path('index', name + '.sqlite')
+
+
+def _collect_symbols(node, container, path, symbols):
+    for child in getattr(node, 'children', ()):
+        if child.type == 'classdef':
+            symbols.append(Symbol(child.name.value, lsp.SymbolKind.Class, container, path, _node_range(child)))
+            qualified_name = child.name.value if container is None else container + '.' + child.name.value
+            _collect_symbols(child.children[-1], qualified_name, path, symbols)
+        elif child.type == 'funcdef':
+            kind = lsp.SymbolKind.Function if container is None else lsp.SymbolKind.Method
+            symbols.append(Symbol(child.name.value, kind, container, path, _node_range(child)))
+        elif child.type == 'expr_stmt':
+            kind = lsp.SymbolKind.Variable if container is None else lsp.SymbolKind.Field
+            for name in child.get_defined_names():
+                # Attributes of other objects, like a.b = 1, aren't ours
+                if name.parent.type != 'trailer':
+                    symbols.append(Symbol(name.value, kind, container, path, _node_range(name)))
+        elif child.type in _BLOCK_TYPES:
+            _collect_symbols(child, container, path, symbols)
+
+
+def _imported_modules(module):
+    modules = set()
+    stack = [module]
+    while stack:
+        node = stack.pop()
+        if node.type == 'import_name':
+            modules.update('.'.join(name.value for name in path) for path in node.get_paths())
+        elif node.type == 'import_from':
+            modules.add('.' * node.level + '.'.join(name.value for name in node.get_from_names()))
+        else:
+            stack.extend(getattr(node, 'children', ()))
+    return modules
+
+
+def _dump_file(indexed_file):
+    return json.dumps({
+        'symbols': [[s.name, s.kind, s.container, s.range] for s in indexed_file.symbols],
+        'imports': indexed_file.imports,
+        'names': indexed_file.names,
+    })
+
+
+def _load_file(path, text):
+    data = json.loads(text)
+    symbols = [Symbol(name, kind, container, path, tuple(range_)) for name, kind, container, range_ in data['symbols']]
+    return IndexedFile(symbols, data['imports'], data['names'])
+
+
+def _parse(path, source):
+    try:
+        return index_file(path, source)
+    except Exception:  # pylint: disable=broad-except
+        log.exception('Failed to index %s', path)
+        return IndexedFile([], [], [])
+
+
+def _node_range(node):
+    (start_line, start_column) = node.start_pos
+    (end_line, end_column) = node.end_pos
+    return (start_line - 1, start_column, end_line - 1, end_column)
+
+
+def _trigrams(name):
+    return {name[i:i + 3] for i in range(len(name) - 2)}
+
+
+def _matches(name, query):
+    """Whether the lowercased name matches the lowercased query, as WorkspaceIndex.search has it."""
+    return name.startswith(query) if len(query) < 3 else query in name
+
+
+def _rank(name, query):
+    return (name != query, not name.startswith(query), len(name), name)
+
+
+# The shared indexes by root path, each with the number of workspaces using it
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def acquire_index(root_path):
+    """Return the started, saved WorkspaceIndex of root_path, shared until every user has released it."""
+    with _indexes_lock:
+        entry = _indexes.get(root_path)
+        if entry is None:
+            index = WorkspaceIndex(root_path, store=IndexStore(store_path(root_path)))
+            index.start()
+            entry = _indexes[root_path] = [index, 0]
+        entry[1] += 1
+        return entry[0]
+
+
+def release_index(root_path):
+    """Stop the index of root_path once nobody that acquired it is using it."""
+    with _indexes_lock:
+        entry = _indexes[root_path]
+        entry[1] -= 1
+        if entry[1]:
+            return
+        del _indexes[root_path]
+    entry[0].stop()
+
+
+class IndexStore(object):
+    """Saves indexed files in a SQLite database at db_path, along with the stat and hash of their content.
+
+    A database of another SCHEMA_VERSION is emptied, and one that turns out to be corrupt is deleted
+    and created again. Should that fail too, nothing is saved.
+    """
+
+    def __init__(self, db_path):
+        self._db_path = db_path
+        self._lock = threading.Lock()
+        self._pending = []
+        self._conn = None
+        try:
+            self._conn = self._connect()
+        except (sqlite3.DatabaseError, OSError) as e:
+            self._recover(e)
+
+    def load(self):
+        """Return the saved (mtime, size, hash, entry) of every path."""
+        def read(conn):
+            return {row[0]: row[1:] for row in conn.execute('SELECT path, mtime, size, hash, entry FROM files')}
+        return self._run(read, {})
+
+    def get(self, path):
+        """Return the saved (mtime, size, hash, entry) of path, or None."""
+        return self._run(lambda conn: conn.execute(
+            'SELECT mtime, size, hash, entry FROM files WHERE path = ?', (path,)
+        ).fetchone())
+
+    def put(self, path, mtime, size, digest, entry):
+        self._queue((path, mtime, size, digest, entry))
+
+    def remove(self, path):
+        self._queue((path,))
+
+    def flush(self):
+        """Write the queued changes."""
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if not pending:
+            return
+
+        def write(conn):
+            with conn:
+                for row in pending:
+                    if len(row) == 1:
+                        conn.execute('DELETE FROM files WHERE path = ?', row)
+                    else:
+                        conn.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)', row)
+        self._run(write)
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _queue(self, row):
+        with self._lock:
+            self._pending.append(row)
+            full = len(self._pending) >= STORE_FLUSH_SIZE
+        if full:
+            self.flush()
+
+    def _run(self, operation, default=None):
+        with self._lock:
+            if self._conn is None:
+                return default
+            try:
+                return operation(self._conn)
+            except sqlite3.DatabaseError as e:
+                self._recover(e)
+                return default
+
+    def _connect(self):
+        directory = os.path.dirname(self._db_path)
+        try:
+            os.makedirs(directory)
+        except OSError:
+            if not os.path.isdir(directory):
+                raise
+
+        conn = sqlite3.connect(self._db_path, check_same_thread=False)
+        try:
+            (check,) = conn.execute('PRAGMA quick_check').fetchone()
+            if check != 'ok':
+                raise sqlite3.DatabaseError(check)
+            (version,) = conn.execute('PRAGMA user_version').fetchone()
+            if version != SCHEMA_VERSION:
+                with conn:
+                    conn.execute('DROP TABLE IF EXISTS files')
+                    conn.execute(
+                        'CREATE TABLE files (path TEXT PRIMARY KEY, mtime REAL, size INTEGER, hash TEXT, entry TEXT)'
+                    )
+                    conn.execute('PRAGMA user_version = {}'.format(SCHEMA_VERSION))
+        except Exception:
+            conn.close()
+            raise
+        return conn
+
+    def _recover(self, error):
+        """Start again with an empty database, which must be called with the lock held if there's a connection."""
+        log.warning('Index cache %s is unusable, starting afresh: %s', self._db_path, error)
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except sqlite3.Error:
+                pass
+            self._conn = None
+        for suffix in ('', '-journal', '-wal', '-shm'):
+            try:
+                os.remove(self._db_path + suffix)
+            except OSError:
+                pass
+
+        try:
+            self._conn = self._connect()
+        except (sqlite3.DatabaseError, OSError) as e:
+            log.warning('Not saving the index in %s: %s', self._db_path, e)
+
+
+class WorkspaceIndex(object):
+    """The Symbols of every python file under root_path.
+
+    The files are indexed on a background thread once started, as they are on disk. Files that changed
+    since are marked stale and indexed again before the next search.
+
+    Args:
+        root_path (str): The directory to index.
+        store (IndexStore): Where indexed files are saved, to be reused by the next server if unchanged.
+    """
+
+    def __init__(self, root_path, store=None):
+        self._root_path = root_path
+        self._store = store
+        self._lock = threading.RLock()
+        self._files = {}
+        # Lowercased names, the number of symbols with each name in every path and the trigrams of the names
+        self._paths_by_name = {}
+        self._sorted_names = []
+        self._trigram_names = collections.defaultdict(set)
+        # The paths using every name, whether they define it or refer to it
+        self._paths_by_used_name = collections.defaultdict(set)
+        self._stale = set()
+        self._thread = None
+        self._stopped = threading.Event()
+        self._built = threading.Event()
+
+    def start(self):
+        """Start indexing the files under root_path in the background."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._build)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._store is not None:
+            self._store.close()
+
+    def wait(self, timeout=None):
+        """Wait for the background indexing to finish, returning whether it did."""
+        return self._built.wait(timeout)
+
+    def covers(self, path):
+        """Whether path is one of the files to index."""
+        return path.endswith(PYTHON_FILE_EXTENSIONS) and path.startswith(os.path.join(self._root_path, ''))
+
+    def mark_stale(self, path):
+        """Index path again before the next search."""
+        if self.covers(path):
+            with self._lock:
+                self._stale.add(path)
+
+    def get_file(self, path):
+        """Return the IndexedFile of path, or None if it isn't indexed."""
+        self._refresh_stale()
+        with self._lock:
+            return self._files.get(path)
+
+    def files_using(self, name):
+        """Return the paths of the files in which name occurs as an identifier."""
+        self._refresh_stale()
+        with self._lock:
+            return set(self._paths_by_used_name.get(name, ()))
+
+    def search(self, query, limit=None):
+        """Return the Symbols whose name starts with query, or contains it if it's at least 3 characters long.
+
+        Exact matches come first, then prefix matches, then shorter names.
+        """
+        self._refresh_stale()
+        _utils.raise_if_cancelled()
+
+        query = query.lower()
+        with self._lock:
+            names = self._prefix_names(query) if len(query) < 3 else self._substring_names(query)
+            names.sort(key=lambda name: _rank(name, query))
+
+            symbols = []
+            for name in names:
+                for path in sorted(self._paths_by_name[name]):
+                    symbols.extend(s for s in self._files[path].symbols if s.name.lower() == name)
+                if limit is not None and len(symbols) >= limit:
+                    return symbols[:limit]
+            return symbols
+
+    def _prefix_names(self, prefix):
+        if self._sorted_names is None:
+            self._sorted_names = sorted(self._paths_by_name)
+        names = []
+        for i in range(bisect.bisect_left(self._sorted_names, prefix), len(self._sorted_names)):
+            if not self._sorted_names[i].startswith(prefix):
+                break
+            names.append(self._sorted_names[i])
+        return names
+
+    def _substring_names(self, query):
+        postings = sorted((self._trigram_names.get(trigram, set()) for trigram in _trigrams(query)), key=len)
+        # The names having every trigram of the query still need to contain it in one piece
+        return [name for name in postings[0].intersection(*postings[1:]) if query in name]
+
+    def _refresh_stale(self):
+        with self._lock:
+            stale, self._stale = self._stale, set()
+        for path in stale:
+            indexed_file = self._index_path(path, self._store.get(path) if self._store is not None else None)
+            if indexed_file is None and self._store is not None:
+                self._store.remove(path)
+            with self._lock:
+                self._set_file(path, indexed_file)
+        if stale and self._store is not None:
+            self._store.flush()
+
+    def _build(self):
+        start = time.time()
+        saved = self._store.load() if self._store is not None else {}
+        seen = set()
+        try:
+            for directory, dirnames, filenames in os.walk(self._root_path):
+                dirnames[:] = [d for d in dirnames if not d.startswith('.') and d not in SKIPPED_DIRECTORIES]
+                for filename in filenames:
+                    if self._stopped.is_set():
+                        return
+                    path = os.path.join(directory, filename)
+                    if not filename.endswith(PYTHON_FILE_EXTENSIONS):
+                        continue
+                    seen.add(path)
+                    if path in self._files:
+                        continue
+                    indexed_file = self._index_path(path, saved.get(path))
+                    if indexed_file is None:
+                        continue
+                    with self._lock:
+                        # Files marked stale meanwhile have been, or will be, indexed with their new content
+                        if path not in self._files:
+                            self._set_file(path, indexed_file, bulk=True)
+            for path in set(saved) - seen:
+                self._store.remove(path)
+        finally:
+            if self._store is not None:
+                self._store.flush()
+        log.info('Indexed %s files under %s in %.1fs', len(self._files), self._root_path, time.time() - start)
+        self._built.set()
+
+    def _index_path(self, path, saved=None):
+        """Return the IndexedFile of path, or None if it doesn't exist.
+
+        Files are only parsed if both their stat and their content differ from what was saved.
+        """
+        try:
+            stat = os.stat(path)
+            if saved is not None and tuple(saved[:2]) == (stat.st_mtime, stat.st_size):
+                indexed_file = self._load(path, saved[3])
+                if indexed_file is not None:
+                    return indexed_file
+            with io.open(path, 'rb') as f:
+                content = f.read()
+        except (IOError, OSError):
+            return None
+
+        digest = hashlib.sha1(content).hexdigest()
+        indexed_file = self._load(path, saved[3]) if saved is not None and saved[2] == digest else None
+        if indexed_file is None:
+            indexed_file = _parse(path, content.decode('utf-8', 'replace'))
+        if self._store is not None:
+            self._store.put(path, stat.st_mtime, stat.st_size, digest, _dump_file(indexed_file))
+        return indexed_file
+
+    @staticmethod
+    def _load(path, entry):
+        try:
+            return _load_file(path, entry)
+        except (ValueError, TypeError, KeyError) as e:
+            log.warning('Ignoring the saved index of %s: %s', path, e)
+            return None
+
+    def _set_file(self, path, indexed_file, bulk=False):
+        """Replace what's indexed of path, or forget path if indexed_file is None. Must be called with the lock held."""
+        old_file = self._files.pop(path, None)
+        if old_file is not None:
+            for symbol in old_file.symbols:
+                self._unlink(symbol.name.lower(), path)
+            for name in old_file.names:
+                paths = self._paths_by_used_name[name]
+                paths.discard(path)
+                if not paths:
+                    del self._paths_by_used_name[name]
+        if indexed_file is None:
+            return
+        if bulk:
+            # Sorting the names once when they're next needed beats inserting every one of them
+            self._sorted_names = None
+        self._files[path] = indexed_file
+        for symbol in indexed_file.symbols:
+            self._link(symbol.name.lower(), path)
+        for name in indexed_file.names:
+            self._paths_by_used_name[name].add(path)
+
+    def _link(self, name, path):
+        paths = self._paths_by_name.get(name)
+        if paths is None:
+            paths = self._paths_by_name[name] = {}
+            if self._sorted_names is not None:
+                bisect.insort(self._sorted_names, name)
+            for trigram in _trigrams(name):
+                self._trigram_names[trigram].add(name)
+        paths[path] = paths.get(path, 0) + 1
+
+    def _unlink(self, name, path):
+        paths = self._paths_by_name[name]
+        paths[path] -= 1
+        if paths[path]:
+            return
+        del paths[path]
+        if paths:
+            return
+
+        del self._paths_by_name[name]
+        if self._sorted_names is not None:
+            del self._sorted_names[bisect.bisect_left(self._sorted_names, name)]
+        for trigram in _trigrams(name):
+            names = self._trigram_names[trigram]
+            names.discard(name)
+            if not names:
+                del self._trigram_names[trigram]
+
+
+class IndexView(object):
+    """A WorkspaceIndex as seen by one client, whose open buffers replace the files they were opened from.
+
+    Args:
+        index (WorkspaceIndex): The index of the files on disk.
+        open_sources (callable): Returns the content of the client's open buffers by path.
+    """
+
+    def __init__(self, index, open_sources):
+        self._index = index
+        self._open_sources = open_sources
+        self._lock = threading.Lock()
+        # The source and IndexedFile of every open buffer that's been indexed
+        self._buffers = {}
+
+    def wait(self, timeout=None):
+        return self._index.wait(timeout)
+
+    def covers(self, path):
+        return self._index.covers(path)
+
+    def mark_stale(self, path):
+        self._index.mark_stale(path)
+
+    def files_using(self, name):
+        buffers = self._indexed_buffers()
+        paths = self._index.files_using(name) - set(buffers)
+        paths.update(path for path, indexed_file in buffers.items() if name in indexed_file.names)
+        return paths
+
+    def search(self, query, limit=None):
+        buffers = self._indexed_buffers()
+        files_limit = limit
+        if limit is not None:
+            # Make up for the symbols of the files that the buffers replace
+            for path in buffers:
+                indexed_file = self._index.get_file(path)
+                files_limit += len(indexed_file.symbols) if indexed_file is not None else 0
+        symbols = [s for s in self._index.search(query, files_limit) if s.path not in buffers]
+
+        query = query.lower()
+        for indexed_file in buffers.values():
+            symbols.extend(s for s in indexed_file.symbols if _matches(s.name.lower(), query))
+        symbols.sort(key=lambda s: (_rank(s.name.lower(), query), s.path))
+        return symbols if limit is None else symbols[:limit]
+
+    def _indexed_buffers(self):
+        sources = {path: source for path, source in self._open_sources().items() if self.covers(path)}
+        with self._lock:
+            for path in set(self._buffers) - set(sources):
+                del self._buffers[path]
+            for path, source in sources.items():
+                buffer = self._buffers.get(path)
+                if buffer is None or buffer[0] is not source:
+                    # Buffers aren't saved, as they may never make it to disk
+                    self._buffers[path] = (source, _parse(path, source))
+            return {path: indexed_file for path, (_source, indexed_file) in self._buffers.items()}
@@ -0,0 +1,341 @@
+# Copyright 2017 Palantir Technologies, Inc.
+"""Finding the installed plugins, and standing in for them until one of their hooks is first called.
+
+The pyls entry points of the installed distributions are found once per process. Scanning every
+distribution takes a while in large environments, so they're cached on disk until a directory on
+sys.path, or the entry points of a distribution providing plugins, changes.
+
+Importing every plugin at startup imports pylint, rope, yapf and the like, even for plugins that
+settings will disable. A LazyPlugin instead reads the hookimpls of a plugin module from its source
+and stands in for the module until one of them is called. Hookimpls that just return a literal,
+like most pyls_settings, are answered from the source, so resolving settings imports nothing.
+
+Modules this can't stand in for, such as those with hookwrappers or without source, are left to be
+imported straight away. So are modules importing a package that isn't installed, which fail to import
+and are blocked like before, rather than having their settings answered from the source.
+"""
+import ast
+import collections
+import copy
+import hashlib
+import importlib
+import inspect
+import io
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+
+try:
+    from importlib.util import find_spec
+except ImportError:
+    find_spec = None
+
+from pyls import _utils, hookimpl, PYLS
+
+log = logging.getLogger(__name__)
+
+# Bump whenever what's cached about entry points changes
+ENTRY_POINTS_CACHE_VERSION = 1
+
+# The hookimpl options a stub can have on behalf of the module's function
+HOOKIMPL_OPTIONS = ('tryfirst', 'trylast', 'optionalhook', 'specname')
+
+_NOT_LITERAL = object()
+
+# A pyls entry point: the plugin is the module, or its attribute if attr isn't None
+EntryPoint = collections.namedtuple('EntryPoint', 'name module_name attr')
+
+_entry_points = None
+_entry_points_lock = threading.Lock()
+
+
+def entry_points():
+    """Return the EntryPoints of the installed plugins, which are only looked for once per process."""
+    global _entry_points  # pylint: disable=global-statement
+    with _entry_points_lock:
+        if _entry_points is None:
+            _entry_points = _cached_entry_points(list(sys.path))
+        return _entry_points
+
+
+def load(entry_point):
+    """Import the plugin of entry_point."""
+    plugin = importlib.import_module(entry_point.module_name)
+    for attr in entry_point.attr.split('.') if entry_point.attr else ():
+        plugin = getattr(plugin, attr)
+    return plugin
+
+
+def find_entry_points(path):
+    """Return the EntryPoints of the distributions on path, and the files they were read from."""
+    try:
+        from importlib import metadata
+    except ImportError:
+        try:
+            import importlib_metadata as metadata
+        except ImportError:
+            return _find_setuptools_entry_points(path)
+
+    found, files, seen = [], [], set()
+    for dist in metadata.distributions(path=path):
+        dist_entry_points = [ep for ep in dist.entry_points if ep.group == PYLS]
+        if not dist_entry_points:
+            continue
+        # Like pkg_resources, only the first of the distributions with a name counts
+        name = (dist.metadata['Name'] or '').lower().replace('_', '-')
+        if name in seen:
+            continue
+        seen.add(name)
+        for ep in dist_entry_points:
+            # module[:attr] [extras]
+            module_name, _, attr = ep.value.split('[')[0].strip().partition(':')
+            found.append(EntryPoint(ep.name, module_name.strip(), attr.strip() or None))
+        metadata_dir = getattr(dist, '_path', None)
+        if metadata_dir is not None:
+            files.append(os.path.join(str(metadata_dir), 'entry_points.txt'))
+    return found, files
+
+
+def _find_setuptools_entry_points(path):
+    import pkg_resources
+
+    found, files = [], set()
+    for ep in pkg_resources.WorkingSet(path).iter_entry_points(PYLS):
+        found.append(EntryPoint(ep.name, ep.module_name, '.'.join(ep.attrs) or None))
+        egg_info = getattr(ep.dist, 'egg_info', None)
+        if egg_info:
+            files.add(os.path.join(egg_info, 'entry_points.txt'))
+    return found, sorted(files)
+
+
+def _cached_entry_points(path):
+    """Return the EntryPoints on path, from the cache if nothing they could have come from has changed."""
+    key = json.dumps([sys.executable] + [os.path.abspath(entry or os.curdir) for entry in path])
+    cache_file = _utils.cache_path('plugins', hashlib.sha1(key.encode('utf-8')).hexdigest() + '.json')
+    try:
+        with io.open(cache_file, 'r', encoding='utf-8') as f:
+            cached = json.load(f)
+        if cached['version'] == ENTRY_POINTS_CACHE_VERSION and cached['mtimes'] == _mtimes(cached['mtimes']):
+            return [EntryPoint(*ep) for ep in cached['entry_points']]
+    except (IOError, OSError, ValueError, KeyError, TypeError):
+        pass
+
+    found, files = find_entry_points(path)
+    # A distribution being installed or removed changes the directory holding it
+    watched = [os.path.abspath(entry or os.curdir) for entry in path] + files
+    _write_json(cache_file, {
+        'version': ENTRY_POINTS_CACHE_VERSION,
+        'mtimes': _mtimes(watched),
+        'entry_points': found,
+    })
+    return found
+
+
+def _mtimes(paths):
+    mtimes = {}
+    for path in paths:
+        try:
+            mtimes[path] = os.stat(path).st_mtime
+        except OSError:
+            mtimes[path] = None
+    return mtimes
+
+
+def _write_json(path, value):
+    """Replace the file at path in one go, so that other servers never read half of it."""
+    try:
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with io.open(fd, 'wb') as f:
+            f.write(json.dumps(value).encode('utf-8'))
+        # os.rename doesn't replace files on Windows, and python 2 has nothing else
+        getattr(os, 'replace', os.rename)(tmp_path, path)
+    except (IOError, OSError) as e:
+        log.warning('Failed to cache the installed plugins in %s: %s', path, e)
+
+
+class _Unsupported(Exception):
+    """The module defines its hookimpls in a way a LazyPlugin can't stand in for."""
+
+
+def read_hookimpls(module_name):
+    """Return the hookimpls of module_name, read from its source without importing it.
+
+    Each hookimpl is a tuple of the function's name, the names of its required arguments, its
+    hookimpl options and the literal it returns, or _NOT_LITERAL. Returns None if the module's source
+    can't be found, or if it defines its hookimpls in a way a LazyPlugin can't stand in for.
+    """
+    if find_spec is None or not hasattr(inspect, 'signature'):
+        return None
+    try:
+        spec = find_spec(module_name)
+    except (ImportError, ValueError):
+        return None
+    if spec is None or not spec.origin or not spec.origin.endswith('.py'):
+        return None
+
+    try:
+        with io.open(spec.origin, 'rb') as f:
+            tree = ast.parse(f.read(), spec.origin)
+        return _module_hookimpls(tree)
+    except (IOError, OSError, SyntaxError, ValueError) as e:
+        log.debug('Failed to read the hookimpls of %s: %s', module_name, e)
+    except _Unsupported as e:
+        log.debug('Importing %s straight away: %s', module_name, e)
+    return None
+
+
+def _module_hookimpls(tree):
+    hookimpls = []
+    top_level = set(tree.body)
+    for node in _module_level_nodes(tree):
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            for alias in node.names:
+                if alias.name == '*' or (alias.asname or alias.name).startswith(PYLS + '_'):
+                    raise _Unsupported('imports hookimpls')
+            if node in top_level:
+                _check_installed(node)
+        elif isinstance(node, ast.Name) and isinstance(node.ctx, ast.Store) and node.id.startswith(PYLS + '_'):
+            raise _Unsupported('assigns {}'.format(node.id))
+        elif isinstance(node, ast.FunctionDef):
+            opts = None
+            for decorator in node.decorator_list:
+                opts = _hookimpl_options(decorator)
+                if opts is not None:
+                    break
+            if opts is None:
+                continue
+            if node not in top_level:
+                # Which definition the module ends up with isn't known until it runs
+                raise _Unsupported('{} is defined conditionally'.format(node.name))
+            hookimpls.append((node.name, _required_args(node.args), opts, _returned_literal(node)))
+    return hookimpls
+
+
+def _check_installed(node):
+    """Check that the packages an unconditional import at the top of the module needs are installed."""
+    if isinstance(node, ast.ImportFrom):
+        if node.level:
+            return
+        names = [node.module]
+    else:
+        names = [alias.name for alias in node.names]
+    for name in names:
+        package = name.split('.')[0]
+        try:
+            missing = package not in sys.modules and find_spec(package) is None
+        except (ImportError, ValueError):
+            missing = False
+        if missing:
+            raise _Unsupported('{} is not installed'.format(package))
+
+
+def _module_level_nodes(tree):
+    """Yield the nodes of tree that run when the module is imported, and the functions and classes it defines."""
+    stack = list(reversed(tree.body))
+    while stack:
+        node = stack.pop()
+        yield node
+        if not isinstance(node, (ast.FunctionDef, ast.ClassDef, ast.Lambda)):
+            stack.extend(reversed(list(ast.iter_child_nodes(node))))
+
+
+def _hookimpl_options(decorator):
+    """Return the options of a hookimpl decorator, or None if it's another decorator."""
+    call = decorator if isinstance(decorator, ast.Call) else None
+    target = call.func if call is not None else decorator
+    name = target.id if isinstance(target, ast.Name) else getattr(target, 'attr', None)
+    if name != 'hookimpl':
+        return None
+
+    opts = {}
+    if call is not None:
+        if call.args:
+            raise _Unsupported('hookimpl called with positional arguments')
+        for keyword in call.keywords:
+            # Hookwrappers are generators, which a stub can't just call through to
+            if keyword.arg not in HOOKIMPL_OPTIONS:
+                raise _Unsupported('hookimpl option {}'.format(keyword.arg))
+            opts[keyword.arg] = ast.literal_eval(keyword.value)
+    return opts
+
+
+def _required_args(arguments):
+    # pluggy only passes the arguments without a default
+    args = [arg.arg for arg in getattr(arguments, 'posonlyargs', []) + arguments.args]
+    return args[:len(args) - len(arguments.defaults)]
+
+
+def _returned_literal(function):
+    body = function.body[1:] if ast.get_docstring(function) is not None else function.body
+    if len(body) != 1 or not isinstance(body[0], ast.Return) or body[0].value is None:
+        return _NOT_LITERAL
+    try:
+        return ast.literal_eval(body[0].value)
+    except ValueError:
+        return _NOT_LITERAL
+
+
+class LazyPlugin(object):
+    """Stands in for the plugin module module_name, importing it when one of hookimpls is first called.
+
+    Args:
+        module_name (str): The plugin module.
+        hookimpls (list): The hookimpls of the module, as returned by read_hookimpls.
+        on_import_error (callable): Called if the module fails to import, such as to block the plugin.
+    """
+
+    def __init__(self, module_name, hookimpls, on_import_error=None):
+        self._module_name = module_name
+        self._on_import_error = on_import_error
+        self._module = None
+        self._failed = False
+        self._lock = threading.Lock()
+        for name, argnames, opts, literal in hookimpls:
+            setattr(self, name, self._stub(name, argnames, opts, literal))
+
+    def __repr__(self):
+        return '<LazyPlugin {}>'.format(self._module_name)
+
+    @property
+    def loaded(self):
+        return self._module is not None
+
+    def load(self):
+        """Import the plugin module, returning it, or None if it fails to import."""
+        with self._lock:
+            if self._module is not None or self._failed:
+                return self._module
+            try:
+                self._module = importlib.import_module(self._module_name)
+                log.info('Imported pyls plugin %s', self._module_name)
+                return self._module
+            except ImportError as e:
+                # Like plugins that fail to import at startup, this one will do nothing
+                log.warning("Failed to import %s plugin '%s': %s", PYLS, self._module_name, e)
+                self._failed = True
+        if self._on_import_error is not None:
+            self._on_import_error()
+        return None
+
+    def _stub(self, name, argnames, opts, literal):
+        if literal is not _NOT_LITERAL:
+            def stub(*_args):
+                # Callers may merge into what hooks return
+                return copy.deepcopy(literal)
+        else:
+            def stub(*args):
+                module = self.load()
+                return getattr(module, name)(*args) if module is not None else None
+
+        stub.__name__ = str(name)
+        # pluggy passes hookimpls the arguments named in their signature
+        stub.__signature__ = inspect.Signature([
+            inspect.Parameter(arg, inspect.Parameter.POSITIONAL_OR_KEYWORD) for arg in argnames
+        ])
+        return hookimpl(**opts)(stub)
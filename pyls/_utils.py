@@ -1,4 +1,6 @@
 # Copyright 2017 Palantir Technologies, Inc.
+import collections
+import contextlib
 import functools
 import inspect
 import logging
@@ -7,6 +9,7 @@ import sys
 import threading
 
 import jedi
+from pyls_jsonrpc.exceptions import JsonRpcRequestCancelled
 
 PY2 = sys.version_info.major == 2
 JEDI_VERSION = jedi.__version__
@@ -47,6 +50,159 @@ def debounce(interval_s, keyed_by=None):
     return wrapper
 
 
+class CancellationToken(object):
+    """Tells long running work that the client no longer wants its result.
+
+    Cancellation is cooperative: work checks the token at convenient points with raise_if_cancelled,
+    and anything that can't check it (e.g. a subprocess) registers a callback to be stopped with.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cancelled = False
+        self._callbacks = []
+
+    @property
+    def cancelled(self):
+        return self._cancelled
+
+    def cancel(self):
+        with self._lock:
+            if self._cancelled:
+                return
+            self._cancelled = True
+            callbacks, self._callbacks = self._callbacks, []
+
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:  # pylint: disable=broad-except
+                log.exception('Failed to run cancellation callback %s', callback)
+
+    def add_callback(self, callback):
+        """Call callback once the token is cancelled, straight away if it already is."""
+        with self._lock:
+            if not self._cancelled:
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def remove_callback(self, callback):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def raise_if_cancelled(self):
+        if self._cancelled:
+            raise JsonRpcRequestCancelled()
+
+
+_cancellation = threading.local()
+
+
+@contextlib.contextmanager
+def cancellation_scope(token):
+    """Make token the one checked by raise_if_cancelled for work running on this thread."""
+    previous = getattr(_cancellation, 'token', None)
+    _cancellation.token = token
+    try:
+        yield token
+    finally:
+        _cancellation.token = previous
+
+
+def current_cancel_token():
+    return getattr(_cancellation, 'token', None)
+
+
+def raise_if_cancelled():
+    """Raise JsonRpcRequestCancelled if the request running on this thread has been cancelled."""
+    token = current_cancel_token()
+    if token is not None:
+        token.raise_if_cancelled()
+
+
+@contextlib.contextmanager
+def kill_on_cancel(process):
+    """Kill process if the request running on this thread is cancelled while it runs."""
+    token = current_cancel_token()
+    if token is None:
+        yield process
+        return
+
+    def kill():
+        try:
+            process.kill()
+        except OSError:
+            # The process already exited
+            pass
+
+    token.add_callback(kill)
+    try:
+        yield process
+    finally:
+        token.remove_callback(kill)
+    token.raise_if_cancelled()
+
+
+class LRUCache(object):
+    """A thread safe mapping that forgets its least recently used entries once it holds more than maxsize.
+
+    If sizeof is given, maxsize bounds the total sizeof(value) of the entries rather than their number.
+    """
+
+    def __init__(self, maxsize, sizeof=None):
+        self._maxsize = maxsize
+        self._sizeof = sizeof or (lambda _value: 1)
+        self._data = collections.OrderedDict()
+        self._sizes = {}
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data.pop(key)
+            except KeyError:
+                return default
+            self._data[key] = value
+            return value
+
+    def __setitem__(self, key, value):
+        size = self._sizeof(value)
+        with self._lock:
+            self._pop(key)
+            self._data[key] = value
+            self._sizes[key] = size
+            self._size += size
+            while self._size > self._maxsize:
+                self._pop(next(iter(self._data)))
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._pop(key, default)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._sizes.clear()
+            self._size = 0
+
+    def _pop(self, key, default=None):
+        if key not in self._data:
+            return default
+        self._size -= self._sizes.pop(key)
+        return self._data.pop(key)
+
+
 def find_parents(root, path, names):
     """Find files matching the given names relative to the given path.
 
@@ -82,6 +238,12 @@ def find_parents(root, path, names):
     return []
 
 
+def cache_path(*parts):
+    """The path of parts in the directory where the server caches what outlives it."""
+    cache_home = os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache'))
+    return os.path.join(cache_home, 'pyls', *parts)
+
+
 def path_to_dot_name(path):
     """Given a path to a module, derive its dot-separated full name."""
     directory = os.path.dirname(path)
@@ -164,6 +326,26 @@ def clip_column(column, lines, line_number):
     return min(column, max_column)
 
 
+def utf16_column(line, column):
+    """Convert a column counted in characters to one counted in UTF-16 code units."""
+    prefix = line[:column]
+    # Characters outside the Basic Multilingual Plane take two code units
+    return len(prefix.encode('utf-16-le')) // 2 + max(column - len(line), 0)
+
+
+def column_from_utf16(line, column):
+    """Convert a column counted in UTF-16 code units to one counted in characters."""
+    if len(line.encode('utf-16-le')) // 2 == len(line):
+        # No surrogate pairs, so code units and characters line up
+        return column
+    units = 0
+    for i, char in enumerate(line):
+        if units >= column:
+            return i
+        units += 2 if ord(char) > 0xFFFF else 1
+    return len(line) + column - units
+
+
 def position_to_jedi_linecolumn(document, position):
     """
     Convert the LSP format 'line', 'character' to Jedi's 'line', 'column'
@@ -172,6 +354,8 @@ def position_to_jedi_linecolumn(document, position):
     """
     code_position = {}
     if position:
+        # Clients count columns in UTF-16 code units, jedi in characters
+        position = document.position_from_utf16(position)
         code_position = {'line': position['line'] + 1,
                          'column': clip_column(position['character'],
                                                document.lines,
@@ -0,0 +1,239 @@
+# Copyright 2017 Palantir Technologies, Inc.
+"""Long-lived worker processes that serve requests over framed pipes.
+
+Tools like pylint and flake8 take longer to start up than to lint a small file, so instead of
+spawning them for every lint we keep them running in a worker and send it one request at a time.
+
+Every message is a 4 byte big-endian length followed by that many bytes of UTF-8 encoded JSON.
+Requests are {"id": ..., "params": ...} and responses {"id": ..., "result": ...} or
+{"id": ..., "error": ...}, plus the worker's peak memory use in "rss".
+
+Run as ``python -m pyls._worker module:function`` to serve requests with function(params).
+"""
+import importlib
+import itertools
+import json
+import logging
+import os
+import struct
+import sys
+import threading
+import time
+import traceback
+from subprocess import Popen, PIPE
+
+try:
+    from queue import Queue, Empty
+except ImportError:
+    from Queue import Queue, Empty
+
+from pyls import _utils
+
+log = logging.getLogger(__name__)
+
+POLL_INTERVAL_S = 0.1  # how often a waiting request checks whether it has been cancelled
+_HEADER = struct.Struct('>I')
+
+
+class WorkerError(Exception):
+    """The worker failed to answer a request."""
+
+
+def read_frame(stream):
+    """Read a message from stream, returning None at the end of the stream."""
+    header = _read_exactly(stream, _HEADER.size)
+    if header is None:
+        return None
+    body = _read_exactly(stream, _HEADER.unpack(header)[0])
+    if body is None:
+        return None
+    return json.loads(body.decode('utf-8'))
+
+
+def write_frame(stream, message):
+    body = json.dumps(message).encode('utf-8')
+    stream.write(_HEADER.pack(len(body)) + body)
+    stream.flush()
+
+
+def _read_exactly(stream, size):
+    data = b''
+    while len(data) < size:
+        chunk = stream.read(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+class Worker(object):
+    """A worker process serving requests for handler, started when needed and restarted if it dies.
+
+    Args:
+        handler (str): The function serving requests in the worker, as 'module:function'.
+        max_rss (int): Restart the worker once its peak memory use exceeds this many bytes.
+    """
+
+    def __init__(self, handler, max_rss=None):
+        self._handler = handler
+        self._max_rss = max_rss
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+        self._process = None
+        self._waiting = None
+
+    def request(self, params, timeout=None):
+        """Send params to the worker and return the handler's result.
+
+        While waiting, the request can be cancelled through the current cancellation token. The worker
+        still finishes the abandoned request, which keeps it warm for the next one. Requests that time
+        out kill the worker instead.
+        """
+        response_queue = Queue()
+        with self._lock:
+            if self._process is None or self._process.poll() is not None:
+                self._start()
+            process, waiting = self._process, self._waiting
+            msg_id = next(self._ids)
+            waiting[msg_id] = response_queue
+            try:
+                write_frame(process.stdin, {'id': msg_id, 'params': params})
+            except (IOError, OSError, ValueError) as e:
+                waiting.pop(msg_id, None)
+                self._stop(process)
+                raise WorkerError('Failed to send request to worker %s: %s' % (self._handler, e))
+
+        try:
+            response = self._wait(process, response_queue, timeout)
+        finally:
+            waiting.pop(msg_id, None)
+
+        if response is None:
+            raise WorkerError('Worker %s exited' % self._handler)
+        if self._max_rss and (response.get('rss') or 0) > self._max_rss:
+            log.info('Restarting worker %s, which is using %s bytes', self._handler, response['rss'])
+            with self._lock:
+                self._stop(process)
+        if 'error' in response:
+            raise WorkerError(response['error'])
+        return response.get('result')
+
+    def stop(self):
+        with self._lock:
+            self._stop(self._process)
+
+    def _wait(self, process, response_queue, timeout):
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            _utils.raise_if_cancelled()
+            interval = POLL_INTERVAL_S
+            if deadline is not None:
+                interval = min(interval, deadline - time.time())
+                if interval <= 0:
+                    with self._lock:
+                        self._stop(process)
+                    raise WorkerError('Worker %s timed out after %ss' % (self._handler, timeout))
+            try:
+                return response_queue.get(timeout=interval)
+            except Empty:
+                continue
+
+    def _start(self):
+        log.debug('Starting worker %s', self._handler)
+        process = Popen([sys.executable, '-m', __name__, self._handler], stdin=PIPE, stdout=PIPE)
+        waiting = {}
+        reader = threading.Thread(target=self._read_responses, args=(process, waiting))
+        reader.daemon = True
+        reader.start()
+        self._process, self._waiting = process, waiting
+
+    def _stop(self, process):
+        """Kill process, which must be called with the lock held."""
+        if process is None:
+            return
+        if self._process is process:
+            self._process = None
+        try:
+            process.kill()
+        except OSError:
+            # It already exited
+            pass
+
+    def _read_responses(self, process, waiting):
+        while True:
+            try:
+                message = read_frame(process.stdout)
+            except (IOError, OSError, ValueError):
+                message = None
+            if message is None:
+                break
+            response_queue = waiting.get(message.get('id'))
+            if response_queue is not None:
+                response_queue.put(message)
+
+        log.debug('Worker %s exited with %s', self._handler, process.wait())
+        with self._lock:
+            if self._process is process:
+                self._process = None
+            for response_queue in list(waiting.values()):
+                response_queue.put(None)
+
+
+class WorkerPool(object):
+    """Spreads requests over size workers, picking the one with the fewest requests in flight."""
+
+    def __init__(self, handler, size=1, max_rss=None):
+        self._workers = [Worker(handler, max_rss=max_rss) for _ in range(size)]
+        self._in_flight = [0] * size
+        self._lock = threading.Lock()
+
+    def request(self, params, timeout=None):
+        with self._lock:
+            index = min(range(len(self._workers)), key=self._in_flight.__getitem__)
+            self._in_flight[index] += 1
+        try:
+            return self._workers[index].request(params, timeout=timeout)
+        finally:
+            with self._lock:
+                self._in_flight[index] -= 1
+
+    def stop(self):
+        for worker in self._workers:
+            worker.stop()
+
+
+def _max_rss():
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def main():
+    module_name, function_name = sys.argv[1].split(':')
+
+    rx = os.fdopen(os.dup(0), 'rb')
+    tx = os.fdopen(os.dup(1), 'wb')
+    # Anything the handler reads from stdin or prints would corrupt our frames
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull, 0)
+    os.dup2(2, 1)
+
+    handler = getattr(importlib.import_module(module_name), function_name)
+    while True:
+        message = read_frame(rx)
+        if message is None:
+            break
+        try:
+            response = {'id': message['id'], 'result': handler(message['params'])}
+        except Exception:  # pylint: disable=broad-except
+            response = {'id': message['id'], 'error': traceback.format_exc()}
+        response['rss'] = _max_rss()
+        write_frame(tx, response)
+
+
+if __name__ == '__main__':
+    main()
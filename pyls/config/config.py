@@ -1,14 +1,14 @@
 # Copyright 2017 Palantir Technologies, Inc.
 import logging
-import pkg_resources
 try:
     from functools import lru_cache
 except ImportError:
     from backports.functools_lru_cache import lru_cache
+from functools import partial
 
 import pluggy
 
-from pyls import _utils, hookspecs, uris, PYLS
+from pyls import _plugins, _utils, hookspecs, uris, PYLS
 
 log = logging.getLogger(__name__)
 
@@ -16,9 +16,50 @@ log = logging.getLogger(__name__)
 DEFAULT_CONFIG_SOURCES = ['pycodestyle']
 
 
+def create_plugin_manager(lazy=True):
+    """Return a plugin manager with the hookspecs and every installed plugin that could be loaded.
+
+    If lazy, plugin modules are registered as LazyPlugins where possible, to be imported when one of
+    their hooks is first called rather than straight away.
+    """
+    pm = pluggy.PluginManager(PYLS)
+    pm.trace.root.setwriter(log.debug)
+    pm.enable_tracing()
+    pm.add_hookspecs(hookspecs)
+
+    # Rather than have all plugins catch ImportError, we block any entry points that throw ImportError,
+    # assuming one or more of their dependencies isn't present.
+    for entry_point in _plugins.entry_points():
+        # Only the first of the plugins with a name counts
+        if pm.get_plugin(entry_point.name) is not None or pm.is_blocked(entry_point.name):
+            continue
+        hookimpls = _plugins.read_hookimpls(entry_point.module_name) if lazy and not entry_point.attr else None
+        if hookimpls:
+            plugin = _plugins.LazyPlugin(entry_point.module_name, hookimpls,
+                                         on_import_error=partial(pm.set_blocked, entry_point.name))
+        else:
+            try:
+                plugin = _plugins.load(entry_point)
+            except ImportError as e:
+                log.warning("Failed to load %s entry point '%s': %s", PYLS, entry_point.name, e)
+                pm.set_blocked(entry_point.name)
+                continue
+        pm.register(plugin, name=entry_point.name)
+
+    for name, plugin in pm.list_name_plugin():
+        if plugin is not None:
+            log.info("Loaded pyls plugin %s from %s", name, plugin)
+    return pm
+
+
 class Config(object):
+    """The settings of a workspace, and the plugins serving it.
 
-    def __init__(self, root_uri, init_opts, process_id, capabilities):
+    The plugins are loaded by create_plugin_manager. Configs of the workspaces of a server share its
+    plugin_manager, so that only resolving settings is done per workspace.
+    """
+
+    def __init__(self, root_uri, init_opts, process_id, capabilities, plugin_manager=None):
         self._root_path = uris.to_fs_path(root_uri)
         self._root_uri = root_uri
         self._init_opts = init_opts
@@ -40,27 +81,7 @@ class Config(object):
         except ImportError:
             pass
 
-        self._pm = pluggy.PluginManager(PYLS)
-        self._pm.trace.root.setwriter(log.debug)
-        self._pm.enable_tracing()
-        self._pm.add_hookspecs(hookspecs)
-
-        # Pluggy will skip loading a plugin if it throws a DistributionNotFound exception.
-        # However I don't want all plugins to have to catch ImportError and re-throw. So here we'll filter
-        # out any entry points that throw ImportError assuming one or more of their dependencies isn't present.
-        for entry_point in pkg_resources.iter_entry_points(PYLS):
-            try:
-                entry_point.load()
-            except ImportError as e:
-                log.warning("Failed to load %s entry point '%s': %s", PYLS, entry_point.name, e)
-                self._pm.set_blocked(entry_point.name)
-
-        # Load the entry points into pluggy, having blocked any failing ones
-        self._pm.load_setuptools_entrypoints(PYLS)
-
-        for name, plugin in self._pm.list_name_plugin():
-            if plugin is not None:
-                log.info("Loaded pyls plugin %s from %s", name, plugin)
+        self._pm = plugin_manager or create_plugin_manager()
 
         for plugin_conf in self._pm.hook.pyls_settings(config=self):
             self._plugin_settings = _utils.merge_dicts(self._plugin_settings, plugin_conf)
@@ -103,8 +103,13 @@ def pyls_lint(config, workspace, document, is_saved):
 
 
 @hookspec
-def pyls_references(config, workspace, document, position, exclude_declaration):
-    pass
+def pyls_references(config, workspace, document, position, exclude_declaration, on_partial):
+    """Find the references of the name at position.
+
+    Args:
+        on_partial: None, or a function that references can be passed to as they are found,
+            rather than returned.
+    """
 
 
 @hookspec(firstresult=True)
@@ -120,3 +125,8 @@ def pyls_settings(config):
 @hookspec(firstresult=True)
 def pyls_signature_help(config, workspace, document, position):
     pass
+
+
+@hookspec
+def pyls_workspace_symbols(config, workspace, query):
+    pass
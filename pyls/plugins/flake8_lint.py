@@ -1,19 +1,31 @@
 # Copyright 2019 Palantir Technologies, Inc.
 """Linter pluging for flake8"""
+import io
 import logging
 import os.path
 import re
+import sys
+import threading
 from subprocess import Popen, PIPE
-from pyls import hookimpl, lsp
+from pyls import hookimpl, lsp, _utils, _worker
 
 log = logging.getLogger(__name__)
 FIX_IGNORES_RE = re.compile(r'([^a-zA-Z0-9_,]*;.*(\W+||$))')
 
+# Persistent mode keeps flake8 and its plugins loaded in a worker process between lints
+PERSISTENT_TIMEOUT_S = 30
+PERSISTENT_MAX_RSS = 512 * 1024 * 1024  # restart the worker once it has used 512 MiB
+# Files flake8 reads its configuration from, besides the one given with --config
+CONFIG_FILES = ('setup.cfg', 'tox.ini', '.flake8')
+USER_CONFIG_FILES = ('~/.config/flake8', '~/.flake8')
+_worker_pool = None
+_worker_pool_lock = threading.Lock()
+
 
 @hookimpl
 def pyls_settings():
-    # Default flake8 to disabled
-    return {'plugins': {'flake8': {'enabled': False}}}
+    # Default flake8 to disabled. Running it takes a subprocess, so its diagnostics come after the fast linters'
+    return {'plugins': {'flake8': {'enabled': False, 'lintTier': 'slow', 'persistent': False}}}
 
 
 @hookimpl
@@ -44,7 +56,11 @@ def pyls_lint(workspace, document):
     flake8_executable = settings.get('executable', 'flake8')
 
     args = build_args(opts)
-    output = run_flake8(flake8_executable, args, document)
+    output = None
+    if settings.get('persistent'):
+        output = run_flake8_persistent(args, document)
+    if output is None:
+        output = run_flake8(flake8_executable, args, document)
     return parse_stdout(document, output)
 
 
@@ -52,9 +68,7 @@ def run_flake8(flake8_executable, args, document):
     """Run flake8 with the provided arguments, logs errors
     from stderr if any.
     """
-    # a quick temporary fix to deal with Atom
-    args = [(i if not i.startswith('--ignore=') else FIX_IGNORES_RE.sub('', i))
-            for i in args if i is not None]
+    args = _fix_args(args)
 
     # if executable looks like a path resolve it
     if not os.path.isfile(flake8_executable) and os.sep in flake8_executable:
@@ -72,12 +86,114 @@ def run_flake8(flake8_executable, args, document):
         cmd = ['python', '-m', 'flake8']
         cmd.extend(args)
         p = Popen(cmd, stdin=PIPE, stdout=PIPE, stderr=PIPE)
-    (stdout, stderr) = p.communicate(document.source.encode())
+    with _utils.kill_on_cancel(p):
+        (stdout, stderr) = p.communicate(document.source.encode())
     if stderr:
         log.error("Error while running flake8 '%s'", stderr.decode())
     return stdout.decode()
 
 
+def run_flake8_persistent(args, document):
+    """Run flake8 with the provided arguments in a long-lived worker process.
+
+    The worker uses the flake8 installed alongside the language server, in place of both the
+    flake8 executable and the `python -m flake8` fallback. Returns None if it couldn't lint.
+    """
+    global _worker_pool  # pylint: disable=global-statement
+    with _worker_pool_lock:
+        if _worker_pool is None:
+            _worker_pool = _worker.WorkerPool(__name__ + ':_lint_in_worker', max_rss=PERSISTENT_MAX_RSS)
+
+    args = _fix_args(args)
+    log.debug("Calling persistent flake8 with args: '%s'", args)
+    try:
+        return _worker_pool.request({'args': args, 'source': document.source}, timeout=PERSISTENT_TIMEOUT_S)
+    except _worker.WorkerError as e:
+        log.error("Error while running flake8 in a worker, falling back to a subprocess '%s'", e)
+        return None
+
+
+def _fix_args(args):
+    # a quick temporary fix to deal with Atom
+    return [(i if not i.startswith('--ignore=') else FIX_IGNORES_RE.sub('', i))
+            for i in args if i is not None]
+
+
+class _Output(object):
+    """Collects what the formatter writes, surviving the formatter closing it."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, text):
+        self._chunks.append(text)
+
+    def close(self):
+        pass
+
+    def getvalue(self):
+        return ''.join(self._chunks)
+
+
+# The flake8 application of the worker, and the arguments and config files it was initialized with
+_application = None
+_application_key = None
+
+
+def _lint_in_worker(params):
+    """Lint params['source'] with flake8 inside the flake8 worker, returning flake8's output."""
+    from flake8 import utils as flake8_utils
+    from flake8.main.application import Application
+
+    global _application, _application_key  # pylint: disable=global-statement
+    key = (params['args'], _config_files_state(params['args']))
+    if _application is None or key != _application_key:
+        # Discovering plugins and parsing options is the expensive part, so only do it when they may have changed
+        _application = Application()
+        _application.initialize(params['args'])
+        _application_key = key
+
+    source = params['source'].encode('utf-8')
+    stdin = sys.stdin
+    sys.stdin = io.BytesIO(source) if _utils.PY2 else io.TextIOWrapper(io.BytesIO(source), encoding='utf-8')
+    # flake8 caches what it read from stdin
+    flake8_utils.stdin_get_value.cache_clear()
+    output = _Output()
+    try:
+        _application.make_guide()
+        _application.make_file_checker_manager()
+        _application.formatter.output_fd = output
+        _application.run_checks()
+        _application.report()
+    finally:
+        sys.stdin = stdin
+        flake8_utils.stdin_get_value.cache_clear()
+    return output.getvalue()
+
+
+def _config_files_state(args):
+    """Return the modification times of the config files flake8 would read."""
+    paths = [os.path.expanduser(path) for path in USER_CONFIG_FILES]
+    paths.extend(arg.split('=', 1)[1] for arg in args if arg.startswith(('--config=', '--append-config=')))
+
+    # flake8 looks for project config files from the working directory upwards
+    directory = os.getcwd()
+    while True:
+        paths.extend(os.path.join(directory, name) for name in CONFIG_FILES)
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            break
+        directory = parent
+
+    state = []
+    for path in paths:
+        try:
+            state.append((path, os.path.getmtime(path)))
+        except OSError:
+            continue
+    return state
+
+
 def build_args(options):
     """Build arguments for calling flake8.
 
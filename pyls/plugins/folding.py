@@ -1,23 +1,74 @@
 # pylint: disable=len-as-condition
 # Copyright 2019 Palantir Technologies, Inc.
 
+import collections
+import logging
 import re
+import threading
 
 import parso
 import parso.python.tree as tree_nodes
 
-from pyls import hookimpl
+from pyls import hookimpl, _utils
+
+log = logging.getLogger(__name__)
 
 SKIP_NODES = (tree_nodes.Module, tree_nodes.IfStmt, tree_nodes.TryStmt)
 IDENTATION_REGEX = re.compile(r'(\s+).+')
 
+# How many documents to keep incremental parses for
+MAX_PARSES = 32
+_parses = _utils.LRUCache(MAX_PARSES)
+_parses_lock = threading.Lock()
+
+
+class IncrementalParse(object):
+    """A document's parso module, kept up to date with parso's diff parser as the document changes.
+
+    The diff parser modifies the module in place, so unlike Document.parso_tree it's private to
+    the folding plugin. parso's diff cache holds it under a path of the plugin's own, as jedi diff
+    parses the document's path. It also remembers the folding ranges of each top level node, which
+    the diff parser carries over from one version to the next when their lines didn't change.
+    """
+
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self._grammar = parso.load_grammar()
+        self._path = path
+        self._generation = 0
+        self._module = None
+        self.node_ranges = {}
+
+    def parse(self, program):
+        try:
+            module = self._parse(program)
+        except Exception:  # pylint: disable=broad-except
+            log.exception('Failed to update the parse incrementally, parsing it again')
+            # Under a new path, parso starts over from a full parse
+            self._generation += 1
+            module = self._parse(program)
+        if module is not self._module:
+            self._module = module
+            self.node_ranges = {}
+        return module
+
+    def _parse(self, program):
+        path = '{}#folding{}'.format(self._path, self._generation)
+        return self._grammar.parse(program, path=path, diff_cache=True, cache=False)
+
 
 @hookimpl
 def pyls_folding_range(document):
     program = document.source + '\n'
     lines = program.splitlines()
-    tree = parso.parse(program)
-    ranges = __compute_folding_ranges(tree, lines)
+
+    with _parses_lock:
+        parse = _parses.get(document.uri)
+        if parse is None:
+            parse = _parses[document.uri] = IncrementalParse(document.path)
+    with parse.lock:
+        tree = parse.parse(program)
+        ranges = __compute_folding_ranges(tree, lines, parse.node_ranges)
 
     results = []
     for (start_line, end_line) in ranges:
@@ -41,10 +92,12 @@ def __merge_folding_ranges(left, right):
     return left
 
 
+# The identation stacks below keep their innermost level last
+
 def __empty_identation_stack(identation_stack, level_limits,
                              current_line, folding_ranges):
-    while identation_stack != []:
-        upper_level = identation_stack.pop(0)
+    while identation_stack:
+        upper_level = identation_stack.pop()
         level_start = level_limits.pop(upper_level)
         folding_ranges.append((level_start, current_line))
     return folding_ranges
@@ -52,12 +105,10 @@ def __empty_identation_stack(identation_stack, level_limits,
 
 def __match_identation_stack(identation_stack, level, level_limits,
                              folding_ranges, current_line):
-    upper_level = identation_stack.pop(0)
-    while upper_level >= level:
+    while identation_stack[-1] >= level:
+        upper_level = identation_stack.pop()
         level_start = level_limits.pop(upper_level)
         folding_ranges.append((level_start, current_line))
-        upper_level = identation_stack.pop(0)
-    identation_stack.insert(0, upper_level)
     return identation_stack, folding_ranges
 
 
@@ -80,7 +131,7 @@ def __compute_folding_ranges_identation(text):
             level = len(whitespace)
             if level > current_level:
                 level_limits[current_level] = current_line
-                identation_stack.insert(0, current_level)
+                identation_stack.append(current_level)
                 current_level = level
             elif level < current_level:
                 identation_stack, folding_ranges = __match_identation_stack(
@@ -111,14 +162,10 @@ def __check_if_node_is_valid(node):
 
 
 def __handle_skip(stack, skip):
+    # The range of a flow statement ends with its body, which stays on the stack to be visited
     body = stack[skip]
-    children = [body]
-    if hasattr(body, 'children'):
-        children = body.children
-    stack = stack[:skip] + children + stack[skip + 1:]
-    node = body
     end_line, _ = body.end_pos
-    return node, end_line
+    return body, end_line
 
 
 def __handle_flow_nodes(node, end_line, stack):
@@ -137,14 +184,14 @@ def __handle_flow_nodes(node, end_line, stack):
             node, end_line = __handle_skip(stack, 4)
         elif node.value in {'else'}:
             node, end_line = __handle_skip(stack, 1)
-    return end_line, from_keyword, node, stack
+    return end_line, from_keyword, node
 
 
 def __compute_start_end_lines(node, stack):
     start_line, _ = node.start_pos
     end_line, _ = node.end_pos
     modified = False
-    end_line, from_keyword, node, stack = __handle_flow_nodes(
+    end_line, from_keyword, node = __handle_flow_nodes(
         node, end_line, stack)
 
     last_leaf = node.get_last_leaf()
@@ -158,7 +205,7 @@ def __compute_start_end_lines(node, stack):
     if isinstance(node.parent, tree_nodes.PythonNode) and not from_keyword:
         kind = node.type
         if kind in {'suite', 'atom', 'atom_expr', 'arglist'}:
-            if len(stack) > 0:
+            if stack:
                 next_node = stack[0]
                 next_line, _ = next_node.start_pos
                 if next_line > end_line:
@@ -166,15 +213,70 @@ def __compute_start_end_lines(node, stack):
                     modified = True
     if not last_newline and not modified and not last_operator:
         end_line += 1
-    return start_line, end_line, stack
+    return start_line, end_line
+
 
+def __compute_folding_ranges(tree, lines, node_ranges=None):
+    """Compute the folding ranges of tree, one top level node at a time.
 
-def __compute_folding_ranges(tree, lines):
+    node_ranges remembers the ranges of each top level node, relative to its first line. They are
+    reused for as long as the node, its lines and the line the node after it starts on stay the
+    same. The lines are compared too, as the diff parser sometimes extends an existing node.
+    """
     folding_ranges = {}
-    stack = [tree]
+    nodes = tree.children if isinstance(tree, tree_nodes.Module) else [tree]
+    previous_ranges = node_ranges.copy() if node_ranges is not None else {}
+    if node_ranges is not None:
+        node_ranges.clear()
 
-    while len(stack) > 0:
-        node = stack.pop(0)
+    for index, node in enumerate(nodes):
+        next_node = nodes[index + 1] if index + 1 < len(nodes) else None
+        ranges, complete = __relative_folding_ranges(node, next_node, lines, previous_ranges, node_ranges)
+        start_line = node.start_pos[0]
+        for start, end in ranges:
+            start, end = start + start_line, end + start_line
+            folding_ranges[start] = max(folding_ranges.get(start, -1), end)
+        if not complete:
+            break
+
+    folding_ranges = sorted(folding_ranges.items())
+    return folding_ranges
+
+
+def __relative_folding_ranges(node, next_node, lines, previous_ranges, node_ranges):
+    """Return the folding ranges of a top level node relative to its first line, and whether they're complete."""
+    start_line = node.start_pos[0]
+    next_offset = next_node.start_pos[0] - start_line if next_node is not None else None
+    node_lines = lines[start_line - 1:node.end_pos[0]]
+
+    cached = previous_ranges.get(id(node))
+    if cached is not None and cached[0] is node and cached[1] == next_offset and cached[2] == node_lines:
+        if node_ranges is not None:
+            node_ranges[id(node)] = cached
+        return cached[3], True
+
+    tail = [next_node] if next_node is not None else []
+    node_folding_ranges, complete = __compute_node_folding_ranges(node, tail, lines)
+    ranges = tuple((start - start_line, end - start_line) for start, end in node_folding_ranges.items())
+    if complete and node_ranges is not None:
+        node_ranges[id(node)] = (node, next_offset, node_lines, ranges)
+    return ranges, complete
+
+
+def __compute_node_folding_ranges(node, tail, lines):
+    """Compute the folding ranges of node, followed by the nodes in tail.
+
+    Returns the ranges, and whether the node was complete rather than containing a syntax error,
+    in which case the ranges from there on until the end of the file come from the indentation.
+    """
+    folding_ranges = {}
+    # Nodes left to visit in order, next one first
+    stack = collections.deque(tail)
+    stack.appendleft(node)
+
+    while len(stack) > len(tail):
+        _utils.raise_if_cancelled()
+        node = stack.popleft()
         if isinstance(node, tree_nodes.Newline):
             # Skip newline nodes
             continue
@@ -187,17 +289,16 @@ def __compute_folding_ranges(tree, lines):
             identation_ranges = __compute_folding_ranges_identation(text)
             folding_ranges = __merge_folding_ranges(
                 folding_ranges, identation_ranges)
-            break
+            return folding_ranges, False
         elif not isinstance(node, SKIP_NODES):
             valid = __check_if_node_is_valid(node)
             if valid:
-                start_line, end_line, stack = __compute_start_end_lines(
+                start_line, end_line = __compute_start_end_lines(
                     node, stack)
                 if end_line > start_line:
                     current_end = folding_ranges.get(start_line, -1)
                     folding_ranges[start_line] = max(current_end, end_line)
         if hasattr(node, 'children'):
-            stack = node.children + stack
+            stack.extendleft(reversed(node.children))
 
-    folding_ranges = sorted(folding_ranges.items())
-    return folding_ranges
+    return folding_ranges, True
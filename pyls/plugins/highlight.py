@@ -18,8 +18,8 @@ def pyls_document_highlight(document, position):
 
     return [{
         'range': {
-            'start': {'line': d.line - 1, 'character': d.column},
-            'end': {'line': d.line - 1, 'character': d.column + len(d.name)}
+            'start': document.position_to_utf16({'line': d.line - 1, 'character': d.column}),
+            'end': document.position_to_utf16({'line': d.line - 1, 'character': d.column + len(d.name)})
         },
         'kind': lsp.DocumentHighlightKind.Write if d.is_definition() else lsp.DocumentHighlightKind.Read
     } for d in usages if is_valid(d) and local_to_document(d)]
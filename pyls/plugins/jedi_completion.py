@@ -138,6 +138,8 @@ def use_snippets(document, position):
 
 
 def _format_completion(d, include_params=True):
+    # Resolving docstrings and signatures is slow, so stop as soon as the client no longer wants them
+    _utils.raise_if_cancelled()
     completion = {
         'label': _label(d),
         'kind': _TYPE_MAP.get(d.type),
@@ -1,5 +1,4 @@
 # Copyright 2017 Palantir Technologies, Inc.
-import ast
 import logging
 import mccabe
 from pyls import hookimpl, lsp
@@ -16,7 +15,7 @@ def pyls_lint(config, document):
     log.debug("Running mccabe lint with threshold: %s", threshold)
 
     try:
-        tree = compile(document.source, document.path, "exec", ast.PyCF_ONLY_AST)
+        tree = document.ast_tree
     except SyntaxError:
         # We'll let the other linters point this one out
         return None
@@ -1,7 +1,11 @@
 # Copyright 2017 Palantir Technologies, Inc.
+import bisect
+import json
 import logging
+import threading
+
 import pycodestyle
-from pyls import hookimpl, lsp
+from pyls import hookimpl, lsp, _utils
 
 try:
     from autopep8 import continued_indentation as autopep8_c_i
@@ -17,6 +21,15 @@ else:
 
 log = logging.getLogger(__name__)
 
+# How many logical lines' results to remember for each set of options
+LOGICAL_LINE_CACHE_SIZE = 50000
+
+# Checks depending on more than their logical line and the state before it, which always run
+_UNCACHEABLE_ARGUMENTS = {'lines', 'line_number', 'total_lines', 'checker_state'}
+
+_styleguides = {}
+_styleguides_lock = threading.Lock()
+
 
 @hookimpl
 def pyls_lint(workspace, document):
@@ -33,18 +46,127 @@ def pyls_lint(workspace, document):
         'select': settings.get('select'),
     }
     kwargs = {k: v for k, v in opts.items() if v}
-    styleguide = pycodestyle.StyleGuide(kwargs)
+    styleguide, logical_line_cache = _get_styleguide(kwargs)
 
-    c = pycodestyle.Checker(
-        filename=document.uri, lines=document.lines, options=styleguide.options,
-        report=PyCodeStyleDiagnosticReport(styleguide.options)
-    )
+    # The checker strips a BOM from the first line in place, so give it a copy of the document's lines
+    checker_kwargs = {
+        'filename': document.uri, 'lines': list(document.lines), 'options': styleguide.options,
+        'report': PyCodeStyleDiagnosticReport(styleguide.options)
+    }
+    if settings.get('incremental'):
+        c = IncrementalChecker(cache=logical_line_cache, **checker_kwargs)
+    else:
+        c = pycodestyle.Checker(**checker_kwargs)
     c.check_all()
     diagnostics = c.report.diagnostics
 
     return diagnostics
 
 
+def _get_styleguide(kwargs):
+    """Return the StyleGuide for these options, and the logical line cache of checkers using it.
+
+    Building a StyleGuide parses its options and collects the registered checks, so reuse it for
+    as long as the settings stay the same.
+    """
+    key = json.dumps(kwargs, sort_keys=True)
+    with _styleguides_lock:
+        if key not in _styleguides:
+            _styleguides[key] = (pycodestyle.StyleGuide(kwargs), _utils.LRUCache(LOGICAL_LINE_CACHE_SIZE))
+        return _styleguides[key]
+
+
+class IncrementalChecker(pycodestyle.Checker):
+    """A Checker that remembers the results of the logical line checks.
+
+    The results of a logical line only depend on its tokens and on a little state left behind by
+    the lines before it (the previous logical line, the indentation level, ...), so they're cached
+    under those, with line numbers relative to the logical line. After an edit only the logical
+    lines around the change miss the cache and are checked again. Tokenizing and the physical line
+    checks still cover the whole file, as do the few checks that look at other lines of the file.
+    """
+
+    # Like pycodestyle.Checker, this keeps the state of the lines checked so far outside of __init__
+    # pylint: disable=attribute-defined-outside-init
+
+    def __init__(self, *args, **kwargs):
+        self._cache = kwargs.pop('cache')
+        super(IncrementalChecker, self).__init__(*args, **kwargs)
+
+        self._cacheable = set()
+        context = set()
+        for index, (_name, _check, argument_names) in enumerate(self._logical_checks):
+            if not _UNCACHEABLE_ARGUMENTS.intersection(argument_names):
+                self._cacheable.add(index)
+                context.update(argument_names)
+        context.discard('tokens')
+        self._context_names = sorted(context)
+
+    def check_logical(self):
+        """Build a line from tokens and run the logical checks whose results aren't cached."""
+        self.report.increment_logical_line()
+        mapping = self.build_tokens_line()
+        if not mapping:
+            return
+
+        (start_row, start_col) = mapping[0][1]
+        start_line = self.lines[start_row - 1]
+        self.indent_level = pycodestyle.expand_indent(start_line[:start_col])
+        if self.blank_before < self.blank_lines:
+            self.blank_before = self.blank_lines
+
+        first_row = self.tokens[0][2][0]
+        key = self._cache_key(first_row)
+        cached = self._cache.get(key)
+        results = self._run_logical_checks(mapping, first_row, skip_cacheable=cached is not None)
+        if cached is None:
+            self._cache[key] = tuple(result for result in results if result[0] in self._cacheable)
+        else:
+            # Keep reporting in the order of the checks
+            results = sorted(results + list(cached), key=lambda result: result[0])
+
+        for index, row, col, text in results:
+            self.report_error(first_row + row, col, text, self._logical_checks[index][1])
+
+        if self.logical_line:
+            self.previous_indent_level = self.indent_level
+            self.previous_logical = self.logical_line
+            if not self.indent_level:
+                self.previous_unindented_logical_line = self.logical_line
+        self.blank_lines = 0
+        self.tokens = []
+
+    def _cache_key(self, first_row):
+        tokens = tuple(
+            (token_type, text, (start[0] - first_row, start[1]), (end[0] - first_row, end[1]), line)
+            for token_type, text, start, end, line in self.tokens
+        )
+        # noqa holds a match object, of which the checks only care whether there is one
+        context = tuple(
+            bool(self.noqa) if name == 'noqa' else getattr(self, name) for name in self._context_names
+        )
+        return tokens, context
+
+    def _run_logical_checks(self, mapping, first_row, skip_cacheable):
+        """Run the logical checks, returning their results as (check index, row relative to first_row, col, text)."""
+        mapping_offsets = [offset for offset, _ in mapping]
+        results = []
+        for index, (name, check, argument_names) in enumerate(self._logical_checks):
+            if skip_cacheable and index in self._cacheable:
+                continue
+            self.init_checker_state(name, argument_names)
+            for row, col, text in self._run_logical_check(check, argument_names, mapping, mapping_offsets):
+                results.append((index, row - first_row, col, text))
+        return results
+
+    def _run_logical_check(self, check, argument_names, mapping, mapping_offsets):
+        for offset, text in self.run_check(check, argument_names) or ():
+            if not isinstance(offset, tuple):
+                token_offset, pos = mapping[bisect.bisect_left(mapping_offsets, offset)]
+                offset = (pos[0], pos[1] + offset - token_offset)
+            yield offset[0], offset[1], text
+
+
 class PyCodeStyleDiagnosticReport(pycodestyle.BaseReport):
 
     def __init__(self, options):
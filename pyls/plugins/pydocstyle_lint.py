@@ -4,6 +4,7 @@ import logging
 import os
 import re
 import sys
+import threading
 
 import pydocstyle
 from pyls import hookimpl, lsp
@@ -17,6 +18,9 @@ pydocstyle_logger.setLevel(logging.INFO)
 DEFAULT_MATCH_RE = pydocstyle.config.ConfigurationParser.DEFAULT_MATCH_RE
 DEFAULT_MATCH_DIR_RE = pydocstyle.config.ConfigurationParser.DEFAULT_MATCH_DIR_RE
 
+# pydocstyle reads its arguments from sys.argv, which documents linted concurrently would fight over
+_ARGV_LOCK = threading.Lock()
+
 
 @hookimpl
 def pyls_settings():
@@ -57,7 +61,7 @@ def pyls_lint(config, document):
     log.info("Using pydocstyle args: %s", args)
 
     conf = pydocstyle.config.ConfigurationParser()
-    with _patch_sys_argv(args):
+    with _ARGV_LOCK, _patch_sys_argv(args):
         # TODO(gatesn): We can add more pydocstyle args here from our pyls config
         conf.parse()
 
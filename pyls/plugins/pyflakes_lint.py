@@ -1,5 +1,5 @@
 # Copyright 2017 Palantir Technologies, Inc.
-from pyflakes import api as pyflakes_api, messages
+from pyflakes import checker, messages
 from pyls import hookimpl, lsp
 
 # Pyflakes messages that should be reported as Errors instead of Warns
@@ -21,10 +21,32 @@ PYFLAKES_ERROR_MESSAGES = (
 @hookimpl
 def pyls_lint(document):
     reporter = PyflakesDiagnosticReport(document.lines)
-    pyflakes_api.check(document.source.encode('utf-8'), document.path, reporter=reporter)
+    _check(document, reporter)
     return reporter.diagnostics
 
 
+def _check(document, reporter):
+    """Report the document's flakes, like pyflakes.api.check but reusing the document's parse."""
+    try:
+        tree = document.ast_tree
+    except SyntaxError as e:
+        # If there's an encoding problem with the file, the text is None
+        if e.text is None:
+            reporter.unexpectedError(document.path, 'problem decoding source')
+        else:
+            offset = e.offset - 1 if checker.PYPY and e.offset else e.offset
+            reporter.syntaxError(document.path, e.args[0], e.lineno, offset, e.text)
+        return
+    except Exception:  # pylint: disable=broad-except
+        reporter.unexpectedError(document.path, 'problem decoding source')
+        return
+
+    w = checker.Checker(tree, file_tokens=document.tokens, filename=document.path)
+    w.messages.sort(key=lambda m: m.lineno)
+    for warning in w.messages:
+        reporter.flake(warning)
+
+
 class PyflakesDiagnosticReport(object):
 
     def __init__(self, lines):
@@ -1,13 +1,16 @@
 # Copyright 2018 Google LLC.
 """Linter plugin for pylint."""
 import collections
+import io
 import logging
+import os
 import sys
 import re
+import threading
 from subprocess import Popen, PIPE
 
 from pylint.epylint import py_run
-from pyls import hookimpl, lsp
+from pyls import hookimpl, lsp, _utils, _worker
 
 try:
     import ujson as json
@@ -16,6 +19,13 @@ except Exception:  # pylint: disable=broad-except
 
 log = logging.getLogger(__name__)
 
+# Persistent mode keeps pylint running between lints, so that astroid's module cache stays warm
+PERSISTENT_WORKERS = 1
+PERSISTENT_TIMEOUT_S = 60
+PERSISTENT_MAX_RSS = 1024 * 1024 * 1024  # restart a worker once it has used 1 GiB
+_worker_pool = None
+_worker_pool_lock = threading.Lock()
+
 
 class PylintLinter(object):
     last_diags = collections.defaultdict(list)
@@ -161,6 +171,9 @@ def pyls_settings():
         'args': [],
         # disabled by default as it can slow down the workflow
         'executable': None,
+        'persistent': False,
+        # publish the diagnostics of the fast linters without waiting for pylint
+        'lintTier': 'slow',
     }}}
 
 
@@ -171,6 +184,8 @@ def pyls_lint(config, document, is_saved):
     log.debug("Got pylint settings: %s", settings)
     # pylint >= 2.5.0 is required for working through stdin and only
     # available with python3
+    if settings.get('persistent') and sys.version_info[0] >= 3:
+        return pylint_lint_persistent(document, build_args_stdio(settings))
     if settings.get('executable') and sys.version_info[0] >= 3:
         flags = build_args_stdio(settings)
         pylint_executable = settings.get('executable', 'pylint')
@@ -240,12 +255,102 @@ def _run_pylint_stdio(pylint_executable, document, flags):
         cmd.extend(flags)
         cmd.extend(['--from-stdin', document.path])
         p = Popen(cmd, stdin=PIPE, stdout=PIPE, stderr=PIPE)
-    (stdout, stderr) = p.communicate(document.source.encode())
+    with _utils.kill_on_cancel(p):
+        (stdout, stderr) = p.communicate(document.source.encode())
     if stderr:
         log.error("Error while running pylint '%s'", stderr.decode())
     return stdout.decode()
 
 
+def pylint_lint_persistent(document, flags):
+    """Run pylint linter in a long-lived worker process.
+
+    The worker runs the pylint installed alongside the language server and lints the document's
+    source like pylint_lint_stdin does, without paying for pylint's startup on every lint.
+
+    :param document: document to run pylint on
+    :type document: pyls.workspace.Document
+    :param flags: arguments to path to pylint
+    :type flags: list
+
+    :return: linting diagnostics
+    :rtype: list
+    """
+    global _worker_pool  # pylint: disable=global-statement
+    with _worker_pool_lock:
+        if _worker_pool is None:
+            _worker_pool = _worker.WorkerPool(
+                __name__ + ':_lint_in_worker', size=PERSISTENT_WORKERS, max_rss=PERSISTENT_MAX_RSS
+            )
+
+    log.debug("Calling persistent pylint with args: '%s'", flags)
+    params = {'args': flags, 'path': document.path, 'source': document.source}
+    try:
+        stdout = _worker_pool.request(params, timeout=PERSISTENT_TIMEOUT_S)
+    except _worker.WorkerError as e:
+        log.error("Error while running pylint '%s'", e)
+        return []
+    return _parse_pylint_stdio_result(document, stdout)
+
+
+# Modification times of the files of the modules in astroid's cache, when they were cached
+_module_mtimes = {}
+
+
+def _lint_in_worker(params):
+    """Lint params['source'] as if it was the file at params['path'], inside the pylint worker."""
+    from pylint.lint import Run
+    from pylint.reporters.text import TextReporter
+
+    _forget_changed_modules(params['path'])
+
+    output = io.StringIO()
+    stdin = sys.stdin
+    # pylint --from-stdin detaches the underlying buffer of sys.stdin
+    sys.stdin = io.TextIOWrapper(io.BytesIO(params['source'].encode('utf-8')), encoding='utf-8')
+    try:
+        Run(list(params['args']) + ['--from-stdin', params['path']], reporter=TextReporter(output), exit=False)
+    except SystemExit as e:
+        # Don't let bad arguments take the worker down with them
+        raise RuntimeError('pylint exited with {}'.format(e.code))
+    finally:
+        sys.stdin = stdin
+        _remember_module_mtimes()
+    return output.getvalue()
+
+
+def _cached_module_files():
+    """Yield the name, file and modification time of the modules in astroid's cache that have a file."""
+    import astroid
+
+    for name, module in list(astroid.MANAGER.astroid_cache.items()):
+        filename = getattr(module, 'file', None)
+        if not filename:
+            continue
+        try:
+            mtime = os.path.getmtime(filename)
+        except OSError:
+            mtime = None
+        yield name, filename, mtime
+
+
+def _remember_module_mtimes():
+    """Record the modification times of the modules astroid cached during the last lint."""
+    for name, _filename, mtime in _cached_module_files():
+        _module_mtimes.setdefault(name, mtime)
+
+
+def _forget_changed_modules(path):
+    """Drop the linted module, and modules whose files changed since they were cached, from astroid's cache."""
+    import astroid
+
+    cache = astroid.MANAGER.astroid_cache
+    for name, filename, mtime in _cached_module_files():
+        if filename == path or _module_mtimes.get(name) != mtime:
+            cache.pop(name, None)
+            _module_mtimes.pop(name, None)
+
+
 def _parse_pylint_stdio_result(document, stdout):
     """Parse pylint results.
 
@@ -1,24 +1,99 @@
 # Copyright 2017 Palantir Technologies, Inc.
 import logging
+
 from pyls import hookimpl, uris, _utils
 
 log = logging.getLogger(__name__)
 
 
 @hookimpl
-def pyls_references(document, position, exclude_declaration=False):
+def pyls_references(workspace, document, position, exclude_declaration, on_partial):
     code_position = _utils.position_to_jedi_linecolumn(document, position)
-    usages = document.jedi_script().get_references(**code_position)
-
-    if exclude_declaration:
-        # Filter out if the usage is the actual declaration of the thing
-        usages = [d for d in usages if not d.is_definition()]
-
-    # Filter out builtin modules
-    return [{
-        'uri': uris.uri_with(document.uri, path=str(d.module_path)) if d.module_path else document.uri,
-        'range': {
-            'start': {'line': d.line - 1, 'character': d.column},
-            'end': {'line': d.line - 1, 'character': d.column + len(d.name)}
-        }
-    } for d in usages if not d.in_builtin_module()]
+    script = document.jedi_script()
+    batches = _indexed_references(workspace, document, script, **code_position)
+    if batches is None:
+        batches = [script.get_references(**code_position)]
+
+    references = []
+    for usages in batches:
+        if exclude_declaration:
+            # Filter out if the usage is the actual declaration of the thing
+            usages = [d for d in usages if not d.is_definition()]
+
+        # Filter out builtin modules
+        locations = [{
+            'uri': uris.uri_with(document.uri, path=str(d.module_path)) if d.module_path else document.uri,
+            'range': {
+                'start': {'line': d.line - 1, 'character': d.column},
+                'end': {'line': d.line - 1, 'character': d.column + len(d.name)}
+            }
+        } for d in usages if not d.in_builtin_module()]
+
+        if on_partial is None:
+            references.extend(locations)
+        elif locations:
+            on_partial(locations)
+    return references
+
+
+def _indexed_references(workspace, document, script, line, column):
+    """Find references in the document, then in the files that the workspace index says use the name.
+
+    Returns an iterator over lists of references, a file at a time, or None if the index can't tell
+    where to look: it's still being built, or the name is defined outside of it.
+    """
+    index = workspace.index
+    if not index.wait(0):
+        return None
+    definitions = script.goto(line, column, follow_imports=True)
+    if not definitions:
+        return None
+    for definition in definitions:
+        path = str(definition.module_path) if definition.module_path else None
+        if definition.in_builtin_module() or path is None or (path != document.path and not index.covers(path)):
+            return None
+    return _confirm_references(workspace, document, script, line, column, definitions)
+
+
+def _confirm_references(workspace, document, script, line, column, definitions):
+    in_document = script.get_references(line, column, scope='file')
+    yield in_document
+
+    # Imports may give the name another one in other files
+    names = set(d.name for d in definitions) | set(r.name for r in in_document)
+    defining_paths = sorted(set(str(d.module_path) for d in definitions) - {document.path})
+    candidate_paths = []
+    # The names of parameters can only be used where they're defined
+    if not any(d.type == 'param' for d in definitions):
+        candidate_paths = set()
+        for name in names:
+            candidate_paths |= workspace.index.files_using(name)
+        candidate_paths = sorted(candidate_paths - set(defining_paths) - {document.path})
+
+    keys = set(_key(d) for d in definitions)
+    for path in defining_paths + candidate_paths:
+        _utils.raise_if_cancelled()
+        yield _file_references(workspace, path, names, keys)
+
+
+def _file_references(workspace, path, names, definition_keys):
+    """Return the references in the file at path to any of the names that go to one of definition_keys."""
+    try:
+        # Another request may be using the shared Script of an open document
+        script = workspace.get_document(uris.from_fs_path(path)).jedi_script(shared=False)
+    except (IOError, OSError):
+        return []
+
+    found = {}
+    for name in script.get_names(all_scopes=True, definitions=True, references=True):
+        if name.name not in names or _key(name) in found:
+            continue
+        if any(_key(d) in definition_keys for d in name.goto(follow_imports=True)):
+            # Jedi finds the other references in the file that are bound to the same name
+            for ref in script.get_references(name.line, name.column, scope='file'):
+                found.setdefault(_key(ref), ref)
+    return sorted(found.values(), key=_key)
+
+
+def _key(name):
+    return str(name.module_path), name.line, name.column
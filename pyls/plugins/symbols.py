@@ -2,22 +2,151 @@
 import logging
 import os
 
-from pyls import hookimpl
+from pyls import hookimpl, _utils
 from pyls.lsp import SymbolKind
 
 log = logging.getLogger(__name__)
 
 
+# Nodes opening a new scope for the names defined in them
+_HEADER_SCOPE_TYPES = ('classdef', 'funcdef', 'lambdef')
+_SCOPE_TYPES = _HEADER_SCOPE_TYPES + ('sync_comp_for', 'comp_for')
+_IMPORT_TYPES = ('import_name', 'import_from')
+
+
 @hookimpl
 def pyls_document_symbols(config, document):
-    # pylint: disable=broad-except
-    # pylint: disable=too-many-nested-blocks
-    # pylint: disable=too-many-locals
-    # pylint: disable=too-many-branches
     symbols_settings = config.plugin_settings('jedi_symbols')
     all_scopes = symbols_settings.get('all_scopes', True)
     add_import_symbols = symbols_settings.get('include_import_symbols', True)
 
+    if not add_import_symbols:
+        # Telling imported names apart from our own means resolving them, which takes jedi
+        return _jedi_document_symbols(document, all_scopes, add_import_symbols)
+
+    symbol_capabilities = config.capabilities.get('textDocument', {}).get('documentSymbol', {})
+    hierarchical = symbol_capabilities.get('hierarchicalDocumentSymbolSupport', False)
+    return _parso_document_symbols(document, all_scopes, hierarchical)
+
+
+def _parso_document_symbols(document, all_scopes, hierarchical):
+    """Collect the document's symbols from its parso tree, without any inference.
+
+    Returns hierarchical DocumentSymbols when the client supports them, and SymbolInformation
+    with a containerName otherwise.
+    """
+    tree = document.parso_tree
+    names = sorted(
+        (name for names in tree.get_used_names().values() for name in names if name.is_definition()),
+        key=lambda name: name.start_pos
+    )
+
+    symbols = []
+    # The symbols of the classes and functions seen so far, by their node
+    scope_symbols = {}
+    for name in names:
+        _utils.raise_if_cancelled()
+        definition = name.get_definition()
+        # Don't tend to include parameters as symbols, and unused vars should also be skipped
+        if definition.type == 'param' or name.value == '_':
+            continue
+
+        scope = _parent_scope(name)
+        if not all_scopes and not _in_module_namespace(scope):
+            continue
+
+        symbol = {
+            'name': name.value,
+            'kind': _parso_kind(name, definition, scope),
+        }
+        if hierarchical:
+            symbol['range'] = _node_range(definition)
+            symbol['selectionRange'] = _node_range(name)
+            symbol['children'] = []
+            parent = _enclosing_symbol(scope, scope_symbols)
+            (parent['children'] if parent is not None else symbols).append(symbol)
+        else:
+            symbol['location'] = {'uri': document.uri, 'range': _node_range(definition)}
+            symbol['containerName'] = _container_name(scope)
+            symbols.append(symbol)
+
+        if definition.type in ('classdef', 'funcdef'):
+            scope_symbols[definition] = symbol
+    return symbols
+
+
+def _parent_scope(name):
+    """The node whose scope name is defined in.
+
+    Like in Python itself, the name, decorators and defaults of a class or function belong
+    to the scope around it, while its parameters belong to the function.
+    """
+    node = name.parent
+    while node.type != 'file_input':
+        if node.type in _SCOPE_TYPES:
+            # The colon separates the header of a class or function from its body
+            in_header = node.type in _HEADER_SCOPE_TYPES and node.children[-2].start_pos >= name.start_pos
+            if not in_header or name.parent.type == 'param':
+                return node
+        node = node.parent
+    return node
+
+
+def _in_module_namespace(scope):
+    """Whether names in scope are reachable from the module, through classes only."""
+    while scope.type == 'classdef':
+        scope = _parent_scope(scope.name)
+    return scope.type == 'file_input'
+
+
+def _enclosing_symbol(scope, scope_symbols):
+    while scope.type != 'file_input':
+        if scope in scope_symbols:
+            return scope_symbols[scope]
+        scope = scope.parent
+    return None
+
+
+def _container_name(scope):
+    while scope.type not in ('classdef', 'funcdef', 'file_input'):
+        scope = scope.parent
+    return scope.name.value if scope.type != 'file_input' else None
+
+
+def _parso_kind(name, definition, scope):
+    if definition.type == 'classdef':
+        return SymbolKind.Class
+    if definition.type == 'funcdef':
+        return SymbolKind.Method if scope.type == 'classdef' else SymbolKind.Function
+    if definition.type in _IMPORT_TYPES:
+        return SymbolKind.Module
+    if scope.type == 'classdef' or _is_self_attribute(name):
+        return SymbolKind.Field
+    return SymbolKind.Variable
+
+
+def _is_self_attribute(name):
+    trailer = name.parent
+    if trailer.type != 'trailer' or trailer.children[0] != '.':
+        return False
+    first = trailer.parent.children[0]
+    return first.type == 'name' and first.value == 'self'
+
+
+def _node_range(node):
+    (start_line, start_column) = node.start_pos
+    (end_line, end_column) = node.end_pos
+    return {
+        'start': {'line': start_line - 1, 'character': start_column},
+        'end': {'line': end_line - 1, 'character': end_column}
+    }
+
+
+def _jedi_document_symbols(document, all_scopes, add_import_symbols):
+    # pylint: disable=broad-except
+    # pylint: disable=too-many-nested-blocks
+    # pylint: disable=too-many-locals
+    # pylint: disable=too-many-branches
     use_document_path = False
     document_dir = os.path.normpath(os.path.dirname(document.path))
     if not os.path.isfile(os.path.join(document_dir, '__init__.py')):
@@ -29,6 +158,7 @@ def pyls_document_symbols(config, document):
     exclude = set({})
     redefinitions = {}
     while definitions != []:
+        _utils.raise_if_cancelled()
         d = definitions.pop(0)
         if not add_import_symbols:
             sym_full_name = d.full_name
@@ -52,7 +182,7 @@ def pyls_document_symbols(config, document):
 
             symbol = {
                 'name': d.name,
-                'containerName': _container(d),
+                'containerName': _container(document, d),
                 'location': {
                     'uri': document.uri,
                     'range': _range(d),
@@ -87,7 +217,25 @@ def _include_def(definition):
     )
 
 
-def _container(definition):
+def _container(document, definition):
+    """The name of the class or function the definition is in, found in the document's parse."""
+    try:
+        leaf = document.parso_tree.get_leaf_for_position((definition.line, definition.column))
+    except ValueError:
+        leaf = None
+    if leaf is None or leaf.type != 'name' or leaf.value != definition.name:
+        return _jedi_container(definition)
+
+    node = leaf.parent
+    if node.type in ('funcdef', 'classdef') and node.name is leaf:
+        # The scope a class or function defines isn't its container
+        node = node.parent
+    while node is not None and node.type not in ('funcdef', 'classdef'):
+        node = node.parent
+    return node.name.value if node is not None else None
+
+
+def _jedi_container(definition):
     try:
         # Jedi sometimes fails here.
         parent = definition.parent()
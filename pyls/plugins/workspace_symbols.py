@@ -0,0 +1,37 @@
+# Copyright 2017 Palantir Technologies, Inc.
+import logging
+
+from pyls import hookimpl, uris
+
+log = logging.getLogger(__name__)
+
+# Editors show the best matches and refine the query rather than scroll through thousands of symbols
+MAX_RESULTS = 500
+
+
+@hookimpl
+def pyls_initialize(workspace):
+    # Build the index in the background so that it's ready by the first search
+    workspace.index  # pylint: disable=pointless-statement
+
+
+@hookimpl
+def pyls_workspace_symbols(workspace, query):
+    symbols = []
+    for symbol in workspace.index.search(query, limit=MAX_RESULTS):
+        (start_line, start_column, end_line, end_column) = symbol.range
+        info = {
+            'name': symbol.name,
+            'kind': symbol.kind,
+            'location': {
+                'uri': uris.from_fs_path(symbol.path),
+                'range': {
+                    'start': {'line': start_line, 'character': start_column},
+                    'end': {'line': end_line, 'character': end_column},
+                },
+            },
+        }
+        if symbol.container is not None:
+            info['containerName'] = symbol.container
+        symbols.append(info)
+    return symbols
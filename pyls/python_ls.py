@@ -1,15 +1,21 @@
 # Copyright 2017 Palantir Technologies, Inc.
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from functools import partial
+import hashlib
+import json
 import logging
 import os
 import socketserver
 import threading
+import weakref
 
+from pluggy import HookCallError
 from pyls_jsonrpc.dispatchers import MethodDispatcher
 from pyls_jsonrpc.endpoint import Endpoint
+from pyls_jsonrpc.exceptions import JsonRpcRequestCancelled
 from pyls_jsonrpc.streams import JsonRpcStreamReader, JsonRpcStreamWriter
 
-from . import lsp, _utils, uris
+from . import lsp, _daemon, _utils, scheduler, uris
 from .config import config
 from .workspace import Workspace
 
@@ -19,9 +25,35 @@ log = logging.getLogger(__name__)
 LINT_DEBOUNCE_S = 0.5  # 500 ms
 PARENT_PROCESS_WATCH_INTERVAL = 10  # 10 s
 MAX_WORKERS = 64
+LINT_CACHE_SIZE = 256  # diagnostics of one plugin for one version of a document
+MAX_LINT_WORKERS = 8
+# Results of read-only requests for unchanged documents, bounded by the size of their JSON
+RESULT_CACHE_BYTES = 32 * 1024 * 1024
+
+# Diagnostics of fast linters are published before the slow ones have finished
+LINT_TIER_FAST = 'fast'
+LINT_TIER_SLOW = 'slow'
 PYTHON_FILE_EXTENSIONS = ('.py', '.pyi')
 CONFIG_FILEs = ('pycodestyle.cfg', 'setup.cfg', 'tox.ini', '.flake8')
 
+# Requests computed by the scheduler rather than on the reader thread, so that they run by priority
+# and a $/cancelRequest can reach them while they run
+REQUEST_PRIORITIES = {
+    'textDocument/completion': scheduler.COMPLETION,
+    'textDocument/signatureHelp': scheduler.COMPLETION,
+    'textDocument/hover': scheduler.HOVER,
+    'textDocument/documentHighlight': scheduler.HOVER,
+    'textDocument/codeAction': scheduler.HOVER,
+    'textDocument/definition': scheduler.NAVIGATION,
+    'textDocument/references': scheduler.NAVIGATION,
+    'textDocument/documentSymbol': scheduler.SYMBOLS,
+    'textDocument/foldingRange': scheduler.SYMBOLS,
+    'textDocument/codeLens': scheduler.SYMBOLS,
+    'workspace/symbol': scheduler.SYMBOLS,
+}
+# Requests made as the user types, of which only the latest for a document is worth answering
+SUPERSEDING_REQUESTS = ('textDocument/completion', 'textDocument/signatureHelp')
+
 
 class _StreamHandlerWrapper(socketserver.StreamRequestHandler, object):
     """A wrapper class that is used to construct a custom handler class."""
@@ -45,37 +77,173 @@ class _StreamHandlerWrapper(socketserver.StreamRequestHandler, object):
                     pass
 
         # pylint: disable=no-member
-        self.SHUTDOWN_CALL()
+        self.SHUTDOWN_CALL(self.delegate)
+
+
+class SharedCaches(object):
+    """What the language servers of the clients of one process share.
+
+    Clients keep their own documents and settings, but the plugins are loaded once and diagnostics
+    are reused across clients. Jedi environments and the indexes of workspace roots are shared
+    by every Workspace of the process already.
+    """
+
+    def __init__(self):
+        self.plugin_manager = config.create_plugin_manager()
+        self.lint_cache = _utils.LRUCache(LINT_CACHE_SIZE)
+
+
+def start_tcp_lang_server(bind_addr, port, check_parent_process, handler_class, multi_client=False,
+                          idle_timeout=None):
+    """Serve handler_class over TCP.
 
+    By default clients are served one at a time. With multi_client, they are served concurrently,
+    sharing a SharedCaches, and the server keeps running as clients disconnect, for up to
+    idle_timeout seconds after the last one if given.
+    """
+    server_class = socketserver.ThreadingTCPServer if multi_client else socketserver.TCPServer
+    server = create_socket_lang_server(server_class, (bind_addr, port), check_parent_process, handler_class,
+                                       multi_client=multi_client, idle_timeout=idle_timeout)
+    _serve(server, handler_class)
+
+
+def start_unix_lang_server(socket_path, check_parent_process, handler_class, multi_client=False,
+                           idle_timeout=None):
+    """Serve handler_class on a Unix domain socket at socket_path, like start_tcp_lang_server.
+
+    Returns straight away if another server is already listening there.
+    """
+    server_class = socketserver.ThreadingUnixStreamServer if multi_client else socketserver.UnixStreamServer
+    with _daemon.socket_lock(socket_path):
+        sock = _daemon.connect(socket_path)
+        if sock is not None:
+            sock.close()
+            log.info('A language server is already listening on %s', socket_path)
+            return
+        # Left behind by a server that didn't exit cleanly
+        try:
+            os.remove(socket_path)
+        except OSError:
+            pass
 
-def start_tcp_lang_server(bind_addr, port, check_parent_process, handler_class):
+        # Only the current user may connect to the socket
+        umask = os.umask(0o077)
+        try:
+            server = create_socket_lang_server(server_class, socket_path, check_parent_process, handler_class,
+                                               multi_client=multi_client, idle_timeout=idle_timeout)
+        finally:
+            os.umask(umask)
+        socket_inode = os.stat(socket_path).st_ino
+
+    try:
+        _serve(server, handler_class)
+    finally:
+        with _daemon.socket_lock(socket_path):
+            # Unless a server that started after this one stopped listening has taken the path
+            try:
+                if os.stat(socket_path).st_ino == socket_inode:
+                    os.remove(socket_path)
+            except OSError:
+                pass
+
+
+def create_socket_lang_server(server_class, address, check_parent_process, handler_class, multi_client=False,
+                              idle_timeout=None):
+    """Return a socketserver of server_class bound to address, whose clients are served by handler_class.
+
+    With multi_client and an idle_timeout, the server shuts down once it has had no clients for
+    idle_timeout seconds.
+    """
     if not issubclass(handler_class, PythonLanguageServer):
         raise ValueError('Handler class must be an instance of PythonLanguageServer')
-
-    def shutdown_server(check_parent_process, *args):
-        # pylint: disable=unused-argument
-        if check_parent_process:
+    idle_shutdown = None
+
+    def create_delegate(rfile, wfile):
+        if idle_shutdown is not None:
+            idle_shutdown.client_connected()
+        return handler_class(rfile, wfile, **delegate_kwargs)
+
+    def shutdown_server(check_parent_process, delegate):
+        if multi_client:
+            # The client went away, whether or not it said exit
+            delegate.m_exit()
+            if idle_shutdown is not None:
+                idle_shutdown.client_disconnected()
+        elif check_parent_process:
             log.debug('Shutting down server')
             # Shutdown call must be done on a thread, to prevent deadlocks
             stop_thread = threading.Thread(target=server.shutdown)
             stop_thread.start()
 
+    delegate_kwargs = {'check_parent_process': check_parent_process}
+    if multi_client:
+        delegate_kwargs['shared'] = SharedCaches()
+
     # Construct a custom wrapper class around the user's handler_class
     wrapper_class = type(
         handler_class.__name__ + 'Handler',
         (_StreamHandlerWrapper,),
-        {'DELEGATE_CLASS': partial(handler_class,
-                                   check_parent_process=check_parent_process),
+        {'DELEGATE_CLASS': staticmethod(create_delegate),
          'SHUTDOWN_CALL': partial(shutdown_server, check_parent_process)}
     )
 
-    server = socketserver.TCPServer((bind_addr, port), wrapper_class, bind_and_activate=False)
+    server = server_class(address, wrapper_class, bind_and_activate=False)
+    server.daemon_threads = True
     server.allow_reuse_address = True
 
     try:
         server.server_bind()
         server.server_activate()
-        log.info('Serving %s on (%s, %s)', handler_class.__name__, bind_addr, port)
+    except Exception:
+        server.server_close()
+        raise
+    if multi_client and idle_timeout is not None:
+        idle_shutdown = _IdleShutdown(server, idle_timeout)
+    return server
+
+
+class _IdleShutdown(object):
+    """Shuts a server down once it has had no clients for timeout seconds."""
+
+    def __init__(self, server, timeout):
+        self._server = server
+        self._timeout = timeout
+        self._lock = threading.Lock()
+        self._clients = 0
+        self._timer = None
+        self._generation = 0
+        with self._lock:
+            self._start_timer()
+
+    def client_connected(self):
+        with self._lock:
+            self._clients += 1
+            self._timer.cancel()
+
+    def client_disconnected(self):
+        with self._lock:
+            self._clients -= 1
+            if not self._clients:
+                self._start_timer()
+
+    def _start_timer(self):
+        self._generation += 1
+        self._timer = threading.Timer(self._timeout, self._expire, args=[self._generation])
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _expire(self, generation):
+        with self._lock:
+            # A client connected in the meantime
+            if self._clients or generation != self._generation:
+                return
+        log.info('Shutting down after %s seconds without clients', self._timeout)
+        self._server.shutdown()
+
+
+def _serve(server, handler_class):
+    try:
+        log.info('Serving %s on %s', handler_class.__name__, server.server_address)
         server.serve_forever()
     finally:
         log.info('Shutting down')
@@ -97,7 +265,7 @@ class PythonLanguageServer(MethodDispatcher):
 
     # pylint: disable=too-many-public-methods,redefined-builtin
 
-    def __init__(self, rx, tx, check_parent_process=False):
+    def __init__(self, rx, tx, check_parent_process=False, shared=None):
         self.workspace = None
         self.config = None
         self.root_uri = None
@@ -108,10 +276,21 @@ class PythonLanguageServer(MethodDispatcher):
         self._jsonrpc_stream_reader = JsonRpcStreamReader(rx)
         self._jsonrpc_stream_writer = JsonRpcStreamWriter(tx)
         self._check_parent_process = check_parent_process
+        # The plugins, loaded on initialize unless shared, serve every workspace folder
+        self._plugin_manager = shared.plugin_manager if shared is not None else None
         self._endpoint = Endpoint(self, self._jsonrpc_stream_writer.write, max_workers=MAX_WORKERS)
         self._dispatchers = []
         self._shutdown = False
 
+        self._scheduler = scheduler.Scheduler()
+        self._lint_executor = ThreadPoolExecutor(max_workers=MAX_LINT_WORKERS)
+        self._lint_tokens = {}
+        # The diagnostics the slow linters last published for each document
+        self._slow_diagnostics = {}
+        self._lint_cache = shared.lint_cache if shared is not None else _utils.LRUCache(LINT_CACHE_SIZE)
+        self._lint_lock = threading.Lock()
+        self._result_cache = _utils.LRUCache(RESULT_CACHE_BYTES, sizeof=_json_size)
+
     def start(self):
         """Entry point for the server."""
         self._jsonrpc_stream_reader.listen(self._endpoint.consume)
@@ -124,7 +303,7 @@ class PythonLanguageServer(MethodDispatcher):
             raise KeyError
 
         try:
-            return super(PythonLanguageServer, self).__getitem__(item)
+            handler = super(PythonLanguageServer, self).__getitem__(item)
         except KeyError:
             # Fallback through extra dispatchers
             for dispatcher in self._dispatchers:
@@ -132,8 +311,32 @@ class PythonLanguageServer(MethodDispatcher):
                     return dispatcher[item]
                 except KeyError:
                     continue
-
-        raise KeyError()
+            raise KeyError()
+
+        if item in REQUEST_PRIORITIES:
+            return partial(self._submit_request, item, handler)
+        return handler
+
+    def _submit_request(self, method, handler, params):
+        """Schedule a request, returning a future the endpoint can cancel.
+
+        Identical requests that are pending together are computed once. Completion and signature help
+        requests supersede the pending one for the same document, whose answer the client no longer needs.
+        """
+        doc_uri = (params or {}).get('textDocument', {}).get('uri')
+        return self._scheduler.submit(
+            REQUEST_PRIORITIES[method],
+            self._run_request,
+            (handler, params),
+            key=(method, json.dumps(params, sort_keys=True, default=str)),
+            replaces=(method, doc_uri) if method in SUPERSEDING_REQUESTS else None
+        )
+
+    @staticmethod
+    def _run_request(handler, params):
+        result = handler(params)
+        _utils.raise_if_cancelled()
+        return result
 
     def m_shutdown(self, **_kwargs):
         self._shutdown = True
@@ -141,6 +344,10 @@ class PythonLanguageServer(MethodDispatcher):
 
     def m_exit(self, **_kwargs):
         self._endpoint.shutdown()
+        for workspace in self.workspaces.values():
+            workspace.close()
+        self._scheduler.shutdown()
+        self._lint_executor.shutdown(wait=False)
         self._jsonrpc_stream_reader.close()
         self._jsonrpc_stream_writer.close()
 
@@ -148,12 +355,16 @@ class PythonLanguageServer(MethodDispatcher):
         workspace_uri = _utils.match_uri_to_workspace(uri, self.workspaces)
         return self.workspaces.get(workspace_uri, self.workspace)
 
-    def _hook(self, hook_name, doc_uri=None, **kwargs):
+    def _hook(self, hook_name, doc_uri=None, workspace=None, **kwargs):
         """Calls hook_name and returns a list of results from all registered handlers"""
-        workspace = self._match_uri_to_workspace(doc_uri)
+        workspace = workspace or self._match_uri_to_workspace(doc_uri)
         doc = workspace.get_document(doc_uri) if doc_uri else None
         hook_handlers = self.config.plugin_manager.subset_hook_caller(hook_name, self.config.disabled_plugins)
-        return hook_handlers(config=self.config, workspace=workspace, document=doc, **kwargs)
+        cancel_token = _utils.current_cancel_token()
+        if cancel_token is None:
+            return hook_handlers(config=self.config, workspace=workspace, document=doc, **kwargs)
+        return _call_hookimpls(hook_handlers, cancel_token,
+                               config=self.config, workspace=workspace, document=doc, **kwargs)
 
     def capabilities(self):
         server_capabilities = {
@@ -187,6 +398,7 @@ class PythonLanguageServer(MethodDispatcher):
                 },
                 'openClose': True,
             },
+            'workspaceSymbolProvider': True,
             'workspace': {
                 'workspaceFolders': {
                     'supported': True,
@@ -203,10 +415,15 @@ class PythonLanguageServer(MethodDispatcher):
         if rootUri is None:
             rootUri = uris.from_fs_path(rootPath) if rootPath is not None else ''
 
-        self.workspaces.pop(self.root_uri, None)
+        old_workspace = self.workspaces.pop(self.root_uri, None)
+        if old_workspace is not None:
+            old_workspace.close()
         self.root_uri = rootUri
+        if self._plugin_manager is None:
+            self._plugin_manager = config.create_plugin_manager()
         self.config = config.Config(rootUri, initializationOptions or {},
-                                    processId, _kwargs.get('capabilities', {}))
+                                    processId, _kwargs.get('capabilities', {}),
+                                    plugin_manager=self._plugin_manager)
         self.workspace = Workspace(rootUri, self._endpoint, self.config)
         self.workspaces[rootUri] = self.workspace
         self._dispatchers = self._hook('pyls_dispatchers')
@@ -234,7 +451,7 @@ class PythonLanguageServer(MethodDispatcher):
         return flatten(self._hook('pyls_code_actions', doc_uri, range=range, context=context))
 
     def code_lens(self, doc_uri):
-        return flatten(self._hook('pyls_code_lens', doc_uri))
+        return self._memoize(doc_uri, lambda: flatten(self._hook('pyls_code_lens', doc_uri)), 'codeLens')
 
     def completions(self, doc_uri, position):
         completions = self._hook('pyls_completions', doc_uri, position=position)
@@ -247,7 +464,7 @@ class PythonLanguageServer(MethodDispatcher):
         return flatten(self._hook('pyls_definitions', doc_uri, position=position))
 
     def document_symbols(self, doc_uri):
-        return flatten(self._hook('pyls_document_symbols', doc_uri))
+        return self._memoize(doc_uri, lambda: flatten(self._hook('pyls_document_symbols', doc_uri)), 'symbols')
 
     def execute_command(self, command, arguments):
         return self._hook('pyls_execute_command', command=command, arguments=arguments)
@@ -259,26 +476,200 @@ class PythonLanguageServer(MethodDispatcher):
         return self._hook('pyls_format_range', doc_uri, range=range)
 
     def highlight(self, doc_uri, position):
-        return flatten(self._hook('pyls_document_highlight', doc_uri, position=position)) or None
+        return self._memoize(
+            doc_uri, lambda: flatten(self._hook('pyls_document_highlight', doc_uri, position=position)) or None,
+            'highlight', position['line'], position['character']
+        )
 
     def hover(self, doc_uri, position):
         return self._hook('pyls_hover', doc_uri, position=position) or {'contents': ''}
 
-    @_utils.debounce(LINT_DEBOUNCE_S, keyed_by='doc_uri')
     def lint(self, doc_uri, is_saved):
-        # Since we're debounced, the document may no longer be open
-        workspace = self._match_uri_to_workspace(doc_uri)
-        if doc_uri in workspace.documents:
-            workspace.publish_diagnostics(
-                doc_uri,
-                flatten(self._hook('pyls_lint', doc_uri, is_saved=is_saved))
-            )
+        # Diagnostics from a lint that is still running would be stale by the time they're published.
+        # One that hasn't started yet is superseded by the scheduler.
+        self._cancel_lint(doc_uri)
+        self._lint(doc_uri, is_saved)
+
+    def _cancel_lint(self, doc_uri):
+        with self._lint_lock:
+            cancel_token = self._lint_tokens.pop(doc_uri, None)
+        if cancel_token is not None:
+            cancel_token.cancel()
+
+    @_utils.debounce(LINT_DEBOUNCE_S, keyed_by='doc_uri')
+    def _lint(self, doc_uri, is_saved):
+        if not self._shutdown:
+            # A lint that hasn't started yet will see the latest source, so only one is queued per document
+            self._scheduler.submit(scheduler.LINT, self._run_lint, (doc_uri, is_saved),
+                                   key=('lint', doc_uri, is_saved), replaces=('lint', doc_uri))
+
+    def _run_lint(self, doc_uri, is_saved):
+        cancel_token = _utils.current_cancel_token()
+        with self._lint_lock:
+            self._lint_tokens[doc_uri] = cancel_token
+
+        try:
+            # Since we're debounced, the document may no longer be open
+            workspace = self._match_uri_to_workspace(doc_uri)
+            if doc_uri in workspace.documents:
+                self._lint_progressively(workspace, workspace.get_document(doc_uri), is_saved)
+        except JsonRpcRequestCancelled:
+            log.debug('Cancelled linting %s', doc_uri)
+        except Exception:  # pylint: disable=broad-except
+            # Nobody waits on the result of a lint, so make sure failures are seen
+            log.exception('Failed to lint %s', doc_uri)
+        finally:
+            with self._lint_lock:
+                if self._lint_tokens.get(doc_uri) is cancel_token:
+                    del self._lint_tokens[doc_uri]
+
+    def _lint_progressively(self, workspace, doc, is_saved):
+        """Publish the diagnostics of the fast linters, then republish them with those of the slow ones.
+
+        Until the slow linters finish, the fast diagnostics are published with the last ones the slow
+        linters published for the document, rather than without any.
+        """
+        version, source = doc.version, doc.source
+
+        def publish(diagnostics):
+            _utils.raise_if_cancelled()
+            if workspace.get_document(doc.uri) is not doc or doc.version != version or doc.source is not source:
+                # The document moved on while we were linting, and a newer lint is on its way
+                log.debug('Dropping diagnostics for outdated version %s of %s', version, doc.uri)
+                return False
+            workspace.publish_diagnostics(doc.uri, diagnostics, version=version)
+            return True
+
+        streaming = self.config.settings().get('lint', {}).get('streaming', False)
+        hookimpls = self._lint_hookimpls()
+        if _has_wrappers(hookimpls):
+            publish(flatten(self._hook('pyls_lint', doc.uri, is_saved=is_saved)))
+            return
+
+        fast, slow = self._lint_tiers(hookimpls, doc.path)
+        with self._lint_lock:
+            last_slow = self._slow_diagnostics.get(doc.uri, []) if slow else []
+
+        def publish_fast(fast_diagnostics):
+            publish(fast_diagnostics + last_slow)
+
+        diagnostics = self._lint_document(doc.uri, is_saved, fast, on_partial=publish_fast if streaming else None)
+        if not slow:
+            publish(diagnostics)
+            return
 
-    def references(self, doc_uri, position, exclude_declaration):
-        return flatten(self._hook(
+        if fast:
+            publish_fast(diagnostics)
+
+        def publish_slow(slow_diagnostics):
+            if publish(diagnostics + slow_diagnostics):
+                with self._lint_lock:
+                    # Unless the document was closed in the meantime
+                    if workspace.documents.get(doc.uri) is doc:
+                        self._slow_diagnostics[doc.uri] = slow_diagnostics
+
+        publish_slow(self._lint_document(doc.uri, is_saved, slow, on_partial=publish_slow if streaming else None))
+
+    def _lint_tiers(self, hookimpls, document_path):
+        """Split hookimpls into the fast linters and those configured to run in the slow tier."""
+        fast, slow = [], []
+        for impl in hookimpls:
+            tier = self.config.plugin_settings(impl.plugin_name, document_path=document_path).get('lintTier')
+            (slow if tier == LINT_TIER_SLOW else fast).append(impl)
+        return fast, slow
+
+    def _lint_hookimpls(self):
+        hook_caller = self.config.plugin_manager.subset_hook_caller('pyls_lint', self.config.disabled_plugins)
+        return list(reversed(hook_caller.get_hookimpls()))
+
+    def _lint_document(self, doc_uri, is_saved, hookimpls=None, on_partial=None):
+        """Run linters, reusing their diagnostics for content and settings they've already seen.
+
+        By default all enabled linters run. Diagnostics are merged in plugin order. If given, on_partial
+        is called with the diagnostics gathered so far each time a linter finishes.
+        """
+        workspace = self._match_uri_to_workspace(doc_uri)
+        doc = workspace.get_document(doc_uri)
+        if hookimpls is None:
+            hookimpls = self._lint_hookimpls()
+            if _has_wrappers(hookimpls):
+                return flatten(self._hook('pyls_lint', doc_uri, is_saved=is_saved))
+
+        source = doc.source
+        results, to_run = self._cached_lint_results(doc.path, source, is_saved, hookimpls)
+        kwargs = {'config': self.config, 'workspace': workspace, 'document': doc, 'is_saved': is_saved}
+
+        def run_linter(impl, key, cacheable):
+            _utils.raise_if_cancelled()
+            result = _call_hookimpl(impl, kwargs) or []
+            _utils.raise_if_cancelled()
+            # Don't file the diagnostics under this hash if the document changed while we were linting
+            if cacheable and doc.source is source:
+                self._lint_cache[key] = result
+            return result
+
+        def finished(i, result):
+            results[i] = result
+            # The final set is published by the caller
+            if on_partial is not None and any(r is None for r in results):
+                on_partial(flatten(r for r in results if r is not None))
+
+        self._run_linters(run_linter, to_run, finished)
+        return flatten(results)
+
+    def _cached_lint_results(self, path, source, is_saved, hookimpls):
+        """Return the cached diagnostics of each linter, or None, and the (index, (impl, key, cacheable)) to run."""
+        source_hash = hashlib.sha1(source.encode('utf-8')).hexdigest()
+        results = [None] * len(hookimpls)
+        to_run = []
+        for i, impl in enumerate(hookimpls):
+            # Linters that look at is_saved may treat unsaved buffers differently (pylint reports its last
+            # run on the saved file), so only their diagnostics for saved files can be reused.
+            cacheable = is_saved or 'is_saved' not in impl.argnames
+            key = (impl.plugin_name, path, source_hash, self._plugin_settings_key(impl.plugin_name, path))
+            results[i] = self._lint_cache.get(key) if cacheable else None
+            if results[i] is None:
+                to_run.append((i, (impl, key, cacheable)))
+        return results, to_run
+
+    def _run_linters(self, run_linter, to_run, finished):
+        """Call finished(i, run_linter(*args)) for each of to_run, on the lint executor if linting in parallel."""
+        if self.config.settings().get('lint', {}).get('parallel', False) and len(to_run) > 1:
+            cancel_token = _utils.current_cancel_token()
+
+            def run_in_scope(args):
+                with _utils.cancellation_scope(cancel_token):
+                    return run_linter(*args)
+
+            futures = {self._lint_executor.submit(run_in_scope, args): i for i, args in to_run}
+            for future in as_completed(futures):
+                finished(futures[future], future.result())
+        else:
+            for i, args in to_run:
+                finished(i, run_linter(*args))
+
+    def _plugin_settings_key(self, plugin_name, document_path):
+        settings = self.config.plugin_settings(plugin_name, document_path=document_path)
+        return json.dumps(settings, sort_keys=True, default=str)
+
+    def references(self, doc_uri, position, exclude_declaration, partial_result_token=None):
+        if partial_result_token is None:
+            return flatten(self._hook(
+                'pyls_references', doc_uri, position=position,
+                exclude_declaration=exclude_declaration, on_partial=None
+            ))
+
+        def report(references):
+            self._match_uri_to_workspace(doc_uri).report_progress(partial_result_token, references)
+
+        remaining = flatten(self._hook(
             'pyls_references', doc_uri, position=position,
-            exclude_declaration=exclude_declaration
+            exclude_declaration=exclude_declaration, on_partial=report
         ))
+        if remaining:
+            report(remaining)
+        # Once any results were streamed, the response itself must be empty
+        return []
 
     def rename(self, doc_uri, position, new_name):
         return self._hook('pyls_rename', doc_uri, position=position, new_name=new_name)
@@ -287,11 +678,44 @@ class PythonLanguageServer(MethodDispatcher):
         return self._hook('pyls_signature_help', doc_uri, position=position)
 
     def folding(self, doc_uri):
-        return flatten(self._hook('pyls_folding_range', doc_uri))
+        return self._memoize(doc_uri, lambda: flatten(self._hook('pyls_folding_range', doc_uri)), 'folding')
+
+    def _memoize(self, doc_uri, compute, *key):
+        """Return compute(), reusing its result while doc_uri is open at the same version.
+
+        Only for requests whose result depends on nothing but the document's content, the request's
+        arguments (the rest of key) and the settings, which clear the cache when they change.
+        """
+        doc = self._match_uri_to_workspace(doc_uri).get_document(doc_uri)
+        version = doc.version
+        if version is None:
+            # Documents that aren't open are read from disk and have no version to tell whether they changed
+            return compute()
+
+        key = (doc_uri,) + key
+        cached = self._result_cache.get(key)
+        if cached is not None and cached[0]() is doc and cached[1] == version:
+            return cached[2]
+
+        source = doc.source
+        result = compute()
+        # Don't file the result under this version if the document changed while we were computing it
+        if doc.version == version and doc.source is source:
+            self._result_cache[key] = (weakref.ref(doc), version, result)
+        return result
+
+    def workspace_symbols(self, query):
+        symbols = []
+        for workspace in list(self.workspaces.values()):
+            symbols.extend(flatten(self._hook('pyls_workspace_symbols', workspace=workspace, query=query)))
+        return symbols
 
     def m_text_document__did_close(self, textDocument=None, **_kwargs):
         workspace = self._match_uri_to_workspace(textDocument['uri'])
         workspace.rm_document(textDocument['uri'])
+        self._cancel_lint(textDocument['uri'])
+        with self._lint_lock:
+            self._slow_diagnostics.pop(textDocument['uri'], None)
 
     def m_text_document__did_open(self, textDocument=None, **_kwargs):
         workspace = self._match_uri_to_workspace(textDocument['uri'])
@@ -349,13 +773,15 @@ class PythonLanguageServer(MethodDispatcher):
 
     def m_text_document__references(self, textDocument=None, position=None, context=None, **_kwargs):
         exclude_declaration = not context['includeDeclaration']
-        return self.references(textDocument['uri'], position, exclude_declaration)
+        return self.references(textDocument['uri'], position, exclude_declaration,
+                               partial_result_token=_kwargs.get('partialResultToken'))
 
     def m_text_document__signature_help(self, textDocument=None, position=None, **_kwargs):
         return self.signature_help(textDocument['uri'], position)
 
     def m_workspace__did_change_configuration(self, settings=None):
         self.config.update((settings or {}).get('pyls', {}))
+        self._result_cache.clear()
         for workspace_uri in self.workspaces:
             workspace = self.workspaces[workspace_uri]
             workspace.update_config(settings)
@@ -365,20 +791,24 @@ class PythonLanguageServer(MethodDispatcher):
     def m_workspace__did_change_workspace_folders(self, event=None, **_kwargs):  # pylint: disable=too-many-locals
         if event is None:
             return
+        self._result_cache.clear()
         added = event.get('added', [])
         removed = event.get('removed', [])
 
         for removed_info in removed:
             if 'uri' in removed_info:
                 removed_uri = removed_info['uri']
-                self.workspaces.pop(removed_uri, None)
+                removed_workspace = self.workspaces.pop(removed_uri, None)
+                if removed_workspace is not None:
+                    removed_workspace.close()
 
         for added_info in added:
             if 'uri' in added_info:
                 added_uri = added_info['uri']
                 workspace_config = config.Config(
                     added_uri, self.config._init_opts,
-                    self.config._process_id, self.config._capabilities)
+                    self.config._process_id, self.config._capabilities,
+                    plugin_manager=self._plugin_manager)
                 workspace_config.update(self.config._settings)
                 self.workspaces[added_uri] = Workspace(
                     added_uri, self._endpoint, workspace_config)
@@ -412,20 +842,22 @@ class PythonLanguageServer(MethodDispatcher):
             new_workspace._docs[uri] = doc
 
     def m_workspace__did_change_watched_files(self, changes=None, **_kwargs):
-        changed_py_files = set()
-        config_changed = False
-        for d in (changes or []):
-            if d['uri'].endswith(PYTHON_FILE_EXTENSIONS):
-                changed_py_files.add(d['uri'])
-            elif d['uri'].endswith(CONFIG_FILEs):
-                config_changed = True
-
-        if config_changed:
+        changed_uris = set(d['uri'] for d in changes or [])
+        for workspace in self.workspaces.values():
+            for doc_uri in changed_uris:
+                workspace.on_file_changed(doc_uri)
+
+        changed_py_files = set(uri for uri in changed_uris if uri.endswith(PYTHON_FILE_EXTENSIONS))
+        if any(uri.endswith(CONFIG_FILEs) for uri in changed_uris - changed_py_files):
             self.config.settings.cache_clear()
+            self._result_cache.clear()
         elif not changed_py_files:
             # Only externally changed python files and lint configs may result in changed diagnostics.
             return
 
+        # Linters also read config files and imported modules we don't hash, so their cached results may be stale
+        self._lint_cache.clear()
+
         for workspace_uri in self.workspaces:
             workspace = self.workspaces[workspace_uri]
             for doc_uri in workspace.documents:
@@ -433,10 +865,59 @@ class PythonLanguageServer(MethodDispatcher):
                 if doc_uri not in changed_py_files:
                     self.lint(doc_uri, is_saved=False)
 
+    def m_workspace__symbol(self, query=None, **_kwargs):
+        return self.workspace_symbols(query or '')
+
     def m_workspace__execute_command(self, command=None, arguments=None):
         return self.execute_command(command, arguments)
 
 
+def _call_hookimpls(hook_caller, cancel_token, **kwargs):
+    """Call the implementations of a hook one at a time like pluggy does, stopping once cancel_token is.
+
+    pluggy calls all the implementations of a hook in one go, with no way to stop in between them,
+    so for hooks without wrappers this repeats the part of pluggy's _multicall they need: calling
+    the implementations in order with the arguments they name, and honouring firstresult.
+    """
+    hookimpls = list(reversed(hook_caller.get_hookimpls()))
+    if _has_wrappers(hookimpls):
+        # Wrappers need pluggy's own machinery, so we can only check before and after the call
+        cancel_token.raise_if_cancelled()
+        results = hook_caller(**kwargs)
+        cancel_token.raise_if_cancelled()
+        return results
+
+    firstresult = bool(hook_caller.spec and hook_caller.spec.opts.get('firstresult'))
+    results = []
+    for impl in hookimpls:
+        cancel_token.raise_if_cancelled()
+        result = _call_hookimpl(impl, kwargs)
+        if result is not None:
+            results.append(result)
+            if firstresult:
+                break
+    cancel_token.raise_if_cancelled()
+
+    if firstresult:
+        return results[0] if results else None
+    return results
+
+
+def _has_wrappers(hookimpls):
+    return any(getattr(impl, 'hookwrapper', False) or getattr(impl, 'wrapper', False) for impl in hookimpls)
+
+
+def _call_hookimpl(impl, kwargs):
+    missing = [argname for argname in impl.argnames if argname not in kwargs]
+    if missing:
+        raise HookCallError('hook call must provide argument %r' % missing[0])
+    return impl.function(*[kwargs[argname] for argname in impl.argnames])
+
+
+def _json_size(value):
+    return len(json.dumps(value, default=str))
+
+
 def flatten(list_of_lists):
     return [item for lst in list_of_lists for item in lst]
 
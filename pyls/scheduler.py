@@ -0,0 +1,232 @@
+# Copyright 2017 Palantir Technologies, Inc.
+"""Runs requests and lints by priority, so that interactive requests aren't stuck behind background work."""
+from concurrent.futures import Future, ThreadPoolExecutor
+import collections
+import logging
+import threading
+
+from pyls_jsonrpc.exceptions import JsonRpcRequestCancelled
+
+from . import _utils
+
+log = logging.getLogger(__name__)
+
+# Priority classes, most urgent first
+COMPLETION = 0  # completion, signature help
+HOVER = 1  # hover, highlight, code actions
+NAVIGATION = 2  # definition, references
+SYMBOLS = 3  # document symbols, folding, code lens
+LINT = 4
+
+# How many tasks of each class may run at once
+DEFAULT_LIMITS = {
+    COMPLETION: 4,
+    HOVER: 4,
+    NAVIGATION: 2,
+    SYMBOLS: 2,
+    LINT: 2,
+}
+
+# How many tasks of each group of classes may run at once, across the classes in the group.
+# jedi and rope aren't thread safe, and the requests using them share the workspace's projects and
+# parso's cache, so they run one at a time.
+DEFAULT_SHARED_LIMITS = {
+    (COMPLETION, HOVER, NAVIGATION, SYMBOLS): 1,
+}
+
+
+class ScheduledFuture(Future):
+    """The future of a scheduled task, whose cancellation is passed on to the work computing it.
+
+    The client still expects a response to a cancelled request, so cancelling resolves the future
+    with RequestCancelled rather than putting it in the cancelled state.
+    """
+
+    def __init__(self, task):
+        super(ScheduledFuture, self).__init__()
+        self._task = task
+
+    @property
+    def cancel_token(self):
+        return self._task.cancel_token
+
+    def cancel(self):
+        self._task.cancel_future(self)
+        return False
+
+
+class _Task(object):
+    """A unit of work and the futures of every request waiting on its result."""
+
+    def __init__(self, priority, fn, args, key, slot):
+        self.priority = priority
+        self.fn = fn
+        self.args = args
+        self.key = key
+        self.slot = slot
+        self.cancel_token = _utils.CancellationToken()
+        self.futures = []
+        self._lock = threading.Lock()
+
+    def new_future(self):
+        future = ScheduledFuture(self)
+        with self._lock:
+            self.futures.append(future)
+        return future
+
+    def cancel_future(self, future):
+        with self._lock:
+            if future.done():
+                return
+            future.set_exception(JsonRpcRequestCancelled())
+            abandoned = all(f.done() for f in self.futures)
+
+        # Only stop the work once nobody is waiting on it any more
+        if abandoned:
+            self.cancel_token.cancel()
+
+    def cancel(self):
+        for future in list(self.futures):
+            self.cancel_future(future)
+        self.cancel_token.cancel()
+
+    def run(self):
+        try:
+            with _utils.cancellation_scope(self.cancel_token):
+                self.cancel_token.raise_if_cancelled()
+                result = self.fn(*self.args)
+        except Exception as e:  # pylint: disable=broad-except
+            self._resolve(exception=e)
+        else:
+            self._resolve(result=result)
+
+    def _resolve(self, result=None, exception=None):
+        with self._lock:
+            for future in self.futures:
+                if future.done():
+                    continue
+                if exception is not None:
+                    future.set_exception(exception)
+                else:
+                    future.set_result(result)
+
+
+class Scheduler(object):
+    """Runs tasks on a thread pool, most urgent priority class first.
+
+    A class only starts a task while fewer than its limit are running, and fewer than the shared limit
+    of each group it belongs to are running across the group. Lower classes wait while more urgent
+    tasks are queued. A task with the same key as a pending one is a duplicate, and
+    shares the pending task's result. A task can also take the place of the pending task in the slot
+    it replaces, whose requests are then cancelled.
+    """
+
+    def __init__(self, limits=None, shared_limits=None):
+        self._limits = dict(DEFAULT_LIMITS)
+        self._limits.update(limits or {})
+        self._shared_limits = dict(DEFAULT_SHARED_LIMITS if shared_limits is None else shared_limits)
+        self._priorities = sorted(self._limits)
+        self._pending = {priority: collections.deque() for priority in self._priorities}
+        self._pending_by_key = {}
+        self._pending_by_slot = {}
+        self._running = {priority: 0 for priority in self._priorities}
+        self._shared_running = {group: 0 for group in self._shared_limits}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=sum(self._limits.values()))
+        self._shutdown = False
+
+    def submit(self, priority, fn, args=(), key=None, replaces=None):
+        """Schedule fn(*args) in the given priority class and return a ScheduledFuture for its result.
+
+        Args:
+            key: Identifies what the task computes. A pending task with the same key is run only once.
+            replaces: A slot holding at most one pending task. A task already pending there is superseded.
+        """
+        superseded = None
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError('Cannot schedule new tasks after shutdown')
+
+            duplicate = self._pending_by_key.get(key) if key is not None else None
+            if duplicate is not None and not duplicate.cancel_token.cancelled:
+                return duplicate.new_future()
+
+            task = _Task(priority, fn, args, key, replaces)
+            future = task.new_future()
+            pending = self._pending_by_slot.get(replaces) if replaces is not None else None
+            if pending is not None:
+                # The newer task takes the place of the stale one in the queue
+                queue = self._pending[pending.priority]
+                queue[queue.index(pending)] = task
+                self._forget(pending)
+                superseded = pending
+            else:
+                self._pending[priority].append(task)
+            if key is not None:
+                self._pending_by_key[key] = task
+            if replaces is not None:
+                self._pending_by_slot[replaces] = task
+
+        if superseded is not None:
+            log.debug('Task %s superseded by a newer one', superseded.key)
+            superseded.cancel()
+        self._dispatch()
+        return future
+
+    def shutdown(self):
+        with self._lock:
+            self._shutdown = True
+            pending = [task for queue in self._pending.values() for task in queue]
+            for queue in self._pending.values():
+                queue.clear()
+            self._pending_by_key.clear()
+            self._pending_by_slot.clear()
+
+        for task in pending:
+            task.cancel()
+        self._executor.shutdown(wait=False)
+
+    def _dispatch(self):
+        with self._lock:
+            while True:
+                task = self._next_task()
+                if task is None:
+                    break
+                self._count_running(task.priority, 1)
+                self._forget(task)
+                self._executor.submit(self._run, task)
+
+    def _forget(self, task):
+        """Stop matching later tasks against task, which must be called with the lock held."""
+        if self._pending_by_key.get(task.key) is task:
+            del self._pending_by_key[task.key]
+        if self._pending_by_slot.get(task.slot) is task:
+            del self._pending_by_slot[task.slot]
+
+    def _next_task(self):
+        for priority in self._priorities:
+            queue = self._pending[priority]
+            if not queue:
+                continue
+            if self._running[priority] >= self._limits[priority] or any(
+                    self._shared_running[group] >= limit
+                    for group, limit in self._shared_limits.items() if priority in group):
+                # Don't let less urgent work take the CPU while this class is waiting
+                return None
+            return queue.popleft()
+        return None
+
+    def _count_running(self, priority, delta):
+        """Count tasks of priority starting or finishing, which must be called with the lock held."""
+        self._running[priority] += delta
+        for group in self._shared_running:
+            if priority in group:
+                self._shared_running[group] += delta
+
+    def _run(self, task):
+        try:
+            task.run()
+        finally:
+            with self._lock:
+                self._count_running(task.priority, -1)
+            self._dispatch()
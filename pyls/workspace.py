@@ -1,14 +1,18 @@
 # Copyright 2017 Palantir Technologies, Inc.
+import ast
+import copy
 import io
 import logging
 import os
 import re
 import functools
-from threading import RLock
+import tokenize
+from threading import Lock, RLock
 
 import jedi
+import parso
 
-from . import lsp, uris, _utils
+from . import lsp, uris, _index, _utils
 
 log = logging.getLogger(__name__)
 
@@ -16,6 +20,17 @@ log = logging.getLogger(__name__)
 RE_START_WORD = re.compile('[A-Za-z_0-9]*$')
 RE_END_WORD = re.compile('^[A-Za-z_0-9]*')
 
+# Files marking the root of a project inside the workspace
+SOURCE_ROOT_MARKERS = ('setup.py', 'pyproject.toml')
+
+# jedi environments by path. Creating one runs its interpreter, so every workspace in the process shares them.
+_environments = {}
+# Held while looking up or creating an environment, which clients of a multi client server do concurrently
+_environments_lock = Lock()
+
+# Everything str.splitlines() breaks a line on
+LINE_BREAKS = ('\r\n', '\n', '\r', '\v', '\f', '\x1c', '\x1d', '\x1e', u'\x85', u'\u2028', u'\u2029')
+
 
 def lock(method):
     """Define an atomic region over a method."""
@@ -31,6 +46,7 @@ class Workspace(object):
     M_PUBLISH_DIAGNOSTICS = 'textDocument/publishDiagnostics'
     M_APPLY_EDIT = 'workspace/applyEdit'
     M_SHOW_MESSAGE = 'window/showMessage'
+    M_PROGRESS = '$/progress'
 
     def __init__(self, root_uri, endpoint, config=None):
         self._config = config
@@ -40,8 +56,17 @@ class Workspace(object):
         self._root_path = uris.to_fs_path(self._root_uri)
         self._docs = {}
 
-        # Cache jedi environments
-        self._environments = {}
+        self._environments = _environments
+
+        # Cache what jedi needs to know about the project: the source roots of each directory,
+        # the sys path of each environment and the jedi.Project for each resulting sys path
+        self._source_roots = {}
+        self._sys_paths = {}
+        self._jedi_projects = {}
+
+        # The index of the definitions in the workspace, built once something needs it
+        self._index = None
+        self._index_lock = Lock()
 
         # Whilst incubating, keep rope private
         self.__rope = None
@@ -72,6 +97,43 @@ class Workspace(object):
     def root_uri(self):
         return self._root_uri
 
+    @property
+    def index(self):
+        """The index of the definitions in the workspace's modules, whose building starts on first use.
+
+        The index of the files on disk is shared by the workspaces of the process with the same root,
+        while the documents open in this workspace are indexed from their buffers.
+        """
+        with self._index_lock:
+            if self._index is None:
+                if self.is_local():
+                    files_index = _index.acquire_index(self._root_path)
+                else:
+                    files_index = _index.WorkspaceIndex(self._root_path)
+                self._index = _index.IndexView(files_index, self._open_sources)
+            return self._index
+
+    def reindex(self, doc_uri):
+        """Have the index pick up the new content of doc_uri on disk, if it's been built."""
+        if self._index is not None:
+            self._index.mark_stale(uris.to_fs_path(doc_uri))
+
+    def on_file_changed(self, doc_uri):
+        """Forget what the workspace derived from the file at doc_uri, which changed on disk."""
+        self.reindex(doc_uri)
+        if os.path.basename(uris.to_fs_path(doc_uri)) in SOURCE_ROOT_MARKERS:
+            # Projects may have appeared or disappeared, moving documents between source roots
+            self.clear_project_caches()
+
+    def close(self):
+        with self._index_lock:
+            if self._index is not None and self.is_local():
+                _index.release_index(self._root_path)
+            self._index = None
+
+    def _open_sources(self):
+        return {doc.path: doc.source for doc in list(self._docs.values())}
+
     def is_local(self):
         return (self._root_uri_scheme == '' or self._root_uri_scheme == 'file') and os.path.exists(self._root_path)
 
@@ -90,6 +152,8 @@ class Workspace(object):
 
     def rm_document(self, doc_uri):
         self._docs.pop(doc_uri)
+        # The document may have been saved since the index last read it
+        self.reindex(doc_uri)
 
     def update_document(self, doc_uri, change, version=None):
         self._docs[doc_uri].apply_change(change)
@@ -97,22 +161,42 @@ class Workspace(object):
 
     def update_config(self, settings):
         self._config.update((settings or {}).get('pyls', {}))
+        self._sys_paths = {}
+        self._jedi_projects = {}
         for doc_uri in self.documents:
             self.get_document(doc_uri).update_config(settings)
 
+    def clear_project_caches(self):
+        """Forget the resolved source roots, sys paths and jedi projects, e.g. after a setup.py was added."""
+        self._source_roots = {}
+        self._sys_paths = {}
+        self._jedi_projects = {}
+        for doc in list(self._docs.values()):
+            doc.update_extra_sys_path(self.source_roots(doc.path))
+
     def apply_edit(self, edit):
         return self._endpoint.request(self.M_APPLY_EDIT, {'edit': edit})
 
-    def publish_diagnostics(self, doc_uri, diagnostics):
-        self._endpoint.notify(self.M_PUBLISH_DIAGNOSTICS, params={'uri': doc_uri, 'diagnostics': diagnostics})
+    def publish_diagnostics(self, doc_uri, diagnostics, version=None):
+        params = {'uri': doc_uri, 'diagnostics': diagnostics}
+        if version is not None:
+            params['version'] = version
+        self._endpoint.notify(self.M_PUBLISH_DIAGNOSTICS, params=params)
+
+    def report_progress(self, token, value):
+        self._endpoint.notify(self.M_PROGRESS, params={'token': token, 'value': value})
 
     def show_message(self, message, msg_type=lsp.MessageType.Info):
         self._endpoint.notify(self.M_SHOW_MESSAGE, params={'type': msg_type, 'message': message})
 
     def source_roots(self, document_path):
         """Return the source roots for the given document."""
-        files = _utils.find_parents(self._root_path, document_path, ['setup.py', 'pyproject.toml']) or []
-        return list({os.path.dirname(project_file) for project_file in files}) or [self._root_path]
+        directory = os.path.dirname(document_path)
+        if directory not in self._source_roots:
+            files = _utils.find_parents(self._root_path, document_path, SOURCE_ROOT_MARKERS) or []
+            roots = list({os.path.dirname(project_file) for project_file in files}) or [self._root_path]
+            self._source_roots[directory] = roots
+        return self._source_roots[directory]
 
     def _create_document(self, doc_uri, source=None, version=None):
         path = uris.to_fs_path(doc_uri)
@@ -139,11 +223,24 @@ class Document(object):
         self._config = workspace._config
         self._workspace = workspace
         self._local = local
-        self._source = source
         self._extra_sys_path = extra_sys_path or []
         self._rope_project_builder = rope_project_builder
         self._lock = RLock()
 
+        # The document is held as a list of lines, each one keeping its line ending, which is
+        # what edits are applied to. The list is replaced rather than mutated on every change,
+        # so it can be handed out to callers as is. _source is the joined text, built on
+        # demand and dropped whenever the lines change. A document without a buffer is backed
+        # by the file on disk.
+        self._lines = None if source is None else source.splitlines(True)
+        self._source = source
+        # Offset of the start of each line, plus the length of the document, built on demand
+        self._line_offsets = None
+        # Scripts for the current contents, keyed by the settings they were created with
+        self._jedi_scripts = {}
+        # Parses of the current contents, shared by every plugin that needs one
+        self._parses = {}
+
     def __str__(self):
         return str(self.uri)
 
@@ -154,18 +251,32 @@ class Document(object):
     @property
     @lock
     def lines(self):
-        return self.source.splitlines(True)
+        if self._lines is None:
+            return self._read_source().splitlines(True)
+        return self._lines
 
     @property
     @lock
     def source(self):
+        if self._lines is None:
+            return self._read_source()
         if self._source is None:
-            with io.open(self.path, 'r', encoding='utf-8') as f:
-                return f.read()
+            self._source = ''.join(self._lines)
         return self._source
 
+    def _read_source(self):
+        with io.open(self.path, 'r', encoding='utf-8') as f:
+            return f.read()
+
+    @lock
     def update_config(self, settings):
         self._config.update((settings or {}).get('pyls', {}))
+        self._jedi_scripts = {}
+
+    @lock
+    def update_extra_sys_path(self, extra_sys_path):
+        self._extra_sys_path = extra_sys_path or []
+        self._jedi_scripts = {}
 
     @lock
     def apply_change(self, change):
@@ -175,7 +286,11 @@ class Document(object):
 
         if not change_range:
             # The whole file has changed
+            self._lines = text.splitlines(True)
             self._source = text
+            self._line_offsets = None
+            self._jedi_scripts = {}
+            self._parses = {}
             return
 
         start_line = change_range['start']['line']
@@ -183,37 +298,101 @@ class Document(object):
         end_line = change_range['end']['line']
         end_col = change_range['end']['character']
 
-        # Check for an edit occuring at the very end of the file
-        if start_line == len(self.lines):
-            self._source = self.source + text
-            return
+        lines = self.lines
+        # Lines past the end of the document (e.g. an edit at the very end of the file) are empty
+        prefix = lines[start_line][:start_col] if start_line < len(lines) else ''
+        suffix = lines[end_line][end_col:] if end_line < len(lines) else ''
+        new_text = prefix + text + suffix
+
+        # Only the lines touched by the edit are split again, widened to a neighbouring line
+        # whenever the edit joins onto it, so that the buffer always matches source.splitlines(True).
+        start = min(start_line, len(lines))
+        stop = min(end_line + 1, len(lines))
+        following = lines[stop] if stop < len(lines) else ''
+        if start > 0 and _joins_lines(lines[start - 1], new_text + following):
+            start -= 1
+            new_text = lines[start] + new_text
+        if stop < len(lines) and _joins_lines(new_text, lines[stop]):
+            new_text += lines[stop]
+            stop += 1
+
+        self._lines = lines[:start] + new_text.splitlines(True) + lines[stop:]
+        self._source = None
+        self._line_offsets = None
+        self._jedi_scripts = {}
+        self._parses = {}
 
-        new = io.StringIO()
+    @property
+    @lock
+    def line_offsets(self):
+        """The offset of the start of each line, followed by the length of the document."""
+        if self._lines is None:
+            return _prefix_lengths(self.lines)
+        if self._line_offsets is None:
+            self._line_offsets = _prefix_lengths(self._lines)
+        return self._line_offsets
 
-        # Iterate over the existing document until we hit the edit range,
-        # at which point we write the new text, then loop until we hit
-        # the end of the range and continue writing.
-        for i, line in enumerate(self.lines):
-            if i < start_line:
-                new.write(line)
-                continue
+    @property
+    def ast_tree(self):
+        """The stdlib AST of the document, raising SyntaxError if it doesn't parse."""
+        # Parsed from the UTF-8 encoded source, like pyflakes does
+        return self._parse('ast', lambda source: ast.parse(source.encode('utf-8'), self.path))
 
-            if i > end_line:
-                new.write(line)
-                continue
+    @property
+    def tokens(self):
+        """The document's tokens, as a tuple of tokenize tokens."""
+        return self._parse('tokens', lambda source: tuple(tokenize.generate_tokens(io.StringIO(source).readline)))
 
-            if i == start_line:
-                new.write(line[:start_col])
-                new.write(text)
+    @property
+    def parso_tree(self):
+        """The parso module of the document, parsed with the grammar of the running Python."""
+        return self._parse('parso', parso.parse)
 
-            if i == end_line:
-                new.write(line[end_col:])
+    @lock
+    def _parse(self, kind, parser):
+        """Return parser(source), computed once for every version of the document.
 
-        self._source = new.getvalue()
+        Parses are shared between plugins, so they must not be modified, other than by adding
+        attributes of a plugin's own to the nodes, as pyflakes does. A parse that fails is remembered
+        too, and raises the same error again.
+        """
+        if self._lines is None:
+            # A document read from disk may change under us, so it is parsed every time
+            return parser(self.source)
+
+        if kind not in self._parses:
+            try:
+                self._parses[kind] = (parser(self.source), None)
+            except (SyntaxError, ValueError, TypeError, tokenize.TokenError) as e:
+                self._parses[kind] = (None, e)
+
+        result, error = self._parses[kind]
+        if error is not None:
+            # Raise a copy, so the cached error doesn't collect a traceback every time it's raised
+            raise copy.copy(error)
+        return result
 
     def offset_at_position(self, position):
-        """Return the byte-offset pointed at by the given position."""
-        return position['character'] + len(''.join(self.lines[:position['line']]))
+        """Return the offset in the source pointed at by the given position, as sent by clients."""
+        position = self.position_from_utf16(position)
+        offsets = self.line_offsets
+        return position['character'] + offsets[min(position['line'], len(offsets) - 1)]
+
+    def position_to_utf16(self, position):
+        """Convert a position counted in characters to one counted in UTF-16 code units, as LSP expects."""
+        lines = self.lines
+        if position['line'] >= len(lines):
+            return position
+        line = lines[position['line']]
+        return {'line': position['line'], 'character': _utils.utf16_column(line, position['character'])}
+
+    def position_from_utf16(self, position):
+        """Convert a position counted in UTF-16 code units, as sent by clients, to one counted in characters."""
+        lines = self.lines
+        if position['line'] >= len(lines):
+            return position
+        line = lines[position['line']]
+        return {'line': position['line'], 'character': _utils.column_from_utf16(line, position['character'])}
 
     def word_at_position(self, position):
         """Get the word under the cursor returning the start and end positions."""
@@ -240,7 +419,7 @@ class Document(object):
                                 references=references)
 
     @lock
-    def jedi_script(self, position=None, use_document_path=False):
+    def jedi_script(self, position=None, use_document_path=False, shared=True):
         extra_paths = []
         environment_path = None
         env_vars = None
@@ -257,6 +436,15 @@ class Document(object):
             env_vars = os.environ.copy()
         env_vars.pop('PYTHONPATH', None)
 
+        # Requests on an unchanged buffer share one Script, and with it jedi's inference state.
+        # A document read from disk may change under us, so it always gets a fresh one, as do callers
+        # that can't take turns with the document's requests.
+        cache_key = None
+        if shared and self._lines is not None and not position:
+            cache_key = (use_document_path, environment_path, tuple(extra_paths), tuple(sorted(env_vars.items())))
+            if cache_key in self._jedi_scripts:
+                return self._jedi_scripts[cache_key]
+
         environment = self.get_enviroment(environment_path, env_vars=env_vars) if environment_path else None
         sys_path = self.sys_path(environment_path, env_vars=env_vars) + extra_paths
         project_path = self._workspace.root_path
@@ -265,31 +453,39 @@ class Document(object):
         if use_document_path:
             sys_path += [os.path.normpath(os.path.dirname(self.path))]
 
+        project_key = tuple(sys_path)
+        if project_key not in self._workspace._jedi_projects:
+            self._workspace._jedi_projects[project_key] = jedi.Project(path=project_path, sys_path=sys_path)
+
         kwargs = {
             'code': self.source,
             'path': self.path,
             'environment': environment,
-            'project': jedi.Project(path=project_path, sys_path=sys_path),
+            'project': self._workspace._jedi_projects[project_key],
         }
 
         if position:
             # Deprecated by Jedi to use in Script() constructor
             kwargs += _utils.position_to_jedi_linecolumn(self, position)
 
-        return jedi.Script(**kwargs)
+        script = jedi.Script(**kwargs)
+        if cache_key is not None:
+            self._jedi_scripts[cache_key] = script
+        return script
 
     def get_enviroment(self, environment_path=None, env_vars=None):
         # TODO(gatesn): #339 - make better use of jedi environments, they seem pretty powerful
         if environment_path is None:
             environment = jedi.api.environment.get_cached_default_environment()
         else:
-            if environment_path in self._workspace._environments:
-                environment = self._workspace._environments[environment_path]
-            else:
-                environment = jedi.api.environment.create_environment(path=environment_path,
-                                                                      safe=False,
-                                                                      env_vars=env_vars)
-                self._workspace._environments[environment_path] = environment
+            with _environments_lock:
+                if environment_path in self._workspace._environments:
+                    environment = self._workspace._environments[environment_path]
+                else:
+                    environment = jedi.api.environment.create_environment(path=environment_path,
+                                                                          safe=False,
+                                                                          env_vars=env_vars)
+                    self._workspace._environments[environment_path] = environment
 
         return environment
 
@@ -297,6 +493,26 @@ class Document(object):
         # Copy our extra sys path
         # TODO: when safe to break API, use env_vars explicitly to pass to create_environment
         path = list(self._extra_sys_path)
-        environment = self.get_enviroment(environment_path=environment_path, env_vars=env_vars)
-        path.extend(environment.get_sys_path())
+        # Getting the sys path of anything but the default environment means running its interpreter
+        env_key = (environment_path, tuple(sorted(env_vars.items())) if env_vars else None)
+        if env_key not in self._workspace._sys_paths:
+            environment = self.get_enviroment(environment_path=environment_path, env_vars=env_vars)
+            self._workspace._sys_paths[env_key] = environment.get_sys_path()
+        path.extend(self._workspace._sys_paths[env_key])
         return path
+
+
+def _prefix_lengths(lines):
+    offsets = [0] * (len(lines) + 1)
+    total = 0
+    for i, line in enumerate(lines):
+        total += len(line)
+        offsets[i + 1] = total
+    return offsets
+
+
+def _joins_lines(text, following):
+    """Whether splitting text + following would merge the end of text with the start of following."""
+    if not text:
+        return False
+    return not text.endswith(LINE_BREAKS) or (text.endswith('\r') and following.startswith('\n'))
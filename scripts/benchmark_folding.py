@@ -0,0 +1,76 @@
+# Copyright 2019 Palantir Technologies, Inc.
+"""Time folding range computation on ever larger files, to check that it scales linearly.
+
+Each file is a single class, so the whole tree is folded in one go rather than one top level
+node at a time. Files are parsed up front and only computing the ranges from the tree is timed.
+The time per node should stay about the same as the file grows.
+
+    python scripts/benchmark_folding.py [--sizes 1000 2000 4000 8000] [--repeat 3]
+"""
+import argparse
+import timeit
+
+from pyls.plugins import folding
+
+METHOD = '''
+    @decorator(
+        arg,
+    )
+    def method_{0}(self, x, y=(1,
+                               2)):
+        if x:
+            return [y for y in range(
+                x)]
+        elif y:
+            return {{
+                'x': x,
+            }}
+        else:
+            for i in range(3):
+                while i:
+                    i -= 1
+        try:
+            pass
+        except Exception:
+            pass
+'''
+
+# The function computing the ranges, which is private to the plugin
+compute_folding_ranges = getattr(folding, '__compute_folding_ranges')
+
+
+def _source(methods):
+    return 'class Big(object):\n' + ''.join(METHOD.format(i) for i in range(methods))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 2000, 4000, 8000],
+                        help='Numbers of methods in the generated files')
+    parser.add_argument('--repeat', type=int, default=3, help='Take the best of this many runs')
+    args = parser.parse_args()
+
+    print('{:>8} {:>8} {:>10} {:>10} {:>12}'.format('methods', 'lines', 'nodes', 'seconds', 'us per node'))
+    for size in args.sizes:
+        program = _source(size) + '\n'
+        lines = program.splitlines()
+        tree = folding.IncrementalParse('benchmark.py').parse(program)
+        nodes = _count_nodes(tree)
+
+        seconds = min(timeit.repeat(lambda: compute_folding_ranges(tree, lines), number=1, repeat=args.repeat))
+        print('{:>8} {:>8} {:>10} {:>10.3f} {:>12.2f}'.format(
+            size, len(lines), nodes, seconds, seconds / nodes * 1e6))
+
+
+def _count_nodes(tree):
+    count = 0
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        count += 1
+        stack.extend(getattr(node, 'children', ()))
+    return count
+
+
+if __name__ == '__main__':
+    main()
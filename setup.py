@@ -10,6 +10,7 @@ install_requires = [
         'configparser; python_version<"3.0"',
         'future>=0.14.0; python_version<"3"',
         'backports.functools_lru_cache; python_version<"3.2"',
+        'importlib_metadata; python_version<"3.8"',
         'jedi>=0.17.2,<0.18.0',
         'python-jsonrpc-server>=0.4.0',
         'pluggy',
@@ -105,6 +106,7 @@ setup(
             'pylint = pyls.plugins.pylint_lint',
             'rope_completion = pyls.plugins.rope_completion',
             'rope_rename = pyls.plugins.rope_rename',
+            'workspace_symbols = pyls.plugins.workspace_symbols',
             'yapf = pyls.plugins.yapf_format'
         ]
     },
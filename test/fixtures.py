@@ -22,6 +22,14 @@ def main():
 """
 
 
+@pytest.fixture(autouse=True)
+def index_cache(tmpdir_factory, monkeypatch):
+    """Save workspace indexes in a temporary directory rather than the user's cache."""
+    cache_home = str(tmpdir_factory.mktemp('cache'))
+    monkeypatch.setenv('XDG_CACHE_HOME', cache_home)
+    return cache_home
+
+
 @pytest.fixture
 def pyls(tmpdir):
     """ Return an initialized python LS """
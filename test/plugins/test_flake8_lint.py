@@ -84,3 +84,22 @@ def test_flake8_executable_param(workspace):
 
         call_args = popen_mock.call_args.args[0]
         assert flake8_executable in call_args
+
+
+def test_flake8_persistent(workspace, tmpdir):
+    doc = Document('', workspace, DOC)
+    flake8_conf = tmpdir.join('flake8.cfg')
+    flake8_conf.write('[flake8]\nignore = F841\n')
+    workspace._config.update({'plugins': {'flake8': {'persistent': True, 'config': str(flake8_conf)}}})
+
+    with patch('pyls.plugins.flake8_lint.Popen') as popen_mock:
+        diags = flake8_lint.pyls_lint(workspace, doc)
+        assert not popen_mock.called
+    assert diags
+    assert 'F841' not in [d['code'] for d in diags]
+
+    # The worker picks up changes to the config
+    flake8_conf.write('[flake8]\nselect = F\n')
+    os.utime(str(flake8_conf), (0, 0))
+    codes = [d['code'] for d in flake8_lint.pyls_lint(workspace, doc)]
+    assert codes == ['F401', 'F841']
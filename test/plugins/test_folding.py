@@ -1,9 +1,11 @@
 # Copyright 2019 Palantir Technologies, Inc.
 
+import os
 from textwrap import dedent
 
 from pyls import uris
 from pyls.workspace import Document
+from pyls.plugins import folding
 from pyls.plugins.folding import pyls_folding_range
 
 
@@ -166,3 +168,18 @@ def test_folding_syntax_error(workspace):
                 {'startLine': 26, 'endLine': 28},
                 {'startLine': 27, 'endLine': 28}]
     assert ranges == expected
+
+
+def test_folding_incremental(workspace):
+    doc_uri = uris.from_fs_path(os.path.join(workspace.root_path, 'incremental.py'))
+    pyls_folding_range(Document(doc_uri, workspace, DOC))
+    parse = folding._parses.get(doc_uri)
+
+    # Each version is updated from the previous one, and folded like a fresh document
+    lines = DOC.splitlines(True)
+    sources = [''.join(lines[:20] + lines[25:]), SYNTAX_ERR, DOC, DOC + 'def tail(\n', DOC]
+    for i, source in enumerate(sources):
+        fresh_uri = uris.from_fs_path(os.path.join(workspace.root_path, 'fresh{}.py'.format(i)))
+        expected = pyls_folding_range(Document(fresh_uri, workspace, source))
+        assert pyls_folding_range(Document(doc_uri, workspace, source)) == expected
+        assert folding._parses.get(doc_uri) is parse
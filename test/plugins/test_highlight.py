@@ -54,3 +54,21 @@ def test_sys_highlight(workspace):
         },
         'kind': lsp.DocumentHighlightKind.Read
     }]
+
+
+def test_utf16_highlight(workspace):
+    # The snake takes two UTF-16 code units, which clients count columns in
+    doc = Document(DOC_URI, workspace, u'"\U0001F40D"; a = 1\nprint(a)\n')
+    assert pyls_document_highlight(doc, {'line': 0, 'character': 6}) == [{
+        'range': {
+            'start': {'line': 0, 'character': 6},
+            'end': {'line': 0, 'character': 7}
+        },
+        'kind': lsp.DocumentHighlightKind.Write
+    }, {
+        'range': {
+            'start': {'line': 1, 'character': 6},
+            'end': {'line': 1, 'character': 7}
+        },
+        'kind': lsp.DocumentHighlightKind.Read
+    }]
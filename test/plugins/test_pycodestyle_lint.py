@@ -1,5 +1,7 @@
 # Copyright 2017 Palantir Technologies, Inc.
 import os
+from mock import patch
+import pycodestyle
 from pyls import lsp, uris
 from pyls.workspace import Document
 from pyls.plugins import pycodestyle_lint
@@ -108,3 +110,44 @@ def test_pycodestyle_config(workspace):
     assert not [d for d in diags if d['code'] == 'W191']
     assert not [d for d in diags if d['code'] == 'E201']
     assert [d for d in diags if d['code'] == 'W391']
+
+
+def test_pycodestyle_incremental(workspace):
+    doc = Document(DOC_URI, workspace, DOC)
+    full = pycodestyle_lint.pyls_lint(workspace, doc)
+
+    workspace._config.update({'plugins': {'pycodestyle': {'incremental': True}}})
+    assert pycodestyle_lint.pyls_lint(workspace, doc) == full
+    # The second run is answered from the cache
+    assert pycodestyle_lint.pyls_lint(workspace, doc) == full
+
+    # Shifting the lines down reuses the cached results at their new position
+    doc = Document(DOC_URI, workspace, 'import os\n' + DOC)
+    diags = pycodestyle_lint.pyls_lint(workspace, doc)
+    workspace._config.update({'plugins': {'pycodestyle': {'incremental': False}}})
+    assert diags == pycodestyle_lint.pyls_lint(workspace, doc)
+
+
+def test_pycodestyle_incremental_checks_changed_lines(workspace):
+    workspace._config.update({'plugins': {'pycodestyle': {'incremental': True}}})
+    source = ''.join('x{0} = ( {0})\n'.format(i) for i in range(20))
+    doc = Document(DOC_URI, workspace, source)
+    pycodestyle_lint.pyls_lint(workspace, doc)
+
+    checked = []
+
+    def run_check(self, check, argument_names):
+        if check is pycodestyle.extraneous_whitespace:
+            checked.append(self.logical_line)
+        return pycodestyle.Checker.run_check(self, check, argument_names)
+
+    lines = source.splitlines(True)
+    lines[10] = 'x10 = (10)\n'
+    doc = Document(DOC_URI, workspace, ''.join(lines))
+    with patch.object(pycodestyle_lint.IncrementalChecker, 'run_check', run_check):
+        diags = pycodestyle_lint.pyls_lint(workspace, doc)
+
+    # The line after the edit is checked again too, as its checks look at the previous logical line
+    assert checked == ['x10 = (10)', 'x11 = ( 11)']
+    assert sorted(d['range']['start']['line'] for d in diags if d['code'] == 'E201') == \
+        [i for i in range(20) if i != 10]
@@ -84,6 +84,37 @@ def test_syntax_error_pylint_py3(config, workspace):
         assert diag['severity'] == lsp.DiagnosticSeverity.Error
 
 
+@py3_only
+def test_pylint_persistent(config, workspace):
+    config.plugin_settings('pylint')['persistent'] = True
+    with temp_document(DOC, workspace) as doc:
+        diags = pylint_lint.pyls_lint(config, doc, False)
+        msg = 'Unused import sys (unused-import)'
+        unused_import = [d for d in diags if d['message'] == msg][0]
+        assert unused_import['range']['start'] == {'line': 0, 'character': 0}
+        assert unused_import['severity'] == lsp.DiagnosticSeverity.Warning
+
+        # The worker lints unsaved changes and doesn't hold on to the previous version
+        doc.apply_change({'text': 'import json\n\nprint(json)\n'})
+        diags = pylint_lint.pyls_lint(config, doc, False)
+        assert not [d for d in diags if d['code'] == 'W0611']
+
+
+@py3_only
+def test_pylint_persistent_changed_import(tmpdir):
+    module = tmpdir.join('imported.py')
+    module.write('def f():\n    pass\n')
+    importer = tmpdir.join('importer.py')
+    params = {'args': ['--disable=all', '--enable=E1121'], 'path': str(importer),
+              'source': 'from imported import f\nf(1)\n'}
+
+    # Like the worker, astroid's cache is kept between lints, but not once the imported module changes
+    assert 'E1121' in pylint_lint._lint_in_worker(params)
+    module.write('def f(x):\n    return x\n')
+    module.setmtime(module.mtime() + 10)
+    assert 'E1121' not in pylint_lint._lint_in_worker(params)
+
+
 @py2_only
 def test_syntax_error_pylint_py2(config, workspace):
     with temp_document(DOC_SYNTAX_ERR, workspace) as doc:
@@ -1,14 +1,17 @@
 # Copyright 2017 Palantir Technologies, Inc.
 import os
 
+from mock import patch
 import pytest
 
 from pyls import uris
 from pyls.workspace import Document
-from pyls.plugins.references import pyls_references
+from pyls.plugins import references
 from pyls._utils import PY2
 
 
+TIMEOUT = 10
+
 DOC1_NAME = 'test1.py'
 DOC2_NAME = 'test2.py'
 
@@ -25,6 +28,10 @@ except UnicodeError:
 """
 
 
+def pyls_references(workspace, document, position, exclude_declaration=False, on_partial=None):
+    return references.pyls_references(workspace, document, position, exclude_declaration, on_partial)
+
+
 @pytest.fixture
 def tmp_workspace(temp_workspace_factory):
     return temp_workspace_factory({
@@ -39,13 +46,13 @@ def test_references(tmp_workspace):  # pylint: disable=redefined-outer-name
     DOC1_URI = uris.from_fs_path(os.path.join(tmp_workspace.root_path, DOC1_NAME))
     doc1 = Document(DOC1_URI, tmp_workspace)
 
-    refs = pyls_references(doc1, position)
+    refs = pyls_references(tmp_workspace, doc1, position)
 
     # Definition, the import and the instantiation
     assert len(refs) == 3
 
     # Briefly check excluding the definitions (also excludes imports, only counts uses)
-    no_def_refs = pyls_references(doc1, position, exclude_declaration=True)
+    no_def_refs = pyls_references(tmp_workspace, doc1, position, exclude_declaration=True)
     assert len(no_def_refs) == 1
 
     # Make sure our definition is correctly located
@@ -71,10 +78,34 @@ def test_references_builtin(tmp_workspace):  # pylint: disable=redefined-outer-n
     doc2_uri = uris.from_fs_path(os.path.join(str(tmp_workspace.root_path), DOC2_NAME))
     doc2 = Document(doc2_uri, tmp_workspace)
 
-    refs = pyls_references(doc2, position)
+    refs = pyls_references(tmp_workspace, doc2, position)
     assert len(refs) >= 1
 
     expected = {'start': {'line': 4, 'character': 7},
                 'end': {'line': 4, 'character': 19}}
     ranges = [r['range'] for r in refs]
     assert expected in ranges
+
+
+def test_references_indexed(tmp_workspace):  # pylint: disable=redefined-outer-name
+    position = {'line': 0, 'character': 8}
+    doc1 = Document(uris.from_fs_path(os.path.join(tmp_workspace.root_path, DOC1_NAME)), tmp_workspace)
+    unrelated_path = os.path.join(tmp_workspace.root_path, 'unrelated.py')
+    with open(unrelated_path, 'w') as f:
+        f.write('class Other(object):\n    pass\n')
+    assert tmp_workspace.index.wait(TIMEOUT)
+    tmp_workspace.reindex(uris.from_fs_path(unrelated_path))
+
+    # Only the files using the name are searched, without walking the project like jedi does
+    search = 'jedi.inference.references.get_module_contexts_containing_name'
+    with patch(search, side_effect=AssertionError), \
+            patch('pyls.plugins.references._file_references', wraps=references._file_references) as searched:
+        refs = pyls_references(tmp_workspace, doc1, position)
+    assert [args[1] for args, _ in searched.call_args_list] == [os.path.join(tmp_workspace.root_path, DOC2_NAME)]
+    assert len(refs) == 3
+
+    # References can be streamed as they are confirmed, a module at a time
+    partials = []
+    assert pyls_references(tmp_workspace, doc1, position, on_partial=partials.append) == []
+    assert [len(partial) for partial in partials] == [1, 2]
+    assert [ref for partial in partials for ref in partial] == refs
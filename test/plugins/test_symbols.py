@@ -88,3 +88,31 @@ def test_symbols_all_scopes_with_jedi_environment(workspace):
     doc.update_config(settings)
     symbols = pyls_document_symbols(doc._config, doc)
     helper_check_symbols_all_scope(symbols)
+
+
+def test_symbols_hierarchical(config, workspace):
+    doc = Document(DOC_URI, workspace, DOC)
+    config.capabilities['textDocument'] = {'documentSymbol': {'hierarchicalDocumentSymbolSupport': True}}
+    symbols = pyls_document_symbols(config, doc)
+
+    assert [s['name'] for s in symbols] == ['sys', 'a', 'B', 'main']
+    klass = symbols[2]
+    assert klass['kind'] == SymbolKind.Class
+    assert klass['selectionRange']['start'] == {'line': 4, 'character': 6}
+
+    init = klass['children'][0]
+    assert init['name'] == '__init__'
+    assert init['kind'] == SymbolKind.Method
+    assert [(s['name'], s['kind']) for s in init['children']] == [('x', SymbolKind.Variable), ('y', SymbolKind.Field)]
+
+    main = symbols[3]
+    assert main['range'] == {'start': {'line': 9, 'character': 0}, 'end': {'line': 12, 'character': 0}}
+    assert [s['name'] for s in main['children']] == ['y']
+
+
+def test_symbols_without_imports(config, workspace):
+    doc = Document(DOC_URI, workspace, DOC)
+    config.update({'plugins': {'jedi_symbols': {'include_import_symbols': False}}})
+    symbols = pyls_document_symbols(config, doc)
+    assert 'sys' not in [s['name'] for s in symbols]
+    assert len(symbols) == 7
@@ -0,0 +1,35 @@
+# Copyright 2017 Palantir Technologies, Inc.
+import os
+
+from pyls import lsp, uris
+
+TIMEOUT = 10
+
+
+def test_workspace_symbols(pyls):
+    assert pyls.workspace.index.wait(TIMEOUT)
+    assert not pyls.workspace_symbols('sav')
+
+    # Files changed on disk are indexed again once the client tells us about them
+    path = os.path.join(pyls.workspace.root_path, 'module.py')
+    doc_uri = uris.from_fs_path(path)
+    with open(path, 'w') as f:
+        f.write('class Saved(object):\n    pass\n')
+    pyls.m_workspace__did_change_watched_files(changes=[{'uri': doc_uri, 'type': 1}])
+
+    assert pyls.workspace_symbols('sav') == [{
+        'name': 'Saved',
+        'kind': lsp.SymbolKind.Class,
+        'location': {
+            'uri': doc_uri,
+            'range': {'start': {'line': 0, 'character': 0}, 'end': {'line': 2, 'character': 0}},
+        },
+    }]
+
+    # Open documents are indexed with the content of their buffer
+    pyls.workspace.put_document(doc_uri, 'class Saved(object):\n    def edited(self):\n        pass\n')
+    symbols = pyls.workspace_symbols('edit')
+    assert [(s['name'], s['containerName']) for s in symbols] == [('edited', 'Saved')]
+
+    pyls.workspace.rm_document(doc_uri)
+    assert not pyls.workspace_symbols('edit')
@@ -0,0 +1,118 @@
+# Copyright 2017 Palantir Technologies, Inc.
+import json
+import os
+import socket
+import socketserver
+import time
+from threading import Thread
+
+import pytest
+
+from pyls import _daemon
+from pyls.python_ls import PythonLanguageServer, create_socket_lang_server, start_unix_lang_server
+
+pytestmark = pytest.mark.skipif(not hasattr(socket, 'AF_UNIX'), reason='Unix domain sockets are unavailable')
+
+TIMEOUT = 10
+
+
+@pytest.fixture
+def socket_path(tmpdir):
+    """The path of a multi client server on a Unix domain socket."""
+    path = str(tmpdir.join('pyls.sock'))
+    server = create_socket_lang_server(socketserver.ThreadingUnixStreamServer, path, False, PythonLanguageServer,
+                                       multi_client=True)
+    thread = Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield path
+    server.shutdown()
+    server.server_close()
+
+
+def _message(content):
+    body = json.dumps(content).encode('utf-8')
+    return b'Content-Length: ' + str(len(body)).encode('ascii') + b'\r\n\r\n' + body
+
+
+def test_attach(socket_path, tmpdir):  # pylint: disable=redefined-outer-name
+    stdin_r, stdin_w = os.pipe()
+    stdout_r, stdout_w = os.pipe()
+    with os.fdopen(stdin_r, 'rb') as rfile, os.fdopen(stdout_w, 'wb') as wfile:
+        shim = Thread(target=_daemon.attach, args=(socket_path, rfile, wfile))
+        shim.daemon = True
+        shim.start()
+
+        with os.fdopen(stdin_w, 'wb') as requests:
+            requests.write(_message({'jsonrpc': '2.0', 'id': 1, 'method': 'initialize', 'params': {
+                'rootUri': 'file://' + str(tmpdir), 'processId': None,
+            }}))
+            requests.write(_message({'jsonrpc': '2.0', 'id': 2, 'method': 'shutdown'}))
+            requests.write(_message({'jsonrpc': '2.0', 'method': 'exit'}))
+
+        # The server hangs up once the client exits, which ends the shim
+        shim.join(TIMEOUT)
+        assert not shim.is_alive()
+
+    with os.fdopen(stdout_r, 'rb') as responses:
+        output = responses.read()
+    assert b'"capabilities"' in output
+    assert b'"id": 2' in output or b'"id":2' in output
+
+
+def test_attach_to_running_server(socket_path):  # pylint: disable=redefined-outer-name
+    # A second server leaves the socket to the running one
+    start_unix_lang_server(socket_path, False, PythonLanguageServer, multi_client=True)
+    sock = _daemon.connect(socket_path)
+    assert sock is not None
+    sock.close()
+
+    assert _daemon.connect(socket_path + '.missing') is None
+
+
+def test_other_users_server(socket_path, monkeypatch):  # pylint: disable=redefined-outer-name
+    # The editor's documents are only sent to the current user's servers
+    other_uid = os.getuid() + 1
+    monkeypatch.setattr(os, 'getuid', lambda: other_uid)
+    with pytest.raises(IOError):
+        _daemon.connect(socket_path)
+
+
+def test_default_socket_path(tmpdir, monkeypatch):
+    monkeypatch.setenv('XDG_RUNTIME_DIR', str(tmpdir))
+    socket_dir = os.path.dirname(_daemon.default_socket_path())
+    assert os.path.dirname(socket_dir) == str(tmpdir)
+    assert os.stat(socket_dir).st_mode & 0o777 == 0o700
+
+    # A directory others can get into, such as one planted in a shared temporary directory, isn't used
+    os.chmod(socket_dir, 0o755)
+    with pytest.raises(IOError):
+        _daemon.default_socket_path()
+
+
+def test_idle_timeout(tmpdir):
+    path = str(tmpdir.join('idle.sock'))
+    server = Thread(target=start_unix_lang_server, args=(path, False, PythonLanguageServer),
+                    kwargs={'multi_client': True, 'idle_timeout': 1})
+    server.daemon = True
+
+    # Servers take turns checking for a server on the socket and binding it
+    with _daemon.socket_lock(path):
+        server.start()
+        time.sleep(0.2)
+        assert not os.path.exists(path)
+
+    deadline = time.time() + TIMEOUT
+    sock = None
+    while sock is None and time.time() < deadline:
+        time.sleep(0.05)
+        sock = _daemon.connect(path)
+    assert sock is not None
+
+    # The server outlives the timeout while it has a client, and shuts down after its last one leaves
+    time.sleep(1.5)
+    assert server.is_alive()
+    sock.close()
+    server.join(TIMEOUT)
+    assert not server.is_alive()
+    assert not os.path.exists(path)
@@ -1,5 +1,10 @@
 # Copyright 2017 Palantir Technologies, Inc.
+import ast
+
 from test.fixtures import DOC_URI, DOC
+import pytest
+from pyls import _utils
+from pyls.plugins import mccabe_lint, pyflakes_lint
 from pyls.workspace import Document
 
 
@@ -27,6 +32,29 @@ def test_offset_at_position(doc):
     assert doc.offset_at_position({'line': 4, 'character': 0}) == 51
 
 
+def test_line_offsets_follow_edits(workspace):
+    doc = Document('file:///uri', workspace, u'ab\ncd\n')
+    assert doc.line_offsets == [0, 3, 6]
+    doc.apply_change({'text': u'x\ny', 'range': {
+        'start': {'line': 0, 'character': 1},
+        'end': {'line': 0, 'character': 1}
+    }})
+    assert doc.source == u'ax\nyb\ncd\n'
+    assert doc.line_offsets == [0, 3, 6, 9]
+    assert doc.offset_at_position({'line': 2, 'character': 1}) == 7
+
+
+def test_utf16_positions(workspace):
+    doc = Document('file:///uri', workspace, u'x = "\U0001F40D"; y\n')
+    assert doc.position_to_utf16({'line': 0, 'character': 9}) == {'line': 0, 'character': 10}
+    assert doc.position_from_utf16({'line': 0, 'character': 10}) == {'line': 0, 'character': 9}
+    assert doc.position_from_utf16({'line': 1, 'character': 0}) == {'line': 1, 'character': 0}
+
+    # Positions sent by clients count UTF-16 code units
+    assert doc.offset_at_position({'line': 0, 'character': 10}) == 9
+    assert _utils.position_to_jedi_linecolumn(doc, {'line': 0, 'character': 10}) == {'line': 1, 'column': 9}
+
+
 def test_word_at_position(doc):
     """ Return the position under the cursor (or last in line if past the end) """
     # import sys
@@ -97,3 +125,91 @@ def test_document_end_of_file_edit(workspace):
         "print 'b'\n",
         "o",
     ]
+
+
+def test_document_edit_joins_lines(workspace):
+    doc = Document('file:///uri', workspace, u'a\r\nb\nc\n')
+    # Removing "\nb" leaves the "\r" followed by the "\n" of the next line
+    doc.apply_change({'text': u'', 'range': {
+        'start': {'line': 1, 'character': 0},
+        'end': {'line': 2, 'character': 0}
+    }})
+    assert doc.source == u'a\r\nc\n'
+    assert doc.lines == [u'a\r\n', u'c\n']
+
+    # Inserting a newline splits a line in two
+    doc.apply_change({'text': u'\r', 'range': {
+        'start': {'line': 0, 'character': 1},
+        'end': {'line': 0, 'character': 1}
+    }})
+    assert doc.lines == [u'a\r', u'\r\n', u'c\n']
+
+
+def test_document_lines_not_mutated_by_edit(workspace):
+    doc = Document('file:///uri', workspace, u'a\nb\n')
+    lines = doc.lines
+    doc.apply_change({'text': u'x', 'range': {
+        'start': {'line': 1, 'character': 0},
+        'end': {'line': 1, 'character': 1}
+    }})
+    assert lines == [u'a\n', u'b\n']
+    assert doc.lines == [u'a\n', u'x\n']
+
+
+def test_jedi_script_reused_until_change(doc):
+    script = doc.jedi_script()
+    assert doc.jedi_script() is script
+    assert doc.jedi_script(use_document_path=True) is not script
+
+    doc.apply_change({'text': u'# comment\n', 'range': {
+        'start': {'line': 0, 'character': 0},
+        'end': {'line': 0, 'character': 0}
+    }})
+    changed = doc.jedi_script()
+    assert changed is not script
+    assert doc.jedi_script() is changed
+
+    doc.update_config({'pyls': {'plugins': {'jedi': {'extra_paths': ['/tmp']}}}})
+    assert doc.jedi_script() is not changed
+
+
+def test_parses_reused_until_change(workspace):
+    doc = Document(DOC_URI, workspace, u'import sys\n\ndef main():\n    print(sys.stdin.read())\n')
+    tree, tokens, module = doc.ast_tree, doc.tokens, doc.parso_tree
+    assert doc.ast_tree is tree
+    assert doc.tokens is tokens
+    assert doc.parso_tree is module
+
+    doc.apply_change({'text': u'# comment\n', 'range': {
+        'start': {'line': 0, 'character': 0},
+        'end': {'line': 0, 'character': 0}
+    }})
+    assert doc.ast_tree is not tree
+    assert doc.tokens is not tokens
+    assert doc.parso_tree is not module
+    assert doc.parso_tree.get_code() == doc.source
+
+
+def test_parses_shared_unchanged(workspace):
+    source = u'import os\n\n\ndef main(arg):\n    if arg:\n        return undefined\n    return os.sep\n'
+    doc = Document(DOC_URI, workspace, source)
+    workspace._config.update({'plugins': {'mccabe': {'threshold': 2}}})
+    flakes = pyflakes_lint.pyls_lint(doc)
+    assert [d['message'] for d in flakes] == ["undefined name 'undefined'"]
+
+    # pyflakes annotates the nodes with attributes of its own, but the tree is the same for whoever comes next
+    assert ast.dump(doc.ast_tree, include_attributes=True) == ast.dump(ast.parse(source), include_attributes=True)
+    complexity = mccabe_lint.pyls_lint(workspace._config, doc)
+    assert [d['message'] for d in complexity] == ['Cyclomatic complexity too high: 2 (threshold 2)']
+    assert complexity == mccabe_lint.pyls_lint(workspace._config, Document(DOC_URI, workspace, source))
+    assert pyflakes_lint.pyls_lint(doc) == flakes
+
+
+def test_parse_errors_cached(workspace):
+    doc = Document(DOC_URI, workspace, u'def f(:\n')
+    for _ in range(2):
+        with pytest.raises(SyntaxError) as exc_info:
+            doc.ast_tree  # pylint: disable=pointless-statement
+        assert exc_info.value.lineno == 1
+    # parso recovers from the error
+    assert doc.parso_tree.get_code() == doc.source
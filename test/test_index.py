@@ -0,0 +1,144 @@
+# Copyright 2017 Palantir Technologies, Inc.
+import io
+import os
+import sqlite3
+
+from mock import patch
+
+from pyls import lsp, _index
+
+TIMEOUT = 10
+
+SOURCE = '''import os
+
+CONSTANT = 1
+a.b = 2
+
+
+class Outer(object):
+    attribute = None
+
+    class Inner(object):
+        def method(self):
+            local = 1
+
+
+def function():
+    pass
+
+if os:
+    @decorator
+    def conditional():
+        pass
+'''
+
+
+def _write(path, source):
+    with io.open(path, 'w', encoding='utf-8') as f:
+        f.write(source)
+
+
+def test_extract_symbols():
+    indexed_file = _index.index_file('/tmp/module.py', SOURCE)
+    assert indexed_file.imports == ['os']
+    assert 'local' in indexed_file.names and 'decorator' in indexed_file.names
+    symbols = indexed_file.symbols
+    assert [(s.name, s.kind, s.container) for s in symbols] == [
+        ('CONSTANT', lsp.SymbolKind.Variable, None),
+        ('Outer', lsp.SymbolKind.Class, None),
+        ('attribute', lsp.SymbolKind.Field, 'Outer'),
+        ('Inner', lsp.SymbolKind.Class, 'Outer'),
+        ('method', lsp.SymbolKind.Method, 'Outer.Inner'),
+        ('function', lsp.SymbolKind.Function, None),
+        ('conditional', lsp.SymbolKind.Function, None),
+    ]
+    assert symbols[1].range == (6, 0, 12, 0)
+    assert symbols[0].range == (2, 0, 2, 8)
+
+
+def test_search(tmpdir):
+    _write(str(tmpdir.join('module.py')), SOURCE)
+    tmpdir.mkdir('.hidden').join('hidden.py').write('Outermost = 1\n')
+    index = _index.WorkspaceIndex(str(tmpdir))
+    index.start()
+    assert index.wait(TIMEOUT)
+
+    # Short queries match by prefix, longer ones by substring, in any case
+    assert [s.name for s in index.search('o')] == ['Outer']
+    assert [s.name for s in index.search('IN')] == ['Inner']
+    assert [s.name for s in index.search('ion')] == ['function', 'conditional']
+    # Exact matches come first, then prefixes
+    assert [s.name for s in index.search('inner')] == ['Inner']
+    assert [s.name for s in index.search('out')] == ['Outer']
+    assert len(index.search('')) == 7
+    assert len(index.search('', limit=2)) == 2
+
+
+def test_search_stale(tmpdir):
+    path = str(tmpdir.join('module.py'))
+    _write(path, 'def first():\n    pass\n')
+    index = _index.WorkspaceIndex(str(tmpdir))
+    index.start()
+    assert index.wait(TIMEOUT)
+    assert [s.name for s in index.search('fir')] == ['first']
+
+    # Changes are picked up once the file is marked stale
+    _write(path, 'def second():\n    pass\n')
+    assert [s.name for s in index.search('fir')] == ['first']
+    index.mark_stale(path)
+    assert not index.search('fir')
+    assert [s.path for s in index.search('sec')] == [path]
+
+    os.remove(path)
+    index.mark_stale(path)
+    assert not index.search('')
+
+
+def test_store_reused_after_restart(tmpdir):
+    db_path = str(tmpdir.join('index.sqlite'))
+    root = tmpdir.mkdir('root')
+    _write(str(root.join('first.py')), 'def first():\n    pass\n')
+    _write(str(root.join('second.py')), 'def second():\n    pass\n')
+    _write(str(root.join('gone.py')), 'def gone():\n    pass\n')
+
+    index = _index.WorkspaceIndex(str(root), store=_index.IndexStore(db_path))
+    index.start()
+    assert index.wait(TIMEOUT)
+    index.stop()
+
+    # Only files whose stat changed are read again, and only those whose content changed are parsed
+    _write(str(root.join('first.py')), 'def changed():\n    pass\n')
+    os.utime(str(root.join('second.py')), (0, 0))
+    os.remove(str(root.join('gone.py')))
+    with patch.object(_index, 'index_file', wraps=_index.index_file) as index_file:
+        index = _index.WorkspaceIndex(str(root), store=_index.IndexStore(db_path))
+        index.start()
+        assert index.wait(TIMEOUT)
+    assert [args[0] for args, _ in index_file.call_args_list] == [str(root.join('first.py'))]
+    assert [s.name for s in index.search('')] == ['second', 'changed']
+    index.stop()
+    assert sorted(_index.IndexStore(db_path).load()) == [str(root.join('first.py')), str(root.join('second.py'))]
+
+
+def test_store_schema_version(tmpdir):
+    db_path = str(tmpdir.join('index.sqlite'))
+    store = _index.IndexStore(db_path)
+    store.put('/tmp/module.py', 1.0, 2, 'hash', '{}')
+    store.close()
+
+    conn = sqlite3.connect(db_path)
+    conn.execute('PRAGMA user_version = 0')
+    conn.close()
+    # Rows of another schema version are dropped
+    assert _index.IndexStore(db_path).load() == {}
+
+
+def test_store_recovers_from_corruption(tmpdir):
+    db_path = str(tmpdir.join('index.sqlite'))
+    with open(db_path, 'wb') as f:
+        f.write(b'not a database' * 100)
+
+    store = _index.IndexStore(db_path)
+    store.put('/tmp/module.py', 1.0, 2, 'hash', '{}')
+    store.flush()
+    assert store.get('/tmp/module.py') == (1.0, 2, 'hash', '{}')
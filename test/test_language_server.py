@@ -1,14 +1,21 @@
 # Copyright 2017 Palantir Technologies, Inc.
+import contextlib
 import os
 import time
 import multiprocessing
 import sys
-from threading import Thread
+from threading import Event, Thread
 
-from pyls_jsonrpc.exceptions import JsonRpcMethodNotFound
+from pyls_jsonrpc.exceptions import JsonRpcMethodNotFound, JsonRpcRequestCancelled
 import pytest
 
-from pyls.python_ls import start_io_lang_server, PythonLanguageServer
+from pyls import _utils, hookimpl, scheduler, uris
+from pyls.python_ls import start_io_lang_server, flatten, PythonLanguageServer, SharedCaches
+
+if sys.version_info[0] < 3:
+    from StringIO import StringIO
+else:
+    from io import StringIO
 
 CALL_TIMEOUT = 10
 PY2 = sys.version_info[0] == 2
@@ -113,3 +120,300 @@ def test_not_exit_without_check_parent_process_flag(client_server):  # pylint: d
 def test_missing_message(client_server):  # pylint: disable=redefined-outer-name
     with pytest.raises(JsonRpcMethodNotFound):
         client_server._endpoint.request('unknown_method').result(timeout=CALL_TIMEOUT)
+
+
+@contextlib.contextmanager
+def _requests_held(pyls):
+    """Keep the requests using jedi queued until the end of the block, as they run one at a time."""
+    started, release = Event(), Event()
+    pyls._scheduler.submit(scheduler.COMPLETION, lambda: started.set() or release.wait(CALL_TIMEOUT))
+    assert started.wait(CALL_TIMEOUT)
+    try:
+        yield
+    finally:
+        release.set()
+
+
+def test_cancel_request(pyls):
+    doc_uri = uris.from_fs_path(os.path.join(pyls.workspace.root_path, 'cancel.py'))
+    pyls.workspace.put_document(doc_uri, 'def main():\n    pass\n')
+    params = {'textDocument': {'uri': doc_uri}}
+
+    # Hold up the requests so that this one is cancelled before it starts
+    with _requests_held(pyls):
+        future = pyls['textDocument/documentSymbol'](params)
+        # The client still gets a response for a cancelled request
+        assert not future.cancel()
+    with pytest.raises(JsonRpcRequestCancelled):
+        future.result(timeout=CALL_TIMEOUT)
+
+    symbols = pyls['textDocument/documentSymbol'](params).result(timeout=CALL_TIMEOUT)
+    assert [s['name'] for s in symbols] == ['main']
+
+
+def test_coalesce_requests(pyls, monkeypatch):
+    doc_uri = uris.from_fs_path(os.path.join(pyls.workspace.root_path, 'coalesce.py'))
+    pyls.workspace.put_document(doc_uri, 'one = 1\ntwo = one\nthree = two\n')
+    looked_up = []
+    definitions = pyls.definitions
+    monkeypatch.setattr(pyls, 'definitions', lambda uri, position: looked_up.append(position) or
+                        definitions(uri, position))
+
+    def params(line, character):
+        return {'textDocument': {'uri': doc_uri}, 'position': {'line': line, 'character': character}}
+
+    # Hold up the requests, so that they're all queued together
+    with _requests_held(pyls):
+        first = pyls['textDocument/definition'](params(0, 0))
+        two = [pyls['textDocument/definition'](params(2, 8)), pyls['textDocument/definition'](params(2, 8))]
+        one = pyls['textDocument/definition'](params(1, 6))
+        hover = pyls['textDocument/hover'](params(2, 8))
+        stale = pyls['textDocument/completion'](params(2, 8))
+        fresh = pyls['textDocument/completion'](params(2, 9))
+
+    for future in [first] + two + [one, hover, fresh]:
+        future.result(timeout=CALL_TIMEOUT)
+    # Only an outdated completion is cancelled, and identical requests are answered once
+    with pytest.raises(JsonRpcRequestCancelled):
+        stale.result(timeout=CALL_TIMEOUT)
+    assert two[0].result() == two[1].result() != one.result()
+    assert sorted(p['line'] for p in looked_up) == [0, 1, 2]
+    assert 'two' in [c['label'] for c in fresh.result()['items']]
+
+
+def test_hook_stops_once_cancelled(pyls):
+    token = _utils.CancellationToken()
+    token.cancel()
+    with _utils.cancellation_scope(token):
+        with pytest.raises(JsonRpcRequestCancelled):
+            pyls._hook('pyls_commands')
+
+
+def _linter(lint):
+    """A linter plugin, whose pyls_lint returns lint(document)."""
+    class Linter(object):
+        @staticmethod
+        @hookimpl
+        def pyls_lint(document):
+            return lint(document)
+    return Linter()
+
+
+@pytest.fixture
+def add_linter(pyls):
+    """Register a linter called name with pyls, whose pyls_lint returns lint(document), in the given lint tier."""
+    tiers = {}
+
+    def add(name, lint, tier=None):
+        pyls.config.plugin_manager.register(_linter(lint), name=name)
+        if tier is not None:
+            tiers[name] = tier
+            pyls.config.update({'plugins': {linter: {'lintTier': t} for linter, t in tiers.items()}})
+    return add
+
+
+def test_lint_cache(pyls, add_linter):  # pylint: disable=redefined-outer-name
+    linted = []
+
+    def counting(document):
+        linted.append(document.source)
+        return [{'source': 'counting', 'message': 'linted'}]
+
+    add_linter('counting', counting)
+    doc_uri = uris.from_fs_path(os.path.join(pyls.workspace.root_path, 'cached.py'))
+    pyls.workspace.put_document(doc_uri, 'a = 1\n')
+
+    def lint(is_saved=False):
+        return [d for d in pyls._lint_document(doc_uri, is_saved) if d['source'] == 'counting']
+
+    assert lint() == lint(is_saved=True) == [{'source': 'counting', 'message': 'linted'}]
+    assert linted == ['a = 1\n']
+
+    # Linters only run again when the content or their settings change
+    pyls.workspace.update_document(doc_uri, {'text': 'a = 2\n'})
+    lint()
+    pyls.workspace.update_document(doc_uri, {'text': 'a = 1\n'})
+    lint()
+    assert linted == ['a = 1\n', 'a = 2\n']
+
+    pyls.m_workspace__did_change_configuration({'pyls': {'plugins': {'counting': {'option': True}}}})
+    lint()
+    assert linted == ['a = 1\n', 'a = 2\n', 'a = 1\n']
+
+
+def test_result_cache(pyls):
+    computed = []
+
+    class CountingSymbols(object):
+        @staticmethod
+        @hookimpl
+        def pyls_document_symbols(document):
+            computed.append(document.version)
+            return [{'name': 'counting', 'version': document.version}]
+
+    pyls.config.plugin_manager.register(CountingSymbols(), name='counting')
+    doc_uri = uris.from_fs_path(os.path.join(pyls.workspace.root_path, 'memoized.py'))
+    pyls.workspace.put_document(doc_uri, 'a = 1\n', version=1)
+
+    def symbols():
+        return [s for s in pyls.document_symbols(doc_uri) if s['name'] == 'counting']
+
+    assert symbols() == symbols() == [{'name': 'counting', 'version': 1}]
+    assert computed == [1]
+
+    # A new version, a reopened document or new settings compute them again
+    pyls.workspace.update_document(doc_uri, {'text': 'a = 2\n'}, version=2)
+    assert symbols() == [{'name': 'counting', 'version': 2}]
+    pyls.workspace.put_document(doc_uri, 'a = 2\n', version=2)
+    symbols()
+    pyls.m_workspace__did_change_configuration({'pyls': {'plugins': {'counting': {'option': True}}}})
+    symbols()
+    assert computed == [1, 2, 2, 2]
+
+    # Documents without a version may have changed on disk
+    pyls.workspace.put_document(doc_uri, 'a = 3\n')
+    symbols()
+    symbols()
+    assert computed == [1, 2, 2, 2, None, None]
+
+
+def test_shared_caches(tmpdir):
+    shared = SharedCaches()
+    root_uri = uris.from_fs_path(str(tmpdir))
+    servers = [PythonLanguageServer(StringIO(), StringIO(), shared=shared) for _ in range(2)]
+    for server in servers:
+        server.m_initialize(processId=1, rootUri=root_uri, initializationOptions={})
+    first, second = servers
+    assert first.config.plugin_manager is second.config.plugin_manager is shared.plugin_manager
+
+    linted = []
+
+    def counting(document):
+        linted.append(document.source)
+        return [{'source': 'counting', 'message': 'linted'}]
+
+    shared.plugin_manager.register(_linter(counting), name='counting')
+    try:
+        # Diagnostics are reused across clients, but documents aren't shared
+        doc_uri = uris.from_fs_path(str(tmpdir.join('shared.py')))
+        for server in servers:
+            server.workspace.put_document(doc_uri, 'def first():\n    pass\n')
+            server._lint_document(doc_uri, False)
+        assert linted == ['def first():\n    pass\n']
+
+        second.workspace.update_document(doc_uri, {'text': 'def second():\n    pass\n'})
+        assert [s.name for s in first.workspace.index.search('first')] == ['first']
+        assert not first.workspace.index.search('second')
+        assert [s.name for s in second.workspace.index.search('second')] == ['second']
+        assert not second.workspace.index.search('first')
+    finally:
+        shared.plugin_manager.unregister(name='counting')
+        for server in servers:
+            server.m_exit()
+
+
+def test_references_partial_results(pyls):
+    doc_uri = uris.from_fs_path(os.path.join(pyls.workspace.root_path, 'partial.py'))
+    pyls.workspace.put_document(doc_uri, 'def main():\n    pass\n\nmain()\n')
+    position = {'line': 0, 'character': 4}
+    expected = pyls.references(doc_uri, position, False)
+    assert len(expected) == 2
+
+    # With a partialResultToken, references are reported through $/progress and the response is empty
+    reported = []
+    pyls.workspace.report_progress = lambda token, value: reported.append((token, value))
+    assert pyls.references(doc_uri, position, False, partial_result_token='token') == []
+    assert [token for token, _ in reported] == ['token'] * len(reported)
+    assert [ref for _, value in reported for ref in value] == expected
+
+
+def test_parallel_lint(pyls, add_linter):  # pylint: disable=redefined-outer-name
+    second_started = Event()
+
+    def first(_document):
+        # Only finishes if the linters run concurrently
+        assert second_started.wait(CALL_TIMEOUT)
+        return [{'source': 'first'}]
+
+    def second(_document):
+        second_started.set()
+        return [{'source': 'second'}]
+
+    add_linter('first', first)
+    add_linter('second', second)
+    pyls.config.update({'lint': {'parallel': True}})
+    doc_uri = uris.from_fs_path(os.path.join(pyls.workspace.root_path, 'parallel.py'))
+    pyls.workspace.put_document(doc_uri, 'import os\n')
+
+    partials = []
+    diagnostics = pyls._lint_document(doc_uri, False, on_partial=partials.append)
+
+    # Diagnostics are merged in the order pluggy would call the plugins
+    assert diagnostics == flatten(pyls._hook('pyls_lint', doc_uri, is_saved=False))
+    assert {'source': 'second'} in diagnostics and {'source': 'first'} in diagnostics
+    # Each linter that finished before the last one published what had been gathered so far
+    assert partials
+    assert all(d in diagnostics for partial in partials for d in partial)
+
+
+def test_progressive_lint(pyls, add_linter):  # pylint: disable=redefined-outer-name
+    doc_uri = uris.from_fs_path(os.path.join(pyls.workspace.root_path, 'progressive.py'))
+    pyls.workspace.put_document(doc_uri, 'import os\n', version=1)
+    doc = pyls.workspace.get_document(doc_uri)
+    published = []
+    pyls.workspace.publish_diagnostics = lambda uri, diagnostics, version: published.append(
+        [d['source'] for d in diagnostics if d['source'] in ('fast', 'slow')])
+
+    def slow(_document):
+        # The fast tier has already been published
+        assert published == [['fast']]
+        return [{'source': 'slow'}]
+
+    add_linter('fast', lambda _document: [{'source': 'fast'}])
+    add_linter('slow', slow, tier='slow')
+
+    pyls._lint_progressively(pyls.workspace, doc, is_saved=False)
+    assert published == [['fast'], ['fast', 'slow']]
+
+
+def test_progressive_lint_drops_outdated(pyls, add_linter):  # pylint: disable=redefined-outer-name
+    doc_uri = uris.from_fs_path(os.path.join(pyls.workspace.root_path, 'outdated.py'))
+    pyls.workspace.put_document(doc_uri, 'import os\n', version=1)
+    doc = pyls.workspace.get_document(doc_uri)
+    published = []
+    pyls.workspace.publish_diagnostics = lambda uri, diagnostics, version: published.append(version)
+
+    def slow(_document):
+        pyls.workspace.update_document(doc_uri, {'text': 'import sys\n'}, version=2)
+        return [{'source': 'slow'}]
+
+    add_linter('slow', slow, tier='slow')
+
+    pyls._lint_progressively(pyls.workspace, doc, is_saved=False)
+    assert published == [1]
+
+
+def test_progressive_lint_keeps_slow_diagnostics(pyls, add_linter):  # pylint: disable=redefined-outer-name
+    doc_uri = uris.from_fs_path(os.path.join(pyls.workspace.root_path, 'kept.py'))
+    pyls.workspace.put_document(doc_uri, 'import os\n', version=1)
+    published = []
+    pyls.workspace.publish_diagnostics = lambda uri, diagnostics, version: published.append(
+        [d['source'] for d in diagnostics if d['source'].startswith(('fast', 'slow'))])
+
+    add_linter('fast', lambda _document: [{'source': 'fast'}])
+    add_linter('slow', lambda document: [{'source': 'slow {}'.format(document.version)}], tier='slow')
+
+    def lint():
+        pyls._lint_progressively(pyls.workspace, pyls.workspace.get_document(doc_uri), is_saved=False)
+
+    lint()
+    pyls.workspace.update_document(doc_uri, {'text': 'import sys\n'}, version=2)
+    lint()
+    # The fast tier doesn't clear the slow diagnostics while the slow tier runs again
+    assert published == [['fast'], ['fast', 'slow 1'], ['fast', 'slow 1'], ['fast', 'slow 2']]
+
+    # Nor are they kept once the document is closed
+    pyls.m_text_document__did_close(textDocument={'uri': doc_uri})
+    pyls.workspace.put_document(doc_uri, 'import re\n', version=3)
+    lint()
+    assert published[4:] == [['fast'], ['fast', 'slow 3']]
@@ -0,0 +1,129 @@
+# Copyright 2017 Palantir Technologies, Inc.
+import sys
+
+import pluggy
+import pytest
+
+from pyls import _plugins, hookspecs, PYLS
+
+PLUGIN = '''
+import math
+
+from pyls import hookimpl
+
+
+@hookimpl
+def pyls_settings():
+    """Disabled by default."""
+    # Not worth importing the plugin for
+    return {'plugins': {'lazy': {'enabled': False}}}
+
+
+@hookimpl(tryfirst=True)
+def pyls_format_document(document, options=None):
+    return [{'newText': document}]
+
+
+def helper():
+    return math.pi
+'''
+
+
+@pytest.fixture
+def plugin_module(tmpdir, monkeypatch):
+    """The name of a plugin module that can be imported, but hasn't been."""
+    tmpdir.join('lazy_plugin.py').write(PLUGIN)
+    monkeypatch.syspath_prepend(str(tmpdir))
+    yield 'lazy_plugin'
+    sys.modules.pop('lazy_plugin', None)
+
+
+@pytest.mark.skipif(_plugins.find_spec is None, reason='Plugins are read with importlib.util')
+def test_lazy_plugin(plugin_module):  # pylint: disable=redefined-outer-name
+    hookimpls = _plugins.read_hookimpls(plugin_module)
+    assert [(name, args, opts) for name, args, opts, _literal in hookimpls] == [
+        ('pyls_settings', [], {}),
+        ('pyls_format_document', ['document'], {'tryfirst': True}),
+    ]
+
+    pm = pluggy.PluginManager(PYLS)
+    pm.add_hookspecs(hookspecs)
+    plugin = _plugins.LazyPlugin(plugin_module, hookimpls)
+    pm.register(plugin, name='lazy')
+
+    # Settings returned as a literal don't need the module
+    assert pm.hook.pyls_settings(config=None) == [{'plugins': {'lazy': {'enabled': False}}}]
+    assert not plugin.loaded and plugin_module not in sys.modules
+
+    assert pm.hook.pyls_format_document(config=None, workspace=None, document='doc') == [{'newText': 'doc'}]
+    assert plugin.loaded and plugin_module in sys.modules
+
+
+@pytest.mark.skipif(_plugins.find_spec is None, reason='Plugins are read with importlib.util')
+@pytest.mark.parametrize('source', [
+    # Hookwrappers are generators
+    'from pyls import hookimpl\n\n@hookimpl(hookwrapper=True)\ndef pyls_lint(document):\n    yield\n',
+    # Hookimpls that aren't defined by the module's source
+    'from other_plugin import pyls_lint\n',
+    'import sys\nfrom pyls import hookimpl\n\nif sys.version_info[0] > 2:\n'
+    '    @hookimpl\n    def pyls_lint(document):\n        pass\n',
+    # Modules needing a package that isn't installed, which would fail to import
+    'import missing_dependency\nfrom pyls import hookimpl\n\n@hookimpl\ndef pyls_settings():\n    return {}\n',
+])
+def test_lazy_plugin_unsupported(tmpdir, monkeypatch, source):
+    tmpdir.join('eager_plugin.py').write(source)
+    monkeypatch.syspath_prepend(str(tmpdir))
+    assert _plugins.read_hookimpls('eager_plugin') is None
+    assert _plugins.read_hookimpls('missing_plugin') is None
+
+
+def test_lazy_plugin_import_error(tmpdir, monkeypatch):
+    tmpdir.join('broken_plugin.py').write('import missing_dependency\n')
+    monkeypatch.syspath_prepend(str(tmpdir))
+    pm = pluggy.PluginManager(PYLS)
+    pm.add_hookspecs(hookspecs)
+    plugin = _plugins.LazyPlugin('broken_plugin', [('pyls_lint', ['document'], {}, _plugins._NOT_LITERAL)],
+                                 on_import_error=lambda: pm.set_blocked('broken'))
+    pm.register(plugin, name='broken')
+
+    # Like plugins failing to import at startup, it does nothing and is blocked
+    assert pm.hook.pyls_lint(config=None, workspace=None, document='doc', is_saved=False) == []
+    assert pm.is_blocked('broken') and not pm.hook.pyls_lint.get_hookimpls()
+    assert plugin.load() is None and not plugin.loaded
+
+
+@pytest.fixture
+def site_packages(tmpdir):
+    """A directory holding a distribution that provides a plugin."""
+    dist_info = tmpdir.mkdir('site-packages').mkdir('pyls_example-1.0.dist-info')
+    dist_info.join('METADATA').write('Metadata-Version: 2.1\nName: pyls-example\nVersion: 1.0\n')
+    dist_info.join('entry_points.txt').write(
+        '[console_scripts]\nexample = pyls_example:main\n\n[pyls]\nexample = pyls_example.plugin\n'
+    )
+    return str(tmpdir.join('site-packages'))
+
+
+def test_find_entry_points(site_packages):  # pylint: disable=redefined-outer-name
+    entry_points, files = _plugins.find_entry_points([site_packages])
+    assert entry_points == [_plugins.EntryPoint('example', 'pyls_example.plugin', None)]
+    assert len(files) == 1 and files[0].endswith('entry_points.txt')
+
+
+def test_cached_entry_points(site_packages, tmpdir, monkeypatch):  # pylint: disable=redefined-outer-name
+    expected = [_plugins.EntryPoint('example', 'pyls_example.plugin', None)]
+    assert _plugins._cached_entry_points([site_packages]) == expected
+
+    # Unless something changed, the distributions aren't looked at again
+    found = []
+    find_entry_points = _plugins.find_entry_points
+    monkeypatch.setattr(_plugins, 'find_entry_points', lambda path: found.append(path) or find_entry_points(path))
+    assert _plugins._cached_entry_points([site_packages]) == expected
+    assert not found
+
+    entry_points_txt = tmpdir.join('site-packages', 'pyls_example-1.0.dist-info', 'entry_points.txt')
+    entry_points_txt.write('[pyls]\nexample = pyls_example.other_plugin:plugin\n')
+    entry_points_txt.setmtime(entry_points_txt.mtime() + 10)
+    assert _plugins._cached_entry_points([site_packages]) == [
+        _plugins.EntryPoint('example', 'pyls_example.other_plugin', 'plugin')
+    ]
+    assert found == [[site_packages]]
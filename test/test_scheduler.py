@@ -0,0 +1,116 @@
+# Copyright 2017 Palantir Technologies, Inc.
+from concurrent.futures import TimeoutError  # pylint: disable=redefined-builtin
+import threading
+
+import pytest
+from pyls_jsonrpc.exceptions import JsonRpcRequestCancelled
+
+from pyls import scheduler, _utils
+
+TIMEOUT = 10
+
+
+@pytest.fixture
+def sched():
+    s = scheduler.Scheduler({priority: 1 for priority in scheduler.DEFAULT_LIMITS})
+    yield s
+    s.shutdown()
+
+
+def _block(sched, priority):  # pylint: disable=redefined-outer-name
+    """Occupy the only slot of a priority class until the returned event is set."""
+    started, release = threading.Event(), threading.Event()
+
+    def wait():
+        started.set()
+        release.wait(TIMEOUT)
+
+    future = sched.submit(priority, wait)
+    assert started.wait(TIMEOUT)
+    return release, future
+
+
+def test_priority_order(sched):  # pylint: disable=redefined-outer-name
+    ran = []
+    release, blocker = _block(sched, scheduler.COMPLETION)
+
+    lint = sched.submit(scheduler.LINT, ran.append, ('lint',))
+    # With nothing more urgent queued, lint runs straight away
+    lint.result(TIMEOUT)
+
+    completion = sched.submit(scheduler.COMPLETION, ran.append, ('completion',))
+    symbols = sched.submit(scheduler.SYMBOLS, ran.append, ('symbols',))
+    # Less urgent work waits while a completion is queued
+    with pytest.raises(TimeoutError):
+        symbols.result(0.2)
+
+    release.set()
+    blocker.result(TIMEOUT)
+    completion.result(TIMEOUT)
+    symbols.result(TIMEOUT)
+    assert ran[0] == 'lint'
+    assert sorted(ran[1:]) == ['completion', 'symbols']
+
+
+def test_shared_limit():
+    s = scheduler.Scheduler()
+    release, blocker = _block(s, scheduler.COMPLETION)
+
+    # Requests using jedi take turns, whatever their class
+    hover = s.submit(scheduler.HOVER, lambda: 'hover')
+    with pytest.raises(TimeoutError):
+        hover.result(0.2)
+    assert s.submit(scheduler.LINT, lambda: 'lint').result(TIMEOUT) == 'lint'
+
+    release.set()
+    blocker.result(TIMEOUT)
+    assert hover.result(TIMEOUT) == 'hover'
+    s.shutdown()
+
+
+def test_coalesce_duplicates(sched):  # pylint: disable=redefined-outer-name
+    calls = []
+    release, blocker = _block(sched, scheduler.SYMBOLS)
+
+    def symbols(doc_uri):
+        calls.append(doc_uri)
+        return doc_uri
+
+    first = sched.submit(scheduler.SYMBOLS, symbols, ('file:///a.py',), key='a')
+    second = sched.submit(scheduler.SYMBOLS, symbols, ('file:///a.py',), key='a')
+    release.set()
+    blocker.result(TIMEOUT)
+
+    assert first.result(TIMEOUT) == second.result(TIMEOUT) == 'file:///a.py'
+    assert calls == ['file:///a.py']
+
+
+def test_supersede_pending(sched):  # pylint: disable=redefined-outer-name
+    release, blocker = _block(sched, scheduler.COMPLETION)
+
+    stale = sched.submit(scheduler.COMPLETION, lambda line: line, (1,), key=1, replaces='completion')
+    fresh = sched.submit(scheduler.COMPLETION, lambda line: line, (2,), key=2, replaces='completion')
+    with pytest.raises(JsonRpcRequestCancelled):
+        stale.result(TIMEOUT)
+
+    release.set()
+    blocker.result(TIMEOUT)
+    assert fresh.result(TIMEOUT) == 2
+
+
+def test_cancel_running_task(sched):  # pylint: disable=redefined-outer-name
+    started, stopped = threading.Event(), threading.Event()
+
+    def work():
+        started.set()
+        while not _utils.current_cancel_token().cancelled:
+            stopped.wait(0.01)
+        stopped.set()
+
+    future = sched.submit(scheduler.NAVIGATION, work)
+    assert started.wait(TIMEOUT)
+    assert not future.cancel()
+
+    with pytest.raises(JsonRpcRequestCancelled):
+        future.result(TIMEOUT)
+    assert stopped.wait(TIMEOUT)
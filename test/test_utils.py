@@ -1,8 +1,13 @@
 # Copyright 2017 Palantir Technologies, Inc.
+import subprocess
+import sys
+import threading
 import time
 
 import mock
+import pytest
 from flaky import flaky
+from pyls_jsonrpc.exceptions import JsonRpcRequestCancelled
 
 from pyls import _utils
 
@@ -92,3 +97,81 @@ def test_clip_column():
     assert _utils.clip_column(2, ['123\n', '123'], 0) == 2
     assert _utils.clip_column(3, ['123\n', '123'], 0) == 3
     assert _utils.clip_column(4, ['123\n', '123'], 1) == 3
+
+
+def test_utf16_column():
+    line = u'a\U0001F40Db = 1\n'
+    assert _utils.utf16_column(line, 1) == 1
+    assert _utils.utf16_column(line, 2) == 3
+    assert _utils.utf16_column(line, 3) == 4
+    assert _utils.utf16_column(line, 100) == 101
+
+    assert _utils.column_from_utf16(line, 1) == 1
+    assert _utils.column_from_utf16(line, 3) == 2
+    assert _utils.column_from_utf16(line, 4) == 3
+    assert _utils.column_from_utf16(line, 101) == 100
+    assert _utils.column_from_utf16(u'abc', 2) == 2
+
+
+def test_cancellation_token():
+    token = _utils.CancellationToken()
+    callback = mock.Mock()
+    token.add_callback(callback)
+
+    with _utils.cancellation_scope(token):
+        _utils.raise_if_cancelled()
+        token.cancel()
+        with pytest.raises(JsonRpcRequestCancelled):
+            _utils.raise_if_cancelled()
+    callback.assert_called_once_with()
+
+    # Outside of the scope there's nothing to cancel
+    _utils.raise_if_cancelled()
+    assert _utils.current_cancel_token() is None
+
+    # Callbacks added after cancellation run straight away
+    late_callback = mock.Mock()
+    token.add_callback(late_callback)
+    late_callback.assert_called_once_with()
+
+
+def test_kill_on_cancel():
+    token = _utils.CancellationToken()
+    p = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(30)'])
+    threading.Timer(0.1, token.cancel).start()
+
+    start = time.time()
+    with pytest.raises(JsonRpcRequestCancelled):
+        with _utils.cancellation_scope(token), _utils.kill_on_cancel(p):
+            p.wait()
+    assert time.time() - start < 10
+    assert p.returncode is not None
+
+
+def test_lru_cache():
+    cache = _utils.LRUCache(2)
+    cache['a'] = 1
+    cache['b'] = 2
+    assert cache.get('a') == 1
+
+    # 'b' is now the least recently used entry
+    cache['c'] = 3
+    assert 'b' not in cache
+    assert cache.get('a') == 1 and cache.get('c') == 3
+    assert cache.get('b', 'missing') == 'missing'
+    assert len(cache) == 2
+
+
+def test_lru_cache_sizeof():
+    cache = _utils.LRUCache(5, sizeof=len)
+    cache['a'] = 'abc'
+    cache['b'] = 'de'
+    assert 'a' in cache and 'b' in cache
+
+    # Entries are forgotten until the new one fits
+    cache['c'] = 'fgh'
+    assert 'a' not in cache
+    assert cache.get('b') == 'de' and cache.get('c') == 'fgh'
+    assert cache.pop('b') == 'de'
+    cache['d'] = 'ij'
+    assert len(cache) == 2
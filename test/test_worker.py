@@ -0,0 +1,94 @@
+# Copyright 2017 Palantir Technologies, Inc.
+import os
+import time
+
+import pytest
+from pyls_jsonrpc.exceptions import JsonRpcRequestCancelled
+
+from pyls import _utils, _worker
+
+HANDLER = __name__ + ':handle'
+
+
+def handle(params):
+    """Serves the requests of the test workers."""
+    if params.get('crash'):
+        os._exit(1)
+    if params.get('fail'):
+        raise ValueError('failed')
+    time.sleep(params.get('sleep', 0))
+    return {'pid': os.getpid(), 'echo': params.get('echo')}
+
+
+@pytest.fixture
+def worker():
+    w = _worker.Worker(HANDLER)
+    yield w
+    w.stop()
+
+
+def test_request(worker):  # pylint: disable=redefined-outer-name
+    first = worker.request({'echo': u'h\xe9llo'})
+    assert first['echo'] == u'h\xe9llo'
+    # The same process serves the next request
+    assert worker.request({'echo': 2}) == {'pid': first['pid'], 'echo': 2}
+
+
+def test_handler_error(worker):  # pylint: disable=redefined-outer-name
+    with pytest.raises(_worker.WorkerError, match='ValueError'):
+        worker.request({'fail': True})
+    assert worker.request({'echo': 1})['echo'] == 1
+
+
+def test_restart_after_crash(worker):  # pylint: disable=redefined-outer-name
+    pid = worker.request({})['pid']
+    with pytest.raises(_worker.WorkerError):
+        worker.request({'crash': True})
+    assert worker.request({})['pid'] != pid
+
+
+def test_timeout(worker):  # pylint: disable=redefined-outer-name
+    pid = worker.request({})['pid']
+    with pytest.raises(_worker.WorkerError, match='timed out'):
+        worker.request({'sleep': 30}, timeout=0.5)
+    # The stuck worker was replaced
+    assert worker.request({})['pid'] != pid
+
+
+def test_cancel_keeps_worker(worker):  # pylint: disable=redefined-outer-name
+    pid = worker.request({})['pid']
+    token = _utils.CancellationToken()
+    token.cancel()
+    with _utils.cancellation_scope(token):
+        with pytest.raises(JsonRpcRequestCancelled):
+            worker.request({'sleep': 0.2})
+    assert worker.request({})['pid'] == pid
+
+
+def test_restart_over_memory_threshold():
+    w = _worker.Worker(HANDLER, max_rss=1)
+    try:
+        assert w.request({})['pid'] != w.request({})['pid']
+    finally:
+        w.stop()
+
+
+def test_frames():
+    class Stream(object):
+        def __init__(self):
+            self.data = b''
+
+        def write(self, data):
+            self.data += data
+
+        def read(self, size):
+            chunk, self.data = self.data[:size], self.data[size:]
+            return chunk
+
+        def flush(self):
+            pass
+
+    stream = Stream()
+    _worker.write_frame(stream, {'id': 1, 'params': [u'\u2603']})
+    assert _worker.read_frame(stream) == {'id': 1, 'params': [u'\u2603']}
+    assert _worker.read_frame(stream) is None
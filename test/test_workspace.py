@@ -4,7 +4,7 @@ import sys
 
 import pytest
 
-from pyls import uris
+from pyls import hookimpl, uris
 
 PY2 = sys.version_info.major == 2
 
@@ -262,3 +262,53 @@ def test_settings_of_added_workspace(pyls, tmpdir):
     workspace1_object = pyls.workspaces[workspace1['uri']]
     workspace1_jedi_settings = workspace1_object._config.plugin_settings('jedi')
     assert workspace1_jedi_settings == server_settings['pyls']['plugins']['jedi']
+
+
+def test_source_roots_follow_watched_files(pyls):
+    project_root = os.path.join(pyls.workspace.root_path, 'project-root')
+    os.mkdir(project_root)
+    test_uri = uris.from_fs_path(os.path.join(project_root, 'hello/test.py'))
+    pyls.workspace.put_document(test_uri, 'assert True')
+    test_doc = pyls.workspace.get_document(test_uri)
+    assert project_root not in test_doc.sys_path()
+
+    setup_py = os.path.join(project_root, 'setup.py')
+    with open(setup_py, 'w+') as f:
+        f.write('# setup.py')
+    # Source roots are cached until the client tells us about the new file
+    assert project_root not in pyls.workspace.source_roots(test_doc.path)
+
+    pyls.m_workspace__did_change_watched_files(changes=[{'uri': uris.from_fs_path(setup_py), 'type': 1}])
+    assert project_root in test_doc.sys_path()
+
+
+def test_jedi_project_shared_between_documents(pyls):
+    uri1 = uris.from_fs_path(os.path.join(pyls.workspace.root_path, 'one.py'))
+    uri2 = uris.from_fs_path(os.path.join(pyls.workspace.root_path, 'two.py'))
+    pyls.workspace.put_document(uri1, 'import os')
+    pyls.workspace.put_document(uri2, 'import sys')
+
+    script1 = pyls.workspace.get_document(uri1).jedi_script()
+    script2 = pyls.workspace.get_document(uri2).jedi_script()
+    assert script1._inference_state.project is script2._inference_state.project
+
+
+def test_workspaces_share_plugins(pyls, tmpdir):
+    calls = []
+
+    class SettingsPlugin(object):
+        @staticmethod
+        @hookimpl
+        def pyls_settings():
+            calls.append(None)
+            return {'plugins': {'shared': {'enabled': False}}}
+
+    pyls.config.plugin_manager.register(SettingsPlugin(), name='shared')
+    added = [{'uri': uris.from_fs_path(str(tmpdir.mkdir(name)))} for name in ('first', 'second')]
+    pyls.m_workspace__did_change_workspace_folders({'added': added})
+
+    # The plugins are loaded once, and only asked for their settings per folder
+    configs = [pyls.workspaces[folder['uri']]._config for folder in added]
+    assert all(c.plugin_manager is pyls.config.plugin_manager for c in configs)
+    assert all(c.plugin_settings('shared') == {'enabled': False} for c in configs)
+    assert len(calls) == len(added)